@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Fused aggregation cube for the service record summaries
+Every per-dimension table in data_analysis.py and generate_pie_insights.py is
+derived by roll-up from a cuboid set: small cubes over subsets of the
+dimensions, one per family of roll-ups (ROLLUP_CUBOIDS), plus a (dimension,
+entity) pair table per dimension whose distinct entities are counted
+(ENTITY_CUBOIDS). Each roll-up reads the smallest cuboid holding its columns,
+so none of them scans a table the size of the frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+from derived_columns import DERIVED_COLUMNS, with_derived_columns
+
+# Dimensions a cuboid can hold. New E ID is one so distinct entity counts can be rolled up too;
+# value columns (gallons, turnaround) are dimensions of the cuboids that histogram them.
+CUBE_DIMENSIONS = [
+    'Area', 'Zone', 'Category', 'Sub Category', 'Service Provider', 'Assigned Vehicle',
+    'Month', 'Week', 'Day_of_Week', 'Trap Type', 'New E ID', 'Entity Mapping.Outlet',
+    'Sum of Gallons Collected', 'Initiation_to_Collection_Days'
+]
+
+# One cuboid per family of roll-ups, holding the dimensions they group and count
+# by; its size depends on the cardinality of those dimensions, not on the rows
+ROLLUP_CUBOIDS = [
+    ('Service Provider', 'Assigned Vehicle', 'Area', 'Zone'),
+    ('Category', 'Sub Category', 'Area', 'Service Provider'),
+    ('Month', 'Day_of_Week', 'Service Provider'),
+    ('Trap Type', 'Category')
+]
+
+# (dimension, entity) pair tables for the distinct entity counts per dimension.
+# Cuboids over New E ID are built as pair tables: their cells only count collections.
+ENTITY_CUBOIDS = [
+    (dim, 'New E ID') for dim in ['Area', 'Zone', 'Category', 'Service Provider', 'Assigned Vehicle', 'Month']
+]
+
+CUBOIDS = ROLLUP_CUBOIDS + ENTITY_CUBOIDS
+
+# Extra dimension of the cuboids of a partitioned cube (see build_partitioned_cube)
+PARTITION_COLUMN = 'partition'
+
+# Additive measures summed on roll-up; min/max/first_row use their own reductions
+SUM_MEASURES = [
+    'collections', 'reports', 'gallons_count', 'gallons_sum', 'gallons_sumsq',
+    'turnaround_count', 'turnaround_sum', 'discharged'
+]
+
+def cube_measures(df, row_offset=0):
+    """Per-row cube measures of a frame holding the Initiation_to_Collection_Days turnaround"""
+    gallons = df['Sum of Gallons Collected']
+    turnaround = df['Initiation_to_Collection_Days']
+    return pd.DataFrame({
+        'collections': np.ones(len(df), dtype=np.int64),
+        'reports': df['Service Report'].notna().to_numpy(),
+        'gallons_count': gallons.notna().to_numpy(),
+        'gallons_sum': gallons,
+        'gallons_sumsq': gallons.astype('Float64') ** 2,
+        'gallons_min': gallons,
+        'gallons_max': gallons,
+        'turnaround_count': turnaround.notna().to_numpy(),
+        'turnaround_sum': turnaround,
+        'discharged': (df['Status'] == 'Discharged').to_numpy(),
+        'first_row': np.arange(row_offset, row_offset + len(df))
+    }, index=df.index)
+
+def build_cuboid(df, dimensions, row_offset=0, measures=None):
+    """Aggregate the frame over the given dimensions
+
+    Each cell holds row and report counts, gallon count/sum/sum of squares/min/max,
+    turnaround count/sum, discharged count and the position of its first row
+    (used to resolve 'first' lookups in the original row order). row_offset is
+    added to those positions when df continues rows already aggregated elsewhere.
+    Derived dimensions and the turnaround are computed if df does not hold them;
+    measures (cube_measures of df) can be passed in when several cuboids share them.
+    """
+    df = with_derived_columns(df, [name for name in [*dimensions, 'Initiation_to_Collection_Days']
+                                   if name in DERIVED_COLUMNS])
+    dimensions = [dim for dim in dimensions if dim in df.columns]
+    measures = measures if measures is not None else cube_measures(df, row_offset)
+    keys = [df[dim] for dim in dimensions]
+    cube = measures.groupby(keys, observed=True, dropna=False, sort=False).agg(cube_reductions())
+    return cube.reset_index()
+
+def build_pair_table(df, dimensions):
+    """Distinct value combinations of the dimensions present in df, with their collection counts"""
+    dimensions = [dim for dim in dimensions if dim in df.columns]
+    counts = df.groupby(dimensions, observed=True, dropna=False, sort=False).size()
+    return counts.rename('collections').reset_index()
+
+def cube_reductions():
+    """Reduction of every cube measure when cells are combined"""
+    reductions = {measure: 'sum' for measure in SUM_MEASURES}
+    reductions.update({'gallons_min': 'min', 'gallons_max': 'max', 'first_row': 'min'})
+    return reductions
+
+def build_aggregation_cube(df, row_offset=0, cuboids=CUBOIDS, measured=()):
+    """Aggregate the frame into a cuboid set: one cube per tuple of dimensions in cuboids
+
+    Derived dimensions and the per-row measures are computed once for all of
+    them; cuboids over New E ID are pair tables (see build_pair_table) unless
+    listed in measured, for per-entity measures.
+    """
+    needed = {name for dims in cuboids for name in dims} | {'Initiation_to_Collection_Days'}
+    df = with_derived_columns(df, [name for name in DERIVED_COLUMNS if name in needed])
+    measures = cube_measures(df, row_offset)
+    measured = {tuple(dims) for dims in measured}
+    return {tuple(dims): build_pair_table(df, dims) if 'New E ID' in dims and tuple(dims) not in measured
+            else build_cuboid(df, dims, measures=measures) for dims in cuboids}
+
+def build_partitioned_cube(df, partitions, cuboids=CUBOIDS, measured=()):
+    """Cuboid set of df with every cuboid also split by the partition number of each row
+
+    partitions holds one number per row (e.g. the period of a batch it falls
+    in). The cube of any partition's rows is then cut out with partition_cube,
+    so disjoint sets of rows share a single aggregation pass over the frame.
+    """
+    df = df.assign(**{PARTITION_COLUMN: partitions})
+    cube = build_aggregation_cube(df, cuboids=[(*dims, PARTITION_COLUMN) for dims in cuboids],
+                                  measured=[(*dims, PARTITION_COLUMN) for dims in measured])
+    return {dims[:-1]: cuboid for dims, cuboid in cube.items()}
+
+def partition_cube(cube, partition):
+    """Cuboid set of the rows of one partition of a partitioned cube
+
+    Every cell of a partitioned cuboid holds a single partition, so the
+    partition's cells, in their order of first appearance, are the cuboids
+    build_aggregation_cube gives for its rows. first_row keeps the positions
+    in the partitioned frame, which order the partition's rows the same way.
+    """
+    return {dims: cuboid[cuboid[PARTITION_COLUMN].to_numpy() == partition].drop(columns=PARTITION_COLUMN)
+            .reset_index(drop=True) for dims, cuboid in cube.items()}
+
+def select_cuboid(cube, columns, measures=False):
+    """The cube itself (a single cube over every dimension), or the smallest cuboid of a cuboid set holding all columns
+
+    With measures=True only cuboids holding every cube measure (not pair tables) qualify.
+    """
+    if isinstance(cube, pd.DataFrame):
+        return cube
+    candidates = [cuboid for dims, cuboid in cube.items() if set(columns) <= set(dims)
+                  and (not measures or 'first_row' in cuboid.columns)]
+    if not candidates:
+        raise KeyError(f"No cuboid holds all of {sorted(columns)}")
+    return min(candidates, key=len)
+
+def merge_cubes(*cubes):
+    """Combine cubes built from disjoint sets of rows into the cube of all of them
+
+    Cells with the same dimension values are reduced together. Categorical
+    dimensions stay categorical (with the union of categories, sorted), so the
+    merged cube rolls up exactly like one built from the combined frame.
+    Cuboid sets are merged cuboid by cuboid.
+    """
+    if isinstance(cubes[0], dict):
+        return {dims: merge_cubes(*(cube[dims] for cube in cubes)) for dims in cubes[0]}
+    dimensions = [dim for dim in CUBE_DIMENSIONS if dim in cubes[0].columns]
+    combined = pd.concat(cubes, ignore_index=True)
+    for dim in dimensions:
+        if any(isinstance(cube[dim].dtype, pd.CategoricalDtype) for cube in cubes):
+            combined[dim] = combined[dim].astype('category')
+
+    reductions = {measure: how for measure, how in cube_reductions().items() if measure in combined.columns}
+    merged = combined.groupby(dimensions, observed=True, dropna=False, sort=False).agg(reductions)
+    return merged.reset_index()
+
+def rollup(cube, by, distinct=(), estimated=None):
+    """Roll the cube up to the given dimension(s)
+
+    Returns the summed measures plus derived gallons_mean, gallons_std (ddof=1)
+    and turnaround_mean, and a 'distinct:<column>' count for every column in
+    distinct. Rows with a missing key are dropped, as in DataFrame.groupby.
+    The measures and each distinct count are read from the smallest cuboid
+    holding their columns. estimated maps distinct columns that are not cube
+    dimensions to their counts per group, e.g. sketch estimates.
+    """
+    estimated = estimated or {}
+    keys = [by] if isinstance(by, str) else list(by) if isinstance(by, list) else []
+    cuboids = cube
+    cube = select_cuboid(cuboids, keys, measures=True)
+    grouped = cube.groupby(by, observed=True, sort=True)
+    table = grouped[SUM_MEASURES].sum()
+    table['gallons_min'] = grouped['gallons_min'].min()
+    table['gallons_max'] = grouped['gallons_max'].max()
+    table['first_row'] = grouped['first_row'].min()
+
+    n = table['gallons_count']
+    total = table['gallons_sum'].astype('float64')
+    squares = table['gallons_sumsq'].astype('float64')
+    table['gallons_mean'] = table['gallons_sum'] / n
+    variance = ((n * squares - total * total) / (n * (n - 1))).where(n > 1)
+    table['gallons_std'] = np.sqrt(variance.clip(lower=0))
+    table['turnaround_mean'] = table['turnaround_sum'] / table['turnaround_count']
+
+    for column in distinct:
+        if column in estimated:
+            table[f'distinct:{column}'] = estimated[column].reindex(table.index).fillna(0).astype(np.int64)
+        else:
+            pairs = select_cuboid(cuboids, keys + [column])
+            table[f'distinct:{column}'] = pairs.groupby(by, observed=True, sort=True)[column].nunique()
+    return table
+
+def grand_rollup(cube):
+    """rollup() of the whole cube into a single row, as a dict keeping each measure's type"""
+    cube = select_cuboid(cube, [], measures=True)
+    table = rollup(cube, np.zeros(len(cube), dtype=np.int64))
+    return {column: table[column].iloc[0] for column in table.columns}
+
+def first_value(cube, by, column):
+    """First non-null value of column per group in original row order (groupby().first())"""
+    cube = select_cuboid(cube, [by, column], measures=True)
+    present = cube[cube[column].notna()].sort_values('first_row', kind='stable')
+    return present.groupby(by, observed=True, sort=True)[column].first()
+
+def mode_value(cube, by, column, default=None):
+    """Most frequent value of column per group, ties broken by sort order (Series.mode().iloc[0])"""
+    cube = select_cuboid(cube, [by, column], measures=True)
+    counts = rollup(cube, [by, column])['collections']
+    modes = counts.loc[counts.groupby(level=0, observed=True).idxmax()]
+    modes = pd.Series(modes.index.get_level_values(1), index=modes.index.get_level_values(0))
+    groups = cube.groupby(by, observed=True, sort=True).size().index
+    return modes.reindex(groups).astype(object).where(lambda s: s.notna(), default)
+
+def cells(cube, columns, where=None):
+    """Cells of the smallest measured cuboid holding columns, restricted to those matching where
+
+    where maps dimensions to the value their rows must hold, e.g. {'Area': area}
+    for the rows of one area.
+    """
+    where = where or {}
+    cuboid = select_cuboid(cube, [*columns, *where], measures=True)
+    if not where:
+        return cuboid
+    mask = np.ones(len(cuboid), dtype=bool)
+    for dim, value in where.items():
+        mask &= (cuboid[dim] == value).to_numpy(dtype=bool, na_value=False)
+    return cuboid[mask]
+
+def group_totals(cube, by, measure, where=None):
+    """Sum of a measure per value of by (sorted, missing values dropped), as groupby(by)[column].sum() on the rows"""
+    return cells(cube, [by], where).groupby(by, observed=True, sort=True)[measure].sum()
+
+def appearance_order(cube, column, dropna=True):
+    """Values of a dimension in order of first appearance in the rows (Series.unique(), missing values left out if dropna)"""
+    cuboid = select_cuboid(cube, [column], measures=True)
+    first_rows = cuboid.groupby(column, observed=True, dropna=dropna, sort=False)['first_row'].min()
+    return first_rows.sort_values(kind='stable').index
+
+def cube_value_counts(cube, column, where=None):
+    """Series.value_counts of a dimension over the rows matching where (see cells)
+
+    Counts are listed in order of first appearance and then sorted as
+    Series.value_counts sorts them, or for a categorical dimension as
+    service_data.value_counts does (stable), so tied counts come out in the
+    same order as from the rows.
+    """
+    table = cells(cube, [column], where).groupby(column, observed=True, sort=False).agg(
+        collections=('collections', 'sum'), first_row=('first_row', 'min')
+    ).sort_values('first_row', kind='stable')
+    index = pd.Index(np.asarray(table.index, dtype=object), name=column)
+    counts = pd.Series(table['collections'].to_numpy(dtype=np.int64), index=index, name='count')
+    if isinstance(table.index.dtype, pd.CategoricalDtype):
+        return counts.iloc[np.argsort(-counts.to_numpy(), kind='stable')]
+    return counts.sort_values(ascending=False, kind='stable')
+
+def cube_histogram(cube, column):
+    """Sorted distinct values of a value dimension (e.g. the gallons) and their row counts, missing values dropped"""
+    counts = select_cuboid(cube, [column], measures=True).groupby(column, sort=True)['collections'].sum()
+    return counts.index.to_numpy(), counts.to_numpy(dtype=np.int64)
+
+def total(cube, measure):
+    """Grand total of an additive measure"""
+    return select_cuboid(cube, [], measures=True)[measure].sum()
+
+def distinct(cube, column):
+    """Number of distinct values of a cube dimension"""
+    return select_cuboid(cube, [column])[column].nunique()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for data_analysis.py and generate_pie_insights.py
+Generates synthetic extracts at the requested scales (see synthetic_data.py) and
+runs every stage of both scripts on each: load, clean, derived columns, each
+analyzer, insights, the reports, Pie patterns, each insight section, budget
+compilation and serialization; with --workers N the sections are also timed
+together on a pool of N processes (section_runner.py). Each stage runs --repeat times (after --warmup
+untimed runs) and its median wall and CPU times are kept, with the memory
+high-water marks, in a JSON lines file, one record per scale, so results of
+different versions can be compared (--compare). Above FULL_LOAD_MAX_ROWS rows
+(or with --chunked) data_analysis.py is benchmarked on its chunked path only,
+as loading the whole extract is not practical there.
+"""
+
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import data_analysis
+import generate_pie_insights
+from data_quality import validate_service_data
+from insights_budget import compile_insights
+from json_output import write_json
+from section_runner import parse_workers, run_sections
+from service_data import CSV_PATH, clean_service_data, read_service_csv
+from stage_trace import peak_rss_mb
+from synthetic_data import write_synthetic_extract
+
+RESULTS_PATH = 'benchmark_results.jsonl'
+
+# Stages this much slower than the baseline are reported as regressions, unless
+# they are less than NOISE_FLOOR_SECONDS slower in absolute terms (timer noise)
+REGRESSION_RATIO = 1.2
+NOISE_FLOOR_SECONDS = 0.05
+
+# Timed runs per stage (the median is kept) and untimed runs before them
+REPEAT = 3
+WARMUP = 0
+
+# Larger extracts are benchmarked on the chunked data_analysis path only
+FULL_LOAD_MAX_ROWS = 5_000_000
+
+def parse_rows(text):
+    """Parse a row count such as 10000, 10k or 50m"""
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    text = text.strip().lower()
+    if text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+def measure(stages, stage, func, *args, rows=None, repeat=1, warmup=0, prepare=None):
+    """Run func(*args) as a named stage and append its timings to stages
+
+    func runs warmup times untimed, then repeat times; the median wall and CPU
+    times are recorded, with the fastest wall time. prepare, if given, returns
+    fresh arguments before each run (untimed), for functions that change them.
+    """
+    walls, cpus = [], []
+    for run in range(warmup + repeat):
+        call_args = prepare() if prepare else args
+        gc.collect()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = func(*call_args)
+        if run >= warmup:
+            walls.append(time.perf_counter() - wall)
+            cpus.append(time.process_time() - cpu)
+    record = {
+        'stage': stage,
+        'wall_s': round(statistics.median(walls), 4),
+        'wall_min_s': round(min(walls), 4),
+        'cpu_s': round(statistics.median(cpus), 4),
+        'runs': repeat,
+        'rows': rows,
+        'peak_rss_mb': peak_rss_mb()
+    }
+    if tracemalloc.is_tracing():
+        record['peak_alloc_mb'] = round(tracemalloc.get_traced_memory()[1] / (1 << 20), 1)
+    stages.append(record)
+    print(f"  {stage}: {record['wall_s']:.3f}s" + (f" (median of {repeat})" if repeat > 1 else ""))
+    return result
+
+def measure_sections(stages, prefix, sections, shared, rows=None, repeat=1, warmup=0, workers=1):
+    """Run run_sections entries one at a time in order, measuring each
+
+    With workers > 1 run_sections is measured on all of them as well, as
+    <prefix>.sections_workers<N>, to compare with the sum of the sections.
+    """
+    results = dict(shared)
+    for name, (func, deps, _) in sections.items():
+        results[name] = measure(stages, f"{prefix}.{name}", func, *[results[dep] for dep in deps], rows=rows,
+                                repeat=repeat, warmup=warmup)
+    if workers > 1:
+        measure(stages, f"{prefix}.sections_workers{workers}", run_sections, sections, shared, workers, rows=rows,
+                repeat=repeat, warmup=warmup)
+    return results
+
+def benchmark_data_analysis(stages, rows, repeat=1, warmup=0, chunked=False, workers=1):
+    """Stages of data_analysis.py on the extract of rows records
+
+    With chunked=True only the chunked aggregation (data_analysis.py --chunked)
+    is measured; the whole extract is never loaded.
+    """
+    timing = dict(repeat=repeat, warmup=warmup)
+    if chunked:
+        measure(stages, 'analysis.chunked', data_analysis.aggregate_chunks, rows=rows, **timing)
+        return
+
+    raw = measure(stages, 'analysis.load', read_service_csv, CSV_PATH, **timing)
+    df = measure(stages, 'analysis.clean', clean_service_data, rows=len(raw), prepare=lambda: (raw.copy(),),
+                 **timing)
+    del raw
+    measure(stages, 'analysis.validate', validate_service_data, df, rows=len(df), **timing)
+
+    shared = {'df': df, 'approximate': None}
+    results = measure_sections(stages, 'analysis', data_analysis.analysis_sections(), shared, rows=len(df),
+                               workers=workers, **timing)
+    all_stats = {name: results[name] for name in
+                 ['summary', 'geographic', 'categories', 'providers', 'volumes', 'temporal', 'efficiency']}
+    all_stats['insights'] = measure(stages, 'analysis.insights', data_analysis.generate_insights_and_recommendations,
+                                    df, all_stats['summary'], **timing)
+
+    def write_markdown():
+        with open('Dubai_Waste_Collection_Analysis.md', 'w', encoding='utf-8') as f:
+            data_analysis.write_markdown_report(f, df, all_stats)
+    measure(stages, 'analysis.markdown', write_markdown, **timing)
+    measure(stages, 'analysis.json', write_json, all_stats, 'data_insights.json', 2, True, **timing)
+    measure(stages, 'analysis.chunked', data_analysis.aggregate_chunks, rows=len(df), **timing)
+
+def benchmark_pie_insights(stages, period_spec=generate_pie_insights.DEFAULT_PERIOD, repeat=1, warmup=0, workers=1):
+    """Stages of generate_pie_insights.py for one period (its rows are read with a chunked scan)"""
+    timing = dict(repeat=repeat, warmup=warmup)
+    period = generate_pie_insights.analysis_period(period_spec)
+    df = measure(stages, 'pie.load', generate_pie_insights.load_period_data, period, False, **timing)
+
+    shared = {'df': df, 'forecast_days': 30, 'period': period, 'reference_date': period['reference_date']}
+    sections = {
+        'cube': (generate_pie_insights.build_pie_cube, ['df'], None),
+        'collections': (generate_pie_insights.collection_state, ['df'], None),
+        'patterns': (generate_pie_insights.calculate_collection_patterns,
+                     ['df', 'reference_date', 'collections', 'cube'], None)
+    }
+    sections.update(generate_pie_insights.insight_sections())
+    results = measure_sections(stages, 'pie', sections, shared, rows=len(df), workers=workers, **timing)
+
+    insights = {"pie_assistant_context": generate_pie_insights.generate_assistant_context(results['cube'], period)}
+    insights.update({name: results[name] for name in generate_pie_insights.insight_sections()})
+    compiled, _ = measure(stages, 'pie.compile', compile_insights, insights, generate_pie_insights.insight_budgets(),
+                          generate_pie_insights.DEFAULT_TOKEN_BUDGET, **timing)
+    measure(stages, 'pie.serialize', write_json, compiled, f"pie_insights_{period['slug']}.json", **timing)
+
+def source_commit():
+    """Short commit hash of the checked-out code, if it is a git work tree"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(rows, seed=0, workdir=None, trace_memory=False, label=None, repeat=REPEAT, warmup=WARMUP,
+                  chunked=None, workers=1):
+    """Benchmark both scripts on a synthetic extract of rows records
+
+    The extract is written to <workdir>/<rows>_<seed>/ and reused if it is
+    already there. chunked defaults to rows > FULL_LOAD_MAX_ROWS. Returns the
+    result record.
+    """
+    if chunked is None:
+        chunked = rows > FULL_LOAD_MAX_ROWS
+    data_dir = os.path.join(workdir, f"{rows}_{seed}")
+    csv_path = os.path.join(data_dir, CSV_PATH)
+    stages = []
+    print(f"\nBenchmarking {rows:,} rows (seed {seed})...")
+    if not os.path.exists(csv_path):
+        measure(stages, 'generate', write_synthetic_extract, csv_path, rows, seed, rows=rows)
+
+    if trace_memory:
+        tracemalloc.start()
+    cwd = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        benchmark_data_analysis(stages, rows, repeat=repeat, warmup=warmup, chunked=chunked, workers=workers)
+        benchmark_pie_insights(stages, repeat=repeat, warmup=warmup, workers=workers)
+    finally:
+        os.chdir(cwd)
+        if trace_memory:
+            tracemalloc.stop()
+
+    timed = [stage for stage in stages if stage['stage'] != 'generate']
+    return {
+        'label': label,
+        'commit': source_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'rows': rows,
+        'seed': seed,
+        'repeat': repeat,
+        'warmup': warmup,
+        'chunked': chunked,
+        'workers': workers,
+        'trace_memory': trace_memory,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'total_wall_s': round(sum(stage['wall_s'] for stage in timed), 4),
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stages
+    }
+
+def load_results(path):
+    """Result records of a JSON lines file"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare_results(baseline, current, threshold=REGRESSION_RATIO, noise_floor=NOISE_FLOOR_SECONDS):
+    """Print the wall time of each stage against the baseline run of the same scale
+
+    The most recent baseline record with the same rows and seed is used.
+    Returns the names of the stages that got slower than threshold times and
+    by at least noise_floor seconds.
+    """
+    matches = [record for record in baseline if record['rows'] == current['rows'] and record['seed'] == current['seed']]
+    if not matches:
+        print(f"No baseline for {current['rows']:,} rows (seed {current['seed']})")
+        return []
+
+    reference = matches[-1]
+    before = {stage['stage']: stage['wall_s'] for stage in reference['stages']}
+    print(f"\n{current['rows']:,} rows against {reference.get('label') or reference.get('commit')} "
+          f"({reference['timestamp']}):")
+    print(f"| Stage | Baseline (s) | Current (s) | Ratio |")
+    print(f"|-------|--------------|-------------|-------|")
+    regressions = []
+    for stage in current['stages']:
+        name = stage['stage']
+        if name not in before or name == 'generate':
+            continue
+        ratio = stage['wall_s'] / before[name] if before[name] > 0 else float('inf')
+        slower = stage['wall_s'] - before[name]
+        flag = ' REGRESSION' if ratio >= threshold and slower >= noise_floor else ''
+        if flag:
+            regressions.append(name)
+        print(f"| {name} | {before[name]:.3f} | {stage['wall_s']:.3f} | {ratio:.2f}x{flag} |")
+    return regressions
+
+def main(scales, seed=0, output=RESULTS_PATH, workdir=None, keep_data=False, trace_memory=False, label=None,
+         compare=None, threshold=REGRESSION_RATIO, noise_floor=NOISE_FLOOR_SECONDS, repeat=REPEAT, warmup=WARMUP,
+         chunked=None, workers=1):
+    """Run the benchmark at every scale and append the results to output
+
+    The synthetic extracts go to a temporary directory, removed afterwards,
+    unless a workdir is given (then they are kept and reused; benchmark_data/ is
+    git-ignored for this) or keep_data is set.
+    Returns the stages that regressed against the compare file, per scale.
+    """
+    output = os.path.abspath(output)
+    baseline = load_results(compare) if compare else None
+    temporary = workdir is None
+    workdir = os.path.abspath(workdir or tempfile.mkdtemp(prefix='pie_benchmark_'))
+
+    regressions = {}
+    try:
+        for rows in scales:
+            record = run_benchmark(rows, seed=seed, workdir=workdir, trace_memory=trace_memory, label=label,
+                                   repeat=repeat, warmup=warmup, chunked=chunked, workers=workers)
+            with open(output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+            print(f"{rows:,} rows: {record['total_wall_s']:.2f}s, peak RSS {record['peak_rss_mb']} MiB")
+            if baseline is not None:
+                regressions[rows] = compare_results(baseline, record, threshold, noise_floor)
+    finally:
+        if temporary and not keep_data:
+            shutil.rmtree(workdir, ignore_errors=True)
+        elif temporary:
+            print(f"Synthetic extracts kept in {workdir}")
+
+    print(f"\nResults appended to {output}")
+    return regressions
+
+if __name__ == "__main__":
+    scales = [parse_rows(rows) for rows in sys.argv[sys.argv.index("--rows") + 1].split(",")] \
+        if "--rows" in sys.argv else [10_000]
+    regressions = main(
+        scales,
+        seed=int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else 0,
+        output=sys.argv[sys.argv.index("--output") + 1] if "--output" in sys.argv else RESULTS_PATH,
+        workdir=sys.argv[sys.argv.index("--workdir") + 1] if "--workdir" in sys.argv else None,
+        keep_data="--keep-data" in sys.argv,
+        trace_memory="--trace-memory" in sys.argv,
+        label=sys.argv[sys.argv.index("--label") + 1] if "--label" in sys.argv else None,
+        compare=sys.argv[sys.argv.index("--compare") + 1] if "--compare" in sys.argv else None,
+        threshold=float(sys.argv[sys.argv.index("--threshold") + 1]) if "--threshold" in sys.argv else REGRESSION_RATIO,
+        noise_floor=float(sys.argv[sys.argv.index("--noise-floor") + 1]) if "--noise-floor" in sys.argv
+        else NOISE_FLOOR_SECONDS,
+        repeat=int(sys.argv[sys.argv.index("--repeat") + 1]) if "--repeat" in sys.argv else REPEAT,
+        warmup=int(sys.argv[sys.argv.index("--warmup") + 1]) if "--warmup" in sys.argv else WARMUP,
+        chunked=True if "--chunked" in sys.argv else None,
+        workers=parse_workers(sys.argv)
+    )
+    if any(regressions.values()):
+        sys.exit(1)
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Bulk loader of the cleaned service frame into the database/schema.sql tables
+Maps the frame from load_and_clean_data onto the services columns (as
+migrate-data.js does row by row), dedups the service_providers and vehicles
+dimensions, and loads in large batches with an upsert on service_report:
+into PostgreSQL through COPY, into a local SQLite stand-in, or as COPY files
+plus a psql script. Rows are split into partitions by a hash of
+service_report, which load in parallel with --workers N.
+"""
+
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_analysis import load_and_clean_data
+from data_quality import REQUIRED_COLUMNS as EXTRACT_REQUIRED_COLUMNS
+from section_runner import parse_workers, run_sections
+
+# services column -> (extract column, VARCHAR length or None)
+SERVICE_COLUMNS = {
+    'service_report': ('Service Report', 50),
+    'entity_id': ('New E ID', 20),
+    'service_provider': ('Service Provider', 100),
+    'collected_date': ('Collected Date', None),
+    'discharged_date': ('Discharged Date', None),
+    'initiated_date': ('Initiated Date', None),
+    'area': ('Area', 50),
+    'assigned_vehicle': ('Assigned Vehicle', None),
+    'category': ('Category', 50),
+    'discharge_txn': ('Discharge TXN', 50),
+    'outlet_name': ('Entity Mapping.Outlet', 200),
+    'gallons_collected': ('Sum of Gallons Collected', None),
+    'initiator': ('Initiator', 50),
+    'trap_count': ('Sum of No of Traps', None),
+    'status': ('Status', 20),
+    'sub_area': ('Sub Area', 50),
+    'sub_category': ('Sub Category', 50),
+    'trade_license_number': ('Trade License Number', None),
+    'trap_label': ('Trap Label', 50),
+    'trap_type': ('Trap Type', 10),
+    'zone': ('Zone', 50)
+}
+
+# NOT NULL columns of services; rows missing one of them are not loaded. A
+# missing vehicle never drops a row: it is loaded as vehicle 0 (see vehicle_numbers)
+REQUIRED_COLUMNS = [column for column, (source, _) in SERVICE_COLUMNS.items() if source in EXTRACT_REQUIRED_COLUMNS]
+
+# Rows per COPY batch or executemany call
+LOAD_BATCH_ROWS = 100_000
+
+# Stand-in for the three tables in SQLite (no UUIDs, extensions or views)
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS service_providers (
+  id INTEGER PRIMARY KEY,
+  name VARCHAR(100) UNIQUE NOT NULL,
+  contact_person VARCHAR(100),
+  phone VARCHAR(20),
+  email VARCHAR(100),
+  license_number VARCHAR(50),
+  active BOOLEAN DEFAULT 1,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS vehicles (
+  id INTEGER PRIMARY KEY,
+  vehicle_number INTEGER UNIQUE NOT NULL,
+  license_plate VARCHAR(20),
+  type VARCHAR(50) DEFAULT 'Grease Truck',
+  capacity INTEGER,
+  service_provider_id INTEGER REFERENCES service_providers(id),
+  status VARCHAR(20) DEFAULT 'active',
+  last_maintenance DATE,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS services (
+  id INTEGER PRIMARY KEY,
+  service_report VARCHAR(50) UNIQUE NOT NULL,
+  entity_id VARCHAR(20) NOT NULL,
+  service_provider VARCHAR(100) NOT NULL,
+  collected_date DATE NOT NULL,
+  discharged_date DATE NOT NULL,
+  initiated_date DATE NOT NULL,
+  area VARCHAR(50) NOT NULL,
+  assigned_vehicle INTEGER NOT NULL,
+  category VARCHAR(50) NOT NULL,
+  discharge_txn VARCHAR(50) NOT NULL,
+  outlet_name VARCHAR(200) NOT NULL,
+  gallons_collected INTEGER NOT NULL CHECK (gallons_collected > 0),
+  initiator VARCHAR(50) NOT NULL,
+  trap_count INTEGER DEFAULT 1,
+  status VARCHAR(20) DEFAULT 'Discharged',
+  sub_area VARCHAR(50),
+  sub_category VARCHAR(50),
+  trade_license_number INTEGER,
+  trap_label VARCHAR(50),
+  trap_type VARCHAR(10),
+  zone VARCHAR(50) NOT NULL,
+  latitude DECIMAL(10, 8),
+  longitude DECIMAL(11, 8),
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+def postgres_driver():
+    """The installed PostgreSQL driver module (psycopg 3 or psycopg2), or None"""
+    for name in ('psycopg', 'psycopg2'):
+        try:
+            return __import__(name)
+        except ImportError:
+            continue
+    return None
+
+def vehicle_numbers(vehicles):
+    """Numeric part of vehicle strings like "B 37216", 0 if there is none (as migrate-data.js)"""
+    digits = vehicles.astype('string').str.extract(r'(\d+)', expand=False)
+    return pd.to_numeric(digits, errors='coerce').fillna(0).astype('int64')
+
+def services_frame(df):
+    """Map the cleaned frame onto the services columns
+
+    Text is cut to its VARCHAR length, vehicles to their number and a missing
+    trap count defaults to 1. Rows that would violate a NOT NULL or the
+    gallons_collected > 0 check are dropped, and of repeated Service Reports
+    the last row is kept (as the upsert would). Returns the frame and the
+    number of rows dropped per reason.
+    """
+    services = pd.DataFrame(index=df.index)
+    for column, (source, length) in SERVICE_COLUMNS.items():
+        values = df[source]
+        if length is not None:
+            values = values.astype('string').str.slice(0, length)
+        services[column] = values
+    services['assigned_vehicle'] = vehicle_numbers(df['Assigned Vehicle'])
+    services['trap_count'] = services['trap_count'].astype('Int64').fillna(1)
+
+    dropped = {}
+    missing = services[REQUIRED_COLUMNS].isna()
+    for column in REQUIRED_COLUMNS:
+        dropped[f"{column} missing"] = int(missing[column].sum())
+    invalid_gallons = services['gallons_collected'].notna() & (services['gallons_collected'] <= 0)
+    dropped['gallons_collected <= 0'] = int(invalid_gallons.sum())
+    services = services[~(missing.any(axis=1) | invalid_gallons).to_numpy()]
+
+    duplicated = services['service_report'].duplicated(keep='last')
+    dropped['service_report repeated'] = int(duplicated.sum())
+    services = services[~duplicated.to_numpy()].reset_index(drop=True)
+    return services, {reason: count for reason, count in dropped.items() if count}
+
+def dimension_frames(df):
+    """Distinct service providers, and vehicles with the provider that ran most of their collections
+
+    Vehicles are keyed by number (the vehicles.vehicle_number constraint); of
+    plates sharing a number the most used one is kept.
+    """
+    providers = pd.DataFrame({'name': pd.unique(df['Service Provider'].dropna().astype(str).str.slice(0, 100))})
+    usage = pd.DataFrame({
+        'vehicle_number': vehicle_numbers(df['Assigned Vehicle']),
+        'license_plate': df['Assigned Vehicle'].astype('string').str.slice(0, 20),
+        'provider': df['Service Provider'].astype('string').str.slice(0, 100)
+    }).dropna(subset=['license_plate'])
+    counts = usage.groupby(['vehicle_number', 'license_plate', 'provider'], dropna=False, sort=True).size().rename('n').reset_index()
+    counts = counts.sort_values(['vehicle_number', 'n'], ascending=[True, False], kind='stable')
+    vehicles = counts.drop_duplicates('vehicle_number')[['vehicle_number', 'license_plate', 'provider']]
+    return providers, vehicles.reset_index(drop=True)
+
+def partition_frame(services, partitions):
+    """Split rows by a hash of service_report, so each report lands in exactly one partition"""
+    keys = pd.util.hash_array(services['service_report'].to_numpy(dtype=object)) % np.uint64(partitions)
+    return [services[keys == k].reset_index(drop=True) for k in range(partitions)]
+
+# Characters escaped in COPY text fields
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+def python_values(values):
+    """Column values as an object array of Python values, None for null; dates as ISO dates"""
+    missing = values.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(values):
+        result = values.to_numpy().astype('datetime64[D]').astype(str).astype(object)
+    elif pd.api.types.is_integer_dtype(values):
+        result = values.to_numpy(dtype=np.int64, na_value=0).astype(object)
+    else:
+        result = values.to_numpy(dtype=object)
+    result[missing] = None
+    return result
+
+def copy_values(values):
+    """Column values as an object array of COPY text fields, \\N for null"""
+    if pd.api.types.is_string_dtype(values) or pd.api.types.is_object_dtype(values):
+        text = values.astype('string')
+        if text.str.contains('[\\\\\t\n\r]', regex=True).any():
+            text = text.map(lambda value: value.translate(COPY_ESCAPES), na_action='ignore')
+        return text.to_numpy(dtype=object, na_value='\\N')
+
+    # Dates, integers and categoricals repeat a lot: format each distinct value once
+    codes, uniques = pd.factorize(values)
+    if pd.api.types.is_datetime64_any_dtype(uniques):
+        text = np.asarray(uniques, dtype='datetime64[D]').astype(str).astype(object)
+    else:
+        text = np.array([str(value).translate(COPY_ESCAPES) for value in uniques], dtype=object)
+    return np.append(text, '\\N')[codes]
+
+def copy_text(frame):
+    """Rows of a frame in the PostgreSQL COPY text format (tab separated, \\N for null)"""
+    if len(frame) == 0:
+        return ''
+    columns = [copy_values(frame[column]) for column in frame.columns]
+    return '\n'.join(map('\t'.join, zip(*columns))) + '\n'
+
+def row_tuples(frame):
+    """Rows of a frame as tuples of Python values with None for null (for executemany)"""
+    return list(zip(*(python_values(frame[column]) for column in frame.columns)))
+
+def batches(frame, rows=LOAD_BATCH_ROWS):
+    """Consecutive slices of at most rows rows"""
+    for start in range(0, len(frame), rows):
+        yield frame.iloc[start:start + rows]
+
+def upsert_services_sql(source):
+    """Statement moving the staged rows of source into services, updating existing reports"""
+    columns = ', '.join(SERVICE_COLUMNS)
+    updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in SERVICE_COLUMNS if column != 'service_report')
+    return (f"INSERT INTO services ({columns}) SELECT {columns} FROM {source} WHERE true "
+            f"ON CONFLICT (service_report) DO UPDATE SET {updates}, updated_at = NOW()")
+
+# Dimension upserts from staging tables; vehicles resolve their provider's id by name
+UPSERT_PROVIDERS_SQL = ("INSERT INTO service_providers (name) SELECT name FROM staging_providers WHERE true "
+                        "ON CONFLICT (name) DO NOTHING")
+UPSERT_VEHICLES_SQL = (
+    "INSERT INTO vehicles (vehicle_number, license_plate, service_provider_id) "
+    "SELECT v.vehicle_number, v.license_plate, p.id FROM staging_vehicles v "
+    "LEFT JOIN service_providers p ON p.name = v.provider WHERE true "
+    "ON CONFLICT (vehicle_number) DO UPDATE SET license_plate = EXCLUDED.license_plate, "
+    "service_provider_id = EXCLUDED.service_provider_id"
+)
+
+def copy_rows(cursor, table, frame):
+    """COPY a frame into a table in batches, with either PostgreSQL driver"""
+    statement = f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN"
+    if hasattr(cursor, 'copy'):
+        with cursor.copy(statement) as copy:
+            for batch in batches(frame):
+                copy.write(copy_text(batch))
+    else:
+        for batch in batches(frame):
+            cursor.copy_expert(statement, io.StringIO(copy_text(batch)))
+
+def load_postgres_dimensions(dsn, providers, vehicles):
+    """Upsert the dimension tables through staging tables"""
+    connection = postgres_driver().connect(dsn)
+    try:
+        cursor = connection.cursor()
+        cursor.execute("CREATE TEMP TABLE staging_providers (name VARCHAR(100))")
+        cursor.execute("CREATE TEMP TABLE staging_vehicles "
+                       "(vehicle_number INTEGER, license_plate VARCHAR(20), provider VARCHAR(100))")
+        copy_rows(cursor, 'staging_providers', providers)
+        copy_rows(cursor, 'staging_vehicles', vehicles)
+        cursor.execute(UPSERT_PROVIDERS_SQL)
+        cursor.execute(UPSERT_VEHICLES_SQL)
+        connection.commit()
+    finally:
+        connection.close()
+
+def load_postgres_partition(dsn, services):
+    """COPY one partition into a staging table and upsert it into services, in one transaction"""
+    connection = postgres_driver().connect(dsn)
+    try:
+        cursor = connection.cursor()
+        cursor.execute("CREATE TEMP TABLE staging_services (LIKE services INCLUDING DEFAULTS)")
+        copy_rows(cursor, 'staging_services', services)
+        cursor.execute(upsert_services_sql('staging_services'))
+        connection.commit()
+    finally:
+        connection.close()
+    return len(services)
+
+def load_sqlite(path, services, providers, vehicles):
+    """Upsert everything into a SQLite stand-in database, creating its tables if needed
+
+    SQLite takes one writer at a time, so partitions are not used here.
+    """
+    import sqlite3
+
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(SQLITE_SCHEMA)
+        with connection:
+            connection.execute("CREATE TEMP TABLE staging_providers (name VARCHAR(100))")
+            connection.execute("CREATE TEMP TABLE staging_vehicles "
+                               "(vehicle_number INTEGER, license_plate VARCHAR(20), provider VARCHAR(100))")
+            connection.executemany("INSERT INTO staging_providers VALUES (?)", row_tuples(providers))
+            connection.executemany("INSERT INTO staging_vehicles VALUES (?, ?, ?)", row_tuples(vehicles))
+            connection.execute(UPSERT_PROVIDERS_SQL)
+            connection.execute(UPSERT_VEHICLES_SQL)
+
+        columns = ', '.join(SERVICE_COLUMNS)
+        placeholders = ', '.join('?' for _ in SERVICE_COLUMNS)
+        updates = ', '.join(f"{column} = excluded.{column}" for column in SERVICE_COLUMNS if column != 'service_report')
+        statement = (f"INSERT INTO services ({columns}) VALUES ({placeholders}) "
+                     f"ON CONFLICT (service_report) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP")
+        with connection:
+            for batch in batches(services):
+                connection.executemany(statement, row_tuples(batch))
+    finally:
+        connection.close()
+    return len(services)
+
+def write_copy_partition(path, services):
+    """Write one partition as a COPY text file"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for batch in batches(services):
+            f.write(copy_text(batch))
+    return len(services)
+
+def write_copy_files(directory, partitions, providers, vehicles, workers=1):
+    """Write COPY text files and a load.sql that upserts them with psql
+
+    Run it from the directory with psql -f load.sql; everything is loaded in
+    one transaction.
+    """
+    os.makedirs(directory, exist_ok=True)
+    write_copy_partition(os.path.join(directory, 'service_providers.copy'), providers)
+    write_copy_partition(os.path.join(directory, 'vehicles.copy'), vehicles)
+
+    files = [f"services_{k}.copy" for k in range(len(partitions))]
+    sections = {
+        name: (write_copy_partition, [f"path:{name}", f"rows:{name}"], f"Writing {name}...")
+        for name in files
+    }
+    shared = {}
+    for name, part in zip(files, partitions):
+        shared[f"path:{name}"] = os.path.join(directory, name)
+        shared[f"rows:{name}"] = part
+    run_sections(sections, shared, workers=workers)
+
+    columns = ', '.join(SERVICE_COLUMNS)
+    script = [
+        "BEGIN;",
+        "CREATE TEMP TABLE staging_providers (name VARCHAR(100)) ON COMMIT DROP;",
+        "CREATE TEMP TABLE staging_vehicles (vehicle_number INTEGER, license_plate VARCHAR(20), "
+        "provider VARCHAR(100)) ON COMMIT DROP;",
+        "CREATE TEMP TABLE staging_services (LIKE services INCLUDING DEFAULTS) ON COMMIT DROP;",
+        "\\copy staging_providers (name) FROM 'service_providers.copy'",
+        "\\copy staging_vehicles (vehicle_number, license_plate, provider) FROM 'vehicles.copy'",
+        *[f"\\copy staging_services ({columns}) FROM '{name}'" for name in files],
+        UPSERT_PROVIDERS_SQL + ";",
+        UPSERT_VEHICLES_SQL + ";",
+        upsert_services_sql('staging_services') + ";",
+        "COMMIT;"
+    ]
+    with open(os.path.join(directory, 'load.sql'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(script) + '\n')
+
+def main(copy_dir=None, sqlite_path=None, postgres_dsn=None, partitions=4, workers=1, q1_2023_only=False,
+         use_cache=True, strict_schema=False):
+    """Load the cleaned extract into each requested target"""
+    df = load_and_clean_data(filter_q1_2023=q1_2023_only, use_cache=use_cache, strict_schema=strict_schema)
+    services, dropped = services_frame(df)
+    providers, vehicles = dimension_frames(df)
+    print(f"Prepared {len(services):,} services, {len(providers):,} providers and {len(vehicles):,} vehicles")
+    for reason, count in dropped.items():
+        print(f"[WARNING] Skipped {count:,} rows: {reason}")
+
+    partitioned = partition_frame(services, partitions)
+    if copy_dir:
+        print(f"Writing COPY files to {copy_dir}...")
+        write_copy_files(copy_dir, partitioned, providers, vehicles, workers=workers)
+        print(f"Load them with: cd {copy_dir} && psql -f load.sql")
+
+    if sqlite_path:
+        print(f"Loading SQLite database {sqlite_path}...")
+        load_sqlite(sqlite_path, services, providers, vehicles)
+
+    if postgres_dsn:
+        if postgres_driver() is None:
+            raise RuntimeError("Loading PostgreSQL needs psycopg or psycopg2 installed")
+        print("Loading PostgreSQL dimensions...")
+        load_postgres_dimensions(postgres_dsn, providers, vehicles)
+        sections = {
+            f"partition_{k}": (load_postgres_partition, ['dsn', f"rows:{k}"], f"Loading partition {k}...")
+            for k in range(partitions)
+        }
+        shared = {'dsn': postgres_dsn, **{f"rows:{k}": part for k, part in enumerate(partitioned)}}
+        run_sections(sections, shared, workers=workers)
+
+    print(f"Loaded {len(services):,} service records")
+    return len(services)
+
+if __name__ == "__main__":
+    import sys
+    def option(flag):
+        return sys.argv[sys.argv.index(flag) + 1] if flag in sys.argv else None
+    targets = dict(copy_dir=option("--copy-dir"), sqlite_path=option("--sqlite"), postgres_dsn=option("--postgres"))
+    if not any(targets.values()):
+        sys.exit("Give at least one of --copy-dir DIR, --sqlite FILE or --postgres DSN")
+    main(
+        partitions=int(option("--partitions") or 4),
+        workers=parse_workers(sys.argv),
+        q1_2023_only="--q1-2023" in sys.argv,
+        use_cache="--no-cache" not in sys.argv,
+        strict_schema="--strict-schema" in sys.argv,
+        **targets
+    )
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Mergeable column profile of the service records
+Holds what data_analysis.py needs beyond the aggregation cube (value histograms
+for medians, quantiles and common sizes, hourly sums, the Collected Date range,
+hashed Service Report ids) in a form that can be built per batch of rows and combined.
+In approximate mode the parts that grow with the data are replaced by sketches
+(see stat_sketches.py), so the profile stays bounded in size.
+"""
+
+import numpy as np
+import pandas as pd
+
+from derived_columns import DERIVED_COLUMNS, with_derived_columns
+from stat_sketches import (bucket_values, distinct_hashes, hll_estimate, hll_group_registers, hll_precision,
+                           hll_registers, merge_group_registers, prune_frequent)
+
+# Bins of the volume distribution: [low, high) gallons and label
+VOLUME_RANGES = [
+    (0, 10, '0-10'),
+    (11, 25, '11-25'),
+    (26, 50, '26-50'),
+    (51, 100, '51-100'),
+    (101, 200, '101-200'),
+    (201, 500, '201-500'),
+    (501, float('inf'), '500+')
+]
+
+# Default error bounds of the approximate mode: relative error of quantiles,
+# standard error of distinct counts, and how many distinct gallon values are
+# counted for the most common volumes
+QUANTILE_RELATIVE_ERROR = 0.01
+DISTINCT_RELATIVE_ERROR = 0.02
+FREQUENT_VALUES_CAPACITY = 1000
+
+# Dimensions whose distinct entity counts are sketched in approximate mode
+ENTITY_SKETCH_DIMENSIONS = ['Area', 'Zone', 'Category', 'Service Provider', 'Month', 'Assigned Vehicle']
+
+def approximate_settings(quantile_error=QUANTILE_RELATIVE_ERROR, distinct_error=DISTINCT_RELATIVE_ERROR,
+                         frequent_capacity=FREQUENT_VALUES_CAPACITY):
+    """Error bounds of the approximate statistics mode"""
+    return {
+        'quantile_error': quantile_error,
+        'distinct_error': distinct_error,
+        'hll_precision': hll_precision(distinct_error),
+        'frequent_capacity': frequent_capacity
+    }
+
+def build_column_profile(df, approximate=None, row_offset=0):
+    """Profile a frame of cleaned service records
+
+    approximate is None for exact statistics or approximate_settings() for the
+    sketched ones. row_offset is the position of df's first row in the whole
+    extract, so first-appearance order survives merging. The derived columns
+    read are computed if df does not hold them.
+    """
+    sketched = [dim for dim in ENTITY_SKETCH_DIMENSIONS if dim in DERIVED_COLUMNS] if approximate else []
+    df = with_derived_columns(df, ['Initiation_to_Collection_Days', 'Hour', *sketched])
+    gallons = df['Sum of Gallons Collected']
+    present = gallons.notna().to_numpy()
+    positions = np.arange(row_offset, row_offset + len(df))
+    values = gallons[present].to_numpy()
+    wide_values = values.astype(np.int64) if values.dtype.kind in 'iu' else values
+
+    # Gallon values per category, with the first row each value was seen in
+    volumes = pd.DataFrame({
+        'Category': df['Category'].to_numpy()[present],
+        'value': bucket_values(values, approximate['quantile_error']) if approximate else values,
+        'first_row': positions[present]
+    })
+    volumes = volumes.groupby(['Category', 'value'], dropna=False, sort=False).agg(
+        count=('first_row', 'size'), first_row=('first_row', 'min')
+    ).reset_index()
+
+    # Row and gallon totals per bin of the volume distribution
+    volume_ranges = pd.DataFrame([
+        {'count': np.int64(mask.sum()), 'gallons': wide_values[mask].sum()}
+        for mask in ((values >= low) & (values < high) for low, high, _ in VOLUME_RANGES)
+    ], index=[label for _, _, label in VOLUME_RANGES])
+
+    # Turnaround is a whole number of days, so its histogram stays small and exact
+    turnaround = df['Initiation_to_Collection_Days'].dropna()
+    turnaround = turnaround.value_counts(sort=False).rename_axis('value').reset_index(name='count')
+
+    hourly = pd.DataFrame({
+        'Hour': df['Hour'],
+        'reports': df['Service Report'].notna().to_numpy(),
+        'gallons_sum': gallons.astype('Int64'),
+        'gallons_count': present
+    }).groupby('Hour', sort=False).sum().reset_index()
+
+    traps = df['Sum of No of Traps']
+    collected = df['Collected Date']
+    profile = {
+        'approximate': approximate,
+        'rows': len(df),
+        'collected_min': collected.min(),
+        'collected_max': collected.max(),
+        'volumes': volumes,
+        'volume_ranges': volume_ranges,
+        'turnaround': turnaround,
+        'hourly': hourly,
+        'traps_sum': traps.sum(),
+        'traps_count': int(traps.notna().sum())
+    }
+
+    if not approximate:
+        profile['report_hashes'] = distinct_hashes(df['Service Report'])
+        return profile
+
+    precision = approximate['hll_precision']
+    frequent = pd.DataFrame({'value': values, 'first_row': positions[present]}).groupby('value', sort=False).agg(
+        count=('first_row', 'size'), first_row=('first_row', 'min')
+    ).reset_index()
+    profile['frequent_volumes'] = prune_frequent(frequent, approximate['frequent_capacity'])
+    profile['report_sketch'] = hll_registers(df['Service Report'], precision)
+    profile['entity_sketch'] = hll_registers(df['New E ID'], precision)
+    profile['entity_sketches'] = {
+        dim: hll_group_registers(df[dim], df['New E ID'], precision)
+        for dim in ENTITY_SKETCH_DIMENSIONS if dim in df.columns
+    }
+    return profile
+
+def merge_column_profiles(*profiles):
+    """Combine profiles of disjoint sets of rows into the profile of all of them
+
+    The profiles must have been built with the same approximate settings.
+    """
+    volumes = pd.concat([p['volumes'] for p in profiles], ignore_index=True)
+    volumes = volumes.groupby(['Category', 'value'], dropna=False, sort=False).agg(
+        count=('count', 'sum'), first_row=('first_row', 'min')
+    ).reset_index()
+
+    turnaround = pd.concat([p['turnaround'] for p in profiles], ignore_index=True)
+    turnaround = turnaround.groupby('value', sort=False)['count'].sum().reset_index()
+
+    hourly = pd.concat([p['hourly'] for p in profiles], ignore_index=True)
+    hourly = hourly.groupby('Hour', sort=False).sum().reset_index()
+
+    approximate = profiles[0]['approximate']
+    merged = {
+        'approximate': approximate,
+        'rows': sum(p['rows'] for p in profiles),
+        'collected_min': min((p['collected_min'] for p in profiles if pd.notna(p['collected_min'])), default=pd.NaT),
+        'collected_max': max((p['collected_max'] for p in profiles if pd.notna(p['collected_max'])), default=pd.NaT),
+        'volumes': volumes,
+        'volume_ranges': pd.concat([p['volume_ranges'] for p in profiles]).groupby(level=0, sort=False).sum(),
+        'turnaround': turnaround,
+        'hourly': hourly,
+        'traps_sum': sum(p['traps_sum'] for p in profiles),
+        'traps_count': sum(p['traps_count'] for p in profiles)
+    }
+
+    if not approximate:
+        merged['report_hashes'] = np.unique(np.concatenate([p['report_hashes'] for p in profiles]))
+        return merged
+
+    frequent = pd.concat([p['frequent_volumes'] for p in profiles], ignore_index=True)
+    frequent = frequent.groupby('value', sort=False).agg(
+        count=('count', 'sum'), first_row=('first_row', 'min')
+    ).reset_index()
+    merged['frequent_volumes'] = prune_frequent(frequent, approximate['frequent_capacity'])
+    merged['report_sketch'] = np.maximum.reduce([p['report_sketch'] for p in profiles])
+    merged['entity_sketch'] = np.maximum.reduce([p['entity_sketch'] for p in profiles])
+    merged['entity_sketches'] = {
+        dim: merge_group_registers(*(p['entity_sketches'][dim] for p in profiles))
+        for dim in profiles[0]['entity_sketches']
+    }
+    return merged
+
+def histogram(table, by=None):
+    """Collapse a value/count table to sorted values and counts, optionally per group"""
+    if by is None:
+        counts = table.groupby('value', sort=True)['count'].sum()
+        return counts.index.to_numpy(), counts.to_numpy()
+    counts = table.groupby([by, 'value'], observed=True, sort=True)['count'].sum()
+    return {
+        key: (group.index.get_level_values('value').to_numpy(), group.to_numpy())
+        for key, group in counts.groupby(level=0, observed=True, sort=True)
+    }
+
+def _order_statistic(counts, k):
+    """Index of the k-th smallest value (0-based) in a sorted histogram"""
+    return np.searchsorted(np.cumsum(counts), k, side='right')
+
+def histogram_median(values, counts):
+    """Median of a sorted histogram, as np.median computes it from the raw values"""
+    n = counts.sum()
+    if n == 0:
+        return np.nan
+    middle = [values[_order_statistic(counts, (n - 1) // 2)], values[_order_statistic(counts, n // 2)]]
+    return np.mean(np.asarray(middle, dtype=float))
+
+def histogram_quantile(values, counts, q):
+    """Quantile with linear interpolation, as Series.quantile computes it from the raw values"""
+    n = counts.sum()
+    if n == 0:
+        return np.nan
+    position = q * (n - 1)
+    below = int(np.floor(position))
+    above = min(below + 1, n - 1)
+    neighbours = np.array([values[_order_statistic(counts, below)], values[_order_statistic(counts, above)]], dtype=float)
+    return np.quantile(neighbours, position - below)
+
+def histogram_std(values, counts):
+    """Sample standard deviation (ddof=1) of a histogram"""
+    n = counts.sum()
+    if n < 2:
+        return np.nan
+    values = values.astype(float)
+    mean = (values * counts).sum() / n
+    return np.sqrt((counts * (values - mean) ** 2).sum() / (n - 1))
+
+def histogram_describe(values, counts):
+    """count/mean/std/min/50%/max of a histogram, as Series.describe reports them"""
+    n = counts.sum()
+    if n == 0:
+        return {'count': 0, 'mean': np.nan, 'std': np.nan, 'min': np.nan, '50%': np.nan, 'max': np.nan}
+    return {
+        'count': n,
+        'mean': (values * counts).sum() / n,
+        'std': histogram_std(values, counts),
+        'min': np.float64(values[0]),
+        '50%': histogram_median(values, counts),
+        'max': np.float64(values[-1])
+    }
+
+def volume_counts(profile):
+    """Gallon value counts over all categories, ordered as Series.value_counts orders them
+
+    In approximate mode only the frequent values are counted, and their counts
+    may be low by up to rows / (frequent_capacity + 1).
+    """
+    if profile['approximate']:
+        table = profile['frequent_volumes'].set_index('value')
+    else:
+        table = profile['volumes'].groupby('value', sort=False).agg(
+            count=('count', 'sum'), first_row=('first_row', 'min')
+        )
+    table = table.sort_values('first_row', kind='stable')
+    counts = pd.Series(table['count'].to_numpy(), index=table.index, name='count')
+    return counts.sort_values(ascending=False)
+
+def category_medians(profile):
+    """Median gallons per category"""
+    return pd.Series({
+        category: histogram_median(values, counts)
+        for category, (values, counts) in histogram(profile['volumes'], by='Category').items()
+    }, dtype='float64')
+
+def distinct_reports(profile):
+    """Number of distinct Service Report ids (estimated in approximate mode)"""
+    if profile['approximate']:
+        return int(hll_estimate(profile['report_sketch'])[0])
+    return len(profile['report_hashes'])
+
+def distinct_entities(profile):
+    """Estimated number of distinct entities (approximate mode only)"""
+    return int(hll_estimate(profile['entity_sketch'])[0])
+
+def distinct_estimates(profile, by):
+    """Estimated distinct entity counts per group of a dimension, for rollup(estimated=)
+
+    Empty in exact mode, where the counts come from the cube.
+    """
+    if not profile['approximate'] or by not in profile['entity_sketches']:
+        return {}
+    keys, registers = profile['entity_sketches'][by]
+    return {'New E ID': pd.Series(hll_estimate(registers), index=keys)}
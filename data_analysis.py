@@ -7,149 +7,270 @@ Generates extensive markdown documentation with insights and statistics
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+import io
+import os
+from itertools import islice
 import json
 from collections import Counter
 import re
 
-def load_and_clean_data(filter_q1_2023=False):
-    """Load and perform initial data cleaning"""
+from aggregation_cube import (ROLLUP_CUBOIDS, build_aggregation_cube, distinct, first_value, grand_rollup, merge_cubes,
+                              mode_value, rollup, total)
+from column_profile import (VOLUME_RANGES, approximate_settings, build_column_profile, category_medians,
+                            distinct_entities, distinct_estimates, distinct_reports, histogram, histogram_describe,
+                            histogram_quantile, merge_column_profiles, volume_counts)
+from data_quality import apply_quality_rules, merge_quality_summaries, print_quality_summary
+from incremental_state import advance_state, load_state, new_state, read_new_rows, store_state
+from json_output import write_json
+from section_runner import map_row_ranges, parse_workers, run_sections
+from service_data import CSV_CHUNK_ROWS, CSV_PATH, SchemaError, date_window_mask, load_service_data, read_service_chunks
+from stage_trace import finish_trace, parse_trace_options, start_trace, traced_stage
+
+# Collected Date window of the --q1-2023 analysis
+Q1_2023_WINDOW = ('2023-01-01', '2023-03-31')
+
+# Statistics that are sketch estimates in approximate mode; everything else stays exact
+APPROXIMATE_STATISTICS = [
+    'summary.overview.unique_entities',
+    'summary.overview.unique_service_reports',
+    'Unique_Entities / Entities_Served of areas, zones, categories, providers, months and vehicles',
+    'categories Median_Gallons and volumes.by_category Median_Gallons',
+    'volumes.statistics median, q25 and q75',
+    'volumes.common_volumes counts'
+]
+
+# Cuboids aggregated in approximate mode: the roll-up families without the entity
+# pair tables, so their size does not depend on the number of entities either
+APPROXIMATE_CUBOIDS = ROLLUP_CUBOIDS
+
+def load_and_clean_data(filter_q1_2023=False, use_cache=True, strict_schema=False, start=None, end=None,
+                        exclude_invalid=False, quarantine_path=None):
+    """Load and perform initial data cleaning
+
+    An optional [start, end] Collected Date window is applied while reading,
+    so only the rows inside it are ever materialized. The rows are then checked
+    against the data-quality rules; those failing one are written to
+    quarantine_path if given, and dropped with exclude_invalid=True.
+    """
     print("Loading CSV data...")
     
-    # Load the CSV file
-    df = pd.read_csv('public/Blue Data Analysis.csv')
-    
-    # Convert date columns
-    date_columns = ['Collected Date', 'Discharged Date', 'Initiated Date']
-    for col in date_columns:
-        df[col] = pd.to_datetime(df[col], errors='coerce')
-    
     # Filter for Q1 2023 if requested
     if filter_q1_2023:
         print("Filtering data for Q1 2023 (Jan 1 - Mar 31, 2023)...")
-        q1_start = pd.to_datetime('2023-01-01')
-        q1_end = pd.to_datetime('2023-03-31')
-        df = df[(df['Collected Date'] >= q1_start) & (df['Collected Date'] <= q1_end)].copy()
-        print(f"Filtered dataset: {len(df):,} records for Q1 2023")
+        start, end = Q1_2023_WINDOW
     
-    # Clean numeric columns
-    df['Sum of Gallons Collected'] = pd.to_numeric(df['Sum of Gallons Collected'], errors='coerce')
-    df['Sum of No of Traps'] = pd.to_numeric(df['Sum of No of Traps'], errors='coerce')
-    df['Trade License Number'] = pd.to_numeric(df['Trade License Number'], errors='coerce')
+    # Load the CSV file with dates and numeric columns converted
+    df = load_service_data(use_cache=use_cache, strict=strict_schema, start=start, end=end)
     
-    # Calculate derived metrics
-    df['Collection_Duration_Days'] = (df['Discharged Date'] - df['Collected Date']).dt.days
-    df['Initiation_to_Collection_Days'] = (df['Collected Date'] - df['Initiated Date']).dt.days
-    df['Month'] = df['Collected Date'].dt.strftime('%Y-%m')
-    df['Week'] = df['Collected Date'].dt.isocalendar().week
-    df['Day_of_Week'] = df['Collected Date'].dt.day_name()
-    df['Hour'] = df['Collected Date'].dt.hour
+    if filter_q1_2023:
+        print(f"Filtered dataset: {len(df):,} records for Q1 2023")
+    elif start is not None or end is not None:
+        print(f"Filtered dataset: {len(df):,} records for {start or 'start'} - {end or 'end'}")
     
+    df, quality = apply_quality_rules(df, exclude_invalid, quarantine_path)
+    print_quality_summary(quality, exclude_invalid)
     return df
 
-def generate_summary_statistics(df):
+def build_analysis_cube(df, approximate=None, row_offset=0):
+    """Aggregation cube for the analyzers, only the APPROXIMATE_CUBOIDS in approximate mode
+
+    Entities are then counted with the sketches of the column profile.
+    """
+    if approximate:
+        return build_aggregation_cube(df, row_offset=row_offset, cuboids=APPROXIMATE_CUBOIDS)
+    return build_aggregation_cube(df, row_offset=row_offset)
+
+def build_parallel_aggregates(df, approximate=None, workers=1):
+    """Aggregation cube and column profile of df, built per range of rows on the worker pool
+
+    Each worker aggregates one consecutive range (see map_row_ranges) and the
+    parent merges the results, which equals aggregating df at once. Returns
+    (cube, profile).
+    """
+    def aggregate(rows, row_offset):
+        return build_analysis_cube(rows, approximate, row_offset), build_column_profile(rows, approximate, row_offset)
+    cubes, profiles = zip(*map_row_ranges('aggregates', aggregate, df, workers))
+    return merge_cubes(*cubes), merge_column_profiles(*profiles)
+
+def load_incremental_aggregates(filter_q1_2023=False, use_cache=True, strict_schema=False, approximate=None,
+                                exclude_invalid=False, quarantine_path=None):
+    """Bring the persisted aggregation cube and column profile up to date
+
+    Only rows with a Service Report id not seen by the previous run are parsed
+    and aggregated, and their cube and profile are merged into the saved ones.
+    The first run, or one after applied rows changed, builds the state from the
+    whole extract, as does a change of the approximate settings, of
+    exclude_invalid or of quarantine_path (or a missing quarantine file). The
+    data-quality rules are applied to the rows read (see load_and_clean_data):
+    the saved quality summary is merged with theirs and their failing rows are
+    appended to the quarantine file, so both cover every row applied. Returns
+    (cube, profile) for the analyzers.
+    """
+    name = 'analysis_q1_2023' if filter_q1_2023 else 'analysis'
+    def in_window(df):
+        return df[date_window_mask(df, *Q1_2023_WINDOW)].reset_index(drop=True) if filter_q1_2023 else df
+    state = load_state(CSV_PATH, name)
+    if state and (state['profile']['approximate'] != approximate or state.get('exclude_invalid') != exclude_invalid
+                  or state.get('quarantine_path') != quarantine_path
+                  or (quarantine_path and not os.path.exists(quarantine_path))):
+        state = None
+    delta, snapshot, _ = read_new_rows(CSV_PATH, state, strict=strict_schema) if state else (None, None, False)
+    
+    if delta is None:
+        print("Building incremental state from the full extract...")
+        df = load_service_data(use_cache=use_cache, strict=strict_schema)
+        state = new_state(df, CSV_PATH)
+        state['exclude_invalid'] = exclude_invalid
+        state['quarantine_path'] = quarantine_path
+        df, state['quality'] = apply_quality_rules(in_window(df), exclude_invalid, quarantine_path)
+        state['cube'] = build_analysis_cube(df, approximate)
+        state['profile'] = build_column_profile(df, approximate)
+    else:
+        print(f"Applying {len(delta):,} new service records to the saved aggregates...")
+        advance_state(state, delta, snapshot)
+        delta = in_window(delta)
+        if len(delta):
+            delta, quality = apply_quality_rules(delta, exclude_invalid, quarantine_path, append=True)
+            state['quality'] = merge_quality_summaries(state['quality'], quality)
+            offset = state['profile']['rows']
+            state['cube'] = merge_cubes(state['cube'], build_analysis_cube(delta, approximate, row_offset=offset))
+            state['profile'] = merge_column_profiles(state['profile'], build_column_profile(delta, approximate, row_offset=offset))
+    print_quality_summary(state['quality'], exclude_invalid)
+    
+    store_state(state, CSV_PATH, name)
+    return state['cube'], state['profile']
+
+def aggregate_chunks(filter_q1_2023=False, strict_schema=False, approximate=None, chunk_rows=CSV_CHUNK_ROWS,
+                     exclude_invalid=False, quarantine_path=None):
+    """Build the aggregation cube and column profile one CSV chunk at a time
+
+    Each chunk is typed, checked against the data-quality rules, aggregated
+    and merged into the running cube and profile before the next is read, so
+    only one chunk of rows is ever in memory. Every statistic the analyzers
+    read is mergeable, so the result equals aggregating the whole frame at once
+    (with approximate settings, the memory held by the aggregates is bounded
+    too). Returns (cube, profile).
+    """
+    print(f"Aggregating CSV data in chunks of {chunk_rows:,} rows...")
+    cube = profile = quality = None
+    failures = []
+    for chunk in read_service_chunks(CSV_PATH, chunk_rows, failures):
+        if filter_q1_2023:
+            chunk = chunk[date_window_mask(chunk, *Q1_2023_WINDOW)].reset_index(drop=True)
+        chunk, chunk_quality = apply_quality_rules(chunk, exclude_invalid, quarantine_path, append=quality is not None)
+        quality = merge_quality_summaries(quality, chunk_quality)
+        offset = profile['rows'] if profile else 0
+        chunk_cube = build_analysis_cube(chunk, approximate, row_offset=offset)
+        chunk_profile = build_column_profile(chunk, approximate, row_offset=offset)
+        if profile is None:
+            cube, profile = chunk_cube, chunk_profile
+        else:
+            cube, profile = merge_cubes(cube, chunk_cube), merge_column_profiles(profile, chunk_profile)
+
+    failures = pd.concat(failures, ignore_index=True) if failures else []
+    if strict_schema and len(failures):
+        raise SchemaError(failures)
+    print_quality_summary(quality, exclude_invalid)
+    return cube, profile
+
+def generate_summary_statistics(df, cube=None, profile=None):
     """Generate comprehensive summary statistics"""
+    cube = cube if cube is not None else build_aggregation_cube(df)
+    profile = profile if profile is not None else build_column_profile(df)
     stats = {
         'overview': {
-            'total_records': len(df),
+            'total_records': profile['rows'],
             'date_range': {
-                'start': df['Collected Date'].min().strftime('%Y-%m-%d'),
-                'end': df['Collected Date'].max().strftime('%Y-%m-%d'),
-                'duration_days': (df['Collected Date'].max() - df['Collected Date'].min()).days
+                'start': profile['collected_min'].strftime('%Y-%m-%d'),
+                'end': profile['collected_max'].strftime('%Y-%m-%d'),
+                'duration_days': (profile['collected_max'] - profile['collected_min']).days
             },
-            'total_gallons': df['Sum of Gallons Collected'].sum(),
-            'average_gallons_per_collection': round(df['Sum of Gallons Collected'].mean(), 2),
-            'unique_entities': df['New E ID'].nunique(),
-            'unique_service_reports': df['Service Report'].nunique(),
-            'unique_service_providers': df['Service Provider'].nunique(),
-            'unique_vehicles': df['Assigned Vehicle'].nunique(),
-            'unique_areas': df['Area'].nunique(),
-            'unique_zones': df['Zone'].nunique(),
-            'unique_categories': df['Category'].nunique()
+            'total_gallons': total(cube, 'gallons_sum'),
+            'average_gallons_per_collection': round(total(cube, 'gallons_sum') / total(cube, 'gallons_count'), 2),
+            'unique_entities': distinct_entities(profile) if profile['approximate'] else distinct(cube, 'New E ID'),
+            'unique_service_reports': distinct_reports(profile),
+            'unique_service_providers': distinct(cube, 'Service Provider'),
+            'unique_vehicles': distinct(cube, 'Assigned Vehicle'),
+            'unique_areas': distinct(cube, 'Area'),
+            'unique_zones': distinct(cube, 'Zone'),
+            'unique_categories': distinct(cube, 'Category')
         }
     }
     return stats
 
-def analyze_geographic_distribution(df):
+def analyze_geographic_distribution(df, cube=None, profile=None):
     """Analyze geographic patterns"""
+    cube = cube if cube is not None else build_aggregation_cube(df)
+    profile = profile if profile is not None else build_column_profile(df)
     
     # Area analysis
-    area_stats = df.groupby('Area').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean'],
-        'New E ID': 'nunique',
-        'Service Provider': 'nunique',
-        'Assigned Vehicle': 'nunique'
-    }).round(2)
+    area_stats = rollup(cube, 'Area', distinct=['New E ID', 'Service Provider', 'Assigned Vehicle'], estimated=distinct_estimates(profile, 'Area'))[[
+        'reports', 'gallons_sum', 'gallons_mean',
+        'distinct:New E ID', 'distinct:Service Provider', 'distinct:Assigned Vehicle'
+    ]].round(2)
     
     area_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Unique_Entities', 'Service_Providers', 'Vehicles']
-    area_stats['Percentage'] = round((area_stats['Collections'] / len(df)) * 100, 2)
+    area_stats['Percentage'] = round((area_stats['Collections'] / profile['rows']) * 100, 2)
     area_stats = area_stats.sort_values('Collections', ascending=False)
     
     # Zone analysis
-    zone_stats = df.groupby('Zone').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean'],
-        'New E ID': 'nunique',
-        'Area': 'nunique'
-    }).round(2)
+    zone_stats = rollup(cube, 'Zone', distinct=['New E ID', 'Area'], estimated=distinct_estimates(profile, 'Zone'))[[
+        'reports', 'gallons_sum', 'gallons_mean', 'distinct:New E ID', 'distinct:Area'
+    ]].round(2)
     
     zone_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Unique_Entities', 'Areas']
-    zone_stats['Percentage'] = round((zone_stats['Collections'] / len(df)) * 100, 2)
+    zone_stats['Percentage'] = round((zone_stats['Collections'] / profile['rows']) * 100, 2)
     zone_stats = zone_stats.sort_values('Collections', ascending=False)
     
     return {
         'areas': area_stats.to_dict('index'),
         'zones': zone_stats.to_dict('index'),
         'top_areas': area_stats.head(10).to_dict('index'),
-        'area_zone_mapping': df.groupby('Area')['Zone'].first().to_dict()
+        'area_zone_mapping': first_value(cube, 'Area', 'Zone').to_dict()
     }
 
-def analyze_business_categories(df):
+def analyze_business_categories(df, cube=None, profile=None):
     """Analyze business category patterns"""
+    cube = cube if cube is not None else build_aggregation_cube(df)
+    profile = profile if profile is not None else build_column_profile(df)
     
-    category_stats = df.groupby('Category').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean', 'median', 'std'],
-        'New E ID': 'nunique',
-        'Area': 'nunique',
-        'Service Provider': 'nunique'
-    }).round(2)
+    # Medians are not additive, so they come from the gallon histograms of the profile
+    category_stats = rollup(cube, 'Category', distinct=['New E ID', 'Area', 'Service Provider'], estimated=distinct_estimates(profile, 'Category'))
+    category_stats['gallons_median'] = category_medians(profile)
+    category_stats = category_stats[[
+        'reports', 'gallons_sum', 'gallons_mean', 'gallons_median', 'gallons_std',
+        'distinct:New E ID', 'distinct:Area', 'distinct:Service Provider'
+    ]].round(2)
     
     category_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Median_Gallons', 'Std_Gallons', 'Unique_Entities', 'Areas_Served', 'Service_Providers']
-    category_stats['Percentage'] = round((category_stats['Collections'] / len(df)) * 100, 2)
+    category_stats['Percentage'] = round((category_stats['Collections'] / profile['rows']) * 100, 2)
     category_stats = category_stats.sort_values('Collections', ascending=False)
     
     # Sub-category analysis
-    subcategory_stats = df.groupby('Sub Category').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean']
-    }).round(2)
+    subcategory_stats = rollup(cube, 'Sub Category')[['reports', 'gallons_sum', 'gallons_mean']].round(2)
     subcategory_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons']
-    subcategory_stats['Percentage'] = round((subcategory_stats['Collections'] / len(df)) * 100, 2)
+    subcategory_stats['Percentage'] = round((subcategory_stats['Collections'] / profile['rows']) * 100, 2)
     subcategory_stats = subcategory_stats.sort_values('Collections', ascending=False)
     
     return {
         'categories': category_stats.to_dict('index'),
         'subcategories': subcategory_stats.to_dict('index'),
         'top_categories': category_stats.head(10).to_dict('index'),
-        'category_area_distribution': df.groupby(['Category', 'Area']).size().to_dict()
+        'category_area_distribution': rollup(cube, ['Category', 'Area'])['collections'].to_dict()
     }
 
-def analyze_service_providers(df):
+def analyze_service_providers(df, cube=None, profile=None):
     """Analyze service provider performance"""
+    cube = cube if cube is not None else build_aggregation_cube(df)
+    profile = profile if profile is not None else build_column_profile(df)
     
-    provider_stats = df.groupby('Service Provider').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean'],
-        'New E ID': 'nunique',
-        'Area': 'nunique',
-        'Zone': 'nunique',
-        'Assigned Vehicle': 'nunique',
-        'Initiation_to_Collection_Days': 'mean'
-    }).round(2)
+    provider_stats = rollup(cube, 'Service Provider', distinct=['New E ID', 'Area', 'Zone', 'Assigned Vehicle'], estimated=distinct_estimates(profile, 'Service Provider'))[[
+        'reports', 'gallons_sum', 'gallons_mean', 'distinct:New E ID', 'distinct:Area',
+        'distinct:Zone', 'distinct:Assigned Vehicle', 'turnaround_mean'
+    ]].round(2)
     
     provider_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Unique_Entities', 'Areas_Served', 'Zones_Served', 'Vehicles_Used', 'Avg_Turnaround_Days']
-    provider_stats['Market_Share'] = round((provider_stats['Collections'] / len(df)) * 100, 2)
+    provider_stats['Market_Share'] = round((provider_stats['Collections'] / profile['rows']) * 100, 2)
     provider_stats['Collections_Per_Vehicle'] = round(provider_stats['Collections'] / provider_stats['Vehicles_Used'], 2)
     provider_stats = provider_stats.sort_values('Collections', ascending=False)
     
@@ -163,29 +284,21 @@ def analyze_service_providers(df):
         }
     }
 
-def analyze_volume_patterns(df):
+def analyze_volume_patterns(df, cube=None, profile=None):
     """Analyze volume collection patterns"""
+    cube = cube if cube is not None else build_aggregation_cube(df)
+    profile = profile if profile is not None else build_column_profile(df)
     
-    # Volume distribution
-    gallons = df['Sum of Gallons Collected'].dropna()
-    
-    volume_ranges = [
-        (0, 10, '0-10'),
-        (11, 25, '11-25'),
-        (26, 50, '26-50'),
-        (51, 100, '51-100'),
-        (101, 200, '101-200'),
-        (201, 500, '201-500'),
-        (501, float('inf'), '500+')
-    ]
+    # Volume distribution, from the bin totals and the histogram of gallon values
+    values, counts = histogram(profile['volumes'])
+    overall = grand_rollup(cube)
     
     volume_distribution = {}
-    for min_val, max_val, label in volume_ranges:
-        mask = (gallons >= min_val) & (gallons < max_val)
-        count = mask.sum()
-        percentage = round((count / len(gallons)) * 100, 2)
-        total_gallons = gallons[mask].sum()
-        avg_gallons = round(gallons[mask].mean(), 2) if count > 0 else 0
+    for _, _, label in VOLUME_RANGES:
+        count = profile['volume_ranges'].loc[label, 'count']
+        percentage = round((count / overall['gallons_count']) * 100, 2)
+        total_gallons = profile['volume_ranges'].loc[label, 'gallons']
+        avg_gallons = round(total_gallons / count, 2) if count > 0 else 0
         
         volume_distribution[label] = {
             'count': count,
@@ -195,11 +308,14 @@ def analyze_volume_patterns(df):
         }
     
     # Common volume sizes
-    volume_counts = gallons.value_counts().head(20)
-    common_volumes = volume_counts.to_dict()
+    common_volumes = volume_counts(profile).head(20).to_dict()
     
     # Volume by category
-    volume_by_category = df.groupby('Category')['Sum of Gallons Collected'].agg(['count', 'sum', 'mean', 'median', 'std']).round(2)
+    volume_by_category = rollup(cube, 'Category')
+    volume_by_category['gallons_median'] = category_medians(profile)
+    volume_by_category = volume_by_category[[
+        'gallons_count', 'gallons_sum', 'gallons_mean', 'gallons_median', 'gallons_std'
+    ]].round(2)
     volume_by_category.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Median_Gallons', 'Std_Gallons']
     
     return {
@@ -207,49 +323,44 @@ def analyze_volume_patterns(df):
         'common_volumes': common_volumes,
         'by_category': volume_by_category.to_dict('index'),
         'statistics': {
-            'min': gallons.min(),
-            'max': gallons.max(),
-            'mean': round(gallons.mean(), 2),
-            'median': round(gallons.median(), 2),
-            'std': round(gallons.std(), 2),
-            'q25': round(gallons.quantile(0.25), 2),
-            'q75': round(gallons.quantile(0.75), 2)
+            'min': overall['gallons_min'],
+            'max': overall['gallons_max'],
+            'mean': round(overall['gallons_mean'], 2),
+            'median': round(histogram_quantile(values, counts, 0.5), 2),
+            'std': round(overall['gallons_std'], 2),
+            'q25': round(histogram_quantile(values, counts, 0.25), 2),
+            'q75': round(histogram_quantile(values, counts, 0.75), 2)
         }
     }
 
-def analyze_temporal_patterns(df):
+def analyze_temporal_patterns(df, cube=None, profile=None):
     """Analyze temporal patterns"""
+    cube = cube if cube is not None else build_aggregation_cube(df)
+    profile = profile if profile is not None else build_column_profile(df)
     
     # Monthly patterns
-    monthly_stats = df.groupby('Month').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': 'sum',
-        'New E ID': 'nunique',
-        'Service Provider': 'nunique'
-    }).round(2)
+    monthly_stats = rollup(cube, 'Month', distinct=['New E ID', 'Service Provider'], estimated=distinct_estimates(profile, 'Month'))[[
+        'reports', 'gallons_sum', 'distinct:New E ID', 'distinct:Service Provider'
+    ]].round(2)
     monthly_stats.columns = ['Collections', 'Total_Gallons', 'Unique_Entities', 'Active_Providers']
     
     # Day of week patterns
-    dow_stats = df.groupby('Day_of_Week').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean']
-    }).round(2)
+    dow_stats = rollup(cube, 'Day_of_Week')[['reports', 'gallons_sum', 'gallons_mean']].round(2)
     dow_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons']
-    dow_stats['Percentage'] = round((dow_stats['Collections'] / len(df)) * 100, 2)
+    dow_stats['Percentage'] = round((dow_stats['Collections'] / profile['rows']) * 100, 2)
     
     # Reorder days of week
     day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
     dow_stats = dow_stats.reindex(day_order)
     
     # Hourly patterns (if available)
-    hourly_stats = df.groupby('Hour').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': 'mean'
-    }).round(2)
+    hourly_stats = profile['hourly'].groupby('Hour', sort=True).sum()
+    hourly_stats['Avg_Gallons'] = hourly_stats['gallons_sum'] / hourly_stats['gallons_count']
+    hourly_stats = hourly_stats[['reports', 'Avg_Gallons']].round(2)
     hourly_stats.columns = ['Collections', 'Avg_Gallons']
     
     # Turnaround time analysis
-    turnaround_stats = df['Initiation_to_Collection_Days'].describe()
+    turnaround_stats = histogram_describe(*histogram(profile['turnaround']))
     
     return {
         'monthly': monthly_stats.to_dict('index'),
@@ -264,40 +375,34 @@ def analyze_temporal_patterns(df):
         }
     }
 
-def analyze_operational_efficiency(df):
+def analyze_operational_efficiency(df, cube=None, profile=None):
     """Analyze operational efficiency metrics"""
+    cube = cube if cube is not None else build_aggregation_cube(df)
+    profile = profile if profile is not None else build_column_profile(df)
     
     # Vehicle utilization
-    vehicle_stats = df.groupby('Assigned Vehicle').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean'],
-        'Area': 'nunique',
-        'New E ID': 'nunique',
-        'Service Provider': 'first'
-    }).round(2)
+    vehicle_stats = rollup(cube, 'Assigned Vehicle', distinct=['Area', 'New E ID'], estimated=distinct_estimates(profile, 'Assigned Vehicle'))[[
+        'reports', 'gallons_sum', 'gallons_mean', 'distinct:Area', 'distinct:New E ID'
+    ]].round(2)
+    vehicle_stats['Service_Provider'] = first_value(cube, 'Assigned Vehicle', 'Service Provider')
     vehicle_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Areas_Served', 'Entities_Served', 'Service_Provider']
     vehicle_stats = vehicle_stats.sort_values('Collections', ascending=False)
     
     # Trap type analysis
-    trap_stats = df.groupby('Trap Type').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean'],
-        'Category': lambda x: x.mode().iloc[0] if len(x.mode()) > 0 else 'Unknown'
-    }).round(2)
+    trap_stats = rollup(cube, 'Trap Type')[['reports', 'gallons_sum', 'gallons_mean']].round(2)
+    trap_stats['Most_Common_Category'] = mode_value(cube, 'Trap Type', 'Category', default='Unknown')
     trap_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Most_Common_Category']
-    trap_stats['Percentage'] = round((trap_stats['Collections'] / len(df)) * 100, 2)
+    trap_stats['Percentage'] = round((trap_stats['Collections'] / profile['rows']) * 100, 2)
     trap_stats = trap_stats.sort_values('Collections', ascending=False)
     
     # Efficiency metrics
-    completion_rate = (df['Status'] == 'Discharged').mean() * 100
-    avg_traps_per_service = df['Sum of No of Traps'].mean()
+    completion_rate = total(cube, 'discharged') / total(cube, 'collections') * 100
+    avg_traps_per_service = profile['traps_sum'] / profile['traps_count']
     
     # Provider efficiency by area
-    provider_area_efficiency = df.groupby(['Service Provider', 'Area']).agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': 'mean',
-        'Initiation_to_Collection_Days': 'mean'
-    }).round(2)
+    provider_area_efficiency = rollup(cube, ['Service Provider', 'Area'])[[
+        'reports', 'gallons_mean', 'turnaround_mean'
+    ]].round(2)
     provider_area_efficiency.columns = ['Collections', 'Avg_Gallons', 'Avg_Turnaround']
     
     return {
@@ -328,12 +433,22 @@ def generate_insights_and_recommendations(df, stats):
     
     return insights
 
-def generate_markdown_report(df, all_stats):
-    """Generate comprehensive markdown report"""
-    
-    markdown_content = f"""# Dubai Waste Collection Data Analysis Report
+def write_markdown_report(out, df, all_stats):
+    """Write the comprehensive markdown report to a text sink
 
-## Executive Summary
+    Sections and table rows are written as they are rendered, so the report is
+    never held in memory as one growing string. out is any object with write(),
+    e.g. an open file.
+    """
+    
+    out.write("# Dubai Waste Collection Data Analysis Report\n\n")
+    if 'approximate' in all_stats:
+        settings = all_stats['approximate']['settings']
+        out.write(f"> **Approximate statistics**: distinct counts are estimated within ~{settings['distinct_error']:.0%} "
+                  f"and gallon medians and quartiles within {settings['quantile_error']:.0%}; "
+                  f"all totals, means and collection counts are exact.\n\n")
+    
+    out.write(f"""## Executive Summary
 
 This comprehensive analysis covers **{all_stats['summary']['overview']['total_records']:,} waste collection service records** from Dubai's grease collection operations, spanning from **{all_stats['summary']['overview']['date_range']['start']}** to **{all_stats['summary']['overview']['date_range']['end']}** ({all_stats['summary']['overview']['date_range']['duration_days']} days).
 
@@ -350,89 +465,89 @@ This comprehensive analysis covers **{all_stats['summary']['overview']['total_re
 ## 📍 Geographic Distribution Analysis
 
 ### Top Collection Areas
-"""
+""")
     
     # Add geographic analysis
-    for area, data in list(all_stats['geographic']['top_areas'].items())[:10]:
-        markdown_content += f"- **{area}**: {data['Collections']:,} collections ({data['Percentage']}%), {data['Total_Gallons']:,} gallons\n"
+    for area, data in islice(all_stats['geographic']['top_areas'].items(), 10):
+        out.write(f"- **{area}**: {data['Collections']:,} collections ({data['Percentage']}%), {data['Total_Gallons']:,} gallons\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ### Geographic Summary Table
 | Area | Collections | Percentage | Total Gallons | Avg Gallons | Unique Entities | Vehicles |
 |------|-------------|------------|---------------|-------------|-----------------|----------|
-"""
+""")
     
-    for area, data in list(all_stats['geographic']['top_areas'].items())[:15]:
-        markdown_content += f"| {area} | {data['Collections']:,} | {data['Percentage']}% | {data['Total_Gallons']:,} | {data['Avg_Gallons']} | {data['Unique_Entities']} | {data['Vehicles']} |\n"
+    for area, data in islice(all_stats['geographic']['top_areas'].items(), 15):
+        out.write(f"| {area} | {data['Collections']:,} | {data['Percentage']}% | {data['Total_Gallons']:,} | {data['Avg_Gallons']} | {data['Unique_Entities']} | {data['Vehicles']} |\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ### Zone Distribution
 | Zone | Collections | Percentage | Total Gallons | Areas Covered |
 |------|-------------|------------|---------------|---------------|
-"""
+""")
     
     for zone, data in all_stats['geographic']['zones'].items():
-        markdown_content += f"| {zone} | {data['Collections']:,} | {data['Percentage']}% | {data['Total_Gallons']:,} | {data['Areas']} |\n"
+        out.write(f"| {zone} | {data['Collections']:,} | {data['Percentage']}% | {data['Total_Gallons']:,} | {data['Areas']} |\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ---
 
 ## 🏢 Business Category Analysis
 
 ### Category Performance Overview
-"""
+""")
     
-    for category, data in list(all_stats['categories']['top_categories'].items())[:10]:
-        markdown_content += f"- **{category}**: {data['Collections']:,} collections ({data['Percentage']}%), {data['Avg_Gallons']} avg gallons\n"
+    for category, data in islice(all_stats['categories']['top_categories'].items(), 10):
+        out.write(f"- **{category}**: {data['Collections']:,} collections ({data['Percentage']}%), {data['Avg_Gallons']} avg gallons\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ### Detailed Category Statistics
 | Category | Collections | % Share | Total Gallons | Avg Gallons | Entities | Areas | Providers |
 |----------|-------------|---------|---------------|-------------|----------|-------|-----------|
-"""
+""")
     
     for category, data in all_stats['categories']['categories'].items():
-        markdown_content += f"| {category} | {data['Collections']:,} | {data['Percentage']}% | {data['Total_Gallons']:,} | {data['Avg_Gallons']} | {data['Unique_Entities']} | {data['Areas_Served']} | {data['Service_Providers']} |\n"
+        out.write(f"| {category} | {data['Collections']:,} | {data['Percentage']}% | {data['Total_Gallons']:,} | {data['Avg_Gallons']} | {data['Unique_Entities']} | {data['Areas_Served']} | {data['Service_Providers']} |\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ---
 
 ## 🚚 Service Provider Performance
 
 ### Top Performing Providers
-"""
+""")
     
-    for provider, data in list(all_stats['providers']['top_providers'].items())[:10]:
-        markdown_content += f"- **{provider}**: {data['Collections']:,} collections ({data['Market_Share']}% market share), {data['Areas_Served']} areas\n"
+    for provider, data in islice(all_stats['providers']['top_providers'].items(), 10):
+        out.write(f"- **{provider}**: {data['Collections']:,} collections ({data['Market_Share']}% market share), {data['Areas_Served']} areas\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ### Provider Performance Matrix
 | Provider | Collections | Market Share | Total Gallons | Avg Turnaround | Areas | Zones | Vehicles | Efficiency |
 |----------|-------------|--------------|---------------|----------------|-------|-------|----------|------------|
-"""
+""")
     
-    for provider, data in list(all_stats['providers']['providers'].items())[:20]:
-        markdown_content += f"| {provider} | {data['Collections']:,} | {data['Market_Share']}% | {data['Total_Gallons']:,} | {data['Avg_Turnaround_Days']:.1f} days | {data['Areas_Served']} | {data['Zones_Served']} | {data['Vehicles_Used']} | {data['Collections_Per_Vehicle']:.1f} |\n"
+    for provider, data in islice(all_stats['providers']['providers'].items(), 20):
+        out.write(f"| {provider} | {data['Collections']:,} | {data['Market_Share']}% | {data['Total_Gallons']:,} | {data['Avg_Turnaround_Days']:.1f} days | {data['Areas_Served']} | {data['Zones_Served']} | {data['Vehicles_Used']} | {data['Collections_Per_Vehicle']:.1f} |\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ---
 
 ## 📊 Volume Analysis
 
 ### Volume Distribution
-"""
+""")
     
     for range_label, data in all_stats['volumes']['distribution'].items():
-        markdown_content += f"- **{range_label} gallons**: {data['count']:,} collections ({data['percentage']}%), {data['total_gallons']:,} total gallons\n"
+        out.write(f"- **{range_label} gallons**: {data['count']:,} collections ({data['percentage']}%), {data['total_gallons']:,} total gallons\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ### Volume Statistics
 - **Minimum**: {all_stats['volumes']['statistics']['min']} gallons
@@ -444,13 +559,13 @@ This comprehensive analysis covers **{all_stats['summary']['overview']['total_re
 - **75th Percentile**: {all_stats['volumes']['statistics']['q75']} gallons
 
 ### Most Common Volume Sizes
-"""
+""")
     
-    for volume, count in list(all_stats['volumes']['common_volumes'].items())[:10]:
+    for volume, count in islice(all_stats['volumes']['common_volumes'].items(), 10):
         percentage = round((count / all_stats['summary']['overview']['total_records']) * 100, 2)
-        markdown_content += f"- **{volume} gallons**: {count:,} collections ({percentage}%)\n"
+        out.write(f"- **{volume} gallons**: {count:,} collections ({percentage}%)\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ---
 
@@ -459,22 +574,22 @@ This comprehensive analysis covers **{all_stats['summary']['overview']['total_re
 ### Monthly Collection Trends
 | Month | Collections | Total Gallons | Unique Entities | Active Providers |
 |-------|-------------|---------------|-----------------|------------------|
-"""
+""")
     
     for month, data in all_stats['temporal']['monthly'].items():
-        markdown_content += f"| {month} | {data['Collections']:,} | {data['Total_Gallons']:,} | {data['Unique_Entities']} | {data['Active_Providers']} |\n"
+        out.write(f"| {month} | {data['Collections']:,} | {data['Total_Gallons']:,} | {data['Unique_Entities']} | {data['Active_Providers']} |\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ### Day of Week Patterns
 | Day | Collections | Percentage | Total Gallons | Avg Gallons |
 |-----|-------------|------------|---------------|-------------|
-"""
+""")
     
     for day, data in all_stats['temporal']['day_of_week'].items():
-        markdown_content += f"| {day} | {data['Collections']:,} | {data['Percentage']}% | {data['Total_Gallons']:,} | {data['Avg_Gallons']} |\n"
+        out.write(f"| {day} | {data['Collections']:,} | {data['Percentage']}% | {data['Total_Gallons']:,} | {data['Avg_Gallons']} |\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ### Turnaround Time Analysis
 - **Average Turnaround**: {all_stats['temporal']['turnaround_time']['mean_days']} days
@@ -489,22 +604,22 @@ This comprehensive analysis covers **{all_stats['summary']['overview']['total_re
 ### Vehicle Performance
 | Vehicle | Collections | Total Gallons | Avg Gallons | Areas | Entities | Provider |
 |---------|-------------|---------------|-------------|-------|----------|----------|
-"""
+""")
     
-    for vehicle, data in list(all_stats['efficiency']['top_vehicles'].items())[:15]:
-        markdown_content += f"| {vehicle} | {data['Collections']} | {data['Total_Gallons']:,} | {data['Avg_Gallons']} | {data['Areas_Served']} | {data['Entities_Served']} | {data['Service_Provider']} |\n"
+    for vehicle, data in islice(all_stats['efficiency']['top_vehicles'].items(), 15):
+        out.write(f"| {vehicle} | {data['Collections']} | {data['Total_Gallons']:,} | {data['Avg_Gallons']} | {data['Areas_Served']} | {data['Entities_Served']} | {data['Service_Provider']} |\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ### Trap Type Distribution
 | Trap Type | Collections | Percentage | Total Gallons | Avg Gallons | Most Common Category |
 |-----------|-------------|------------|---------------|-------------|---------------------|
-"""
+""")
     
     for trap_type, data in all_stats['efficiency']['trap_types'].items():
-        markdown_content += f"| {trap_type} | {data['Collections']:,} | {data['Percentage']}% | {data['Total_Gallons']:,} | {data['Avg_Gallons']} | {data['Most_Common_Category']} |\n"
+        out.write(f"| {trap_type} | {data['Collections']:,} | {data['Percentage']}% | {data['Total_Gallons']:,} | {data['Avg_Gallons']} | {data['Most_Common_Category']} |\n")
     
-    markdown_content += f"""
+    out.write(f"""
 
 ### Operational Metrics
 - **Service Completion Rate**: {all_stats['efficiency']['completion_rate']}%
@@ -551,62 +666,104 @@ This comprehensive analysis covers **{all_stats['summary']['overview']['total_re
 ---
 
 *Report generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} based on comprehensive analysis of {all_stats['summary']['overview']['total_records']:,} waste collection service records.*
-"""
-    
-    return markdown_content
+""")
+
+def generate_markdown_report(df, all_stats):
+    """Generate comprehensive markdown report as a string"""
+    buffer = io.StringIO()
+    write_markdown_report(buffer, df, all_stats)
+    return buffer.getvalue()
+
+def analysis_sections():
+    """The analysis sections in run order, as run_sections entries
 
-def main(q1_2023_only=False):
-    """Main execution function"""
+    They read 'df' and 'approximate'; every dimension is aggregated in a single
+    scan ('cube' and 'profile') and the analyzers read the aggregates.
+    """
+    return {
+        'cube': (build_analysis_cube, ['df', 'approximate'], "Building aggregation cube..."),
+        'profile': (build_column_profile, ['df', 'approximate'], "Profiling columns..."),
+        'summary': (generate_summary_statistics, ['df', 'cube', 'profile'], "Generating summary statistics..."),
+        'geographic': (analyze_geographic_distribution, ['df', 'cube', 'profile'], "Analyzing geographic distribution..."),
+        'categories': (analyze_business_categories, ['df', 'cube', 'profile'], "Analyzing business categories..."),
+        'providers': (analyze_service_providers, ['df', 'cube', 'profile'], "Analyzing service providers..."),
+        'volumes': (analyze_volume_patterns, ['df', 'cube', 'profile'], "Analyzing volume patterns..."),
+        'temporal': (analyze_temporal_patterns, ['df', 'cube', 'profile'], "Analyzing temporal patterns..."),
+        'efficiency': (analyze_operational_efficiency, ['df', 'cube', 'profile'], "Analyzing operational efficiency...")
+    }
+
+def main(q1_2023_only=False, use_cache=True, strict_schema=False, workers=1, incremental=False, approximate=None,
+         chunked=False, chunk_rows=CSV_CHUNK_ROWS, exclude_invalid=False, quarantine_path=None):
+    """Main execution function
+
+    With incremental=True the analyzers read aggregates kept up to date from
+    the rows added since the last incremental run (see load_incremental_aggregates).
+    approximate=approximate_settings(...) estimates the APPROXIMATE_STATISTICS
+    with sketches of bounded size; the output records that it did. chunked=True
+    streams the CSV through the aggregates instead of loading it (see aggregate_chunks).
+    Rows failing a data-quality rule are reported, written to quarantine_path
+    if given and left out of the analysis with exclude_invalid=True. With
+    workers > 1 the cube and profile are built per range of rows on the pool
+    (see build_parallel_aggregates) before the analyzers run concurrently.
+    """
     if q1_2023_only:
         print("Starting Q1 2023 focused data analysis...")
     else:
         print("Starting comprehensive data analysis...")
     
-    # Load and clean data
-    df = load_and_clean_data(filter_q1_2023=q1_2023_only)
-    print(f"Loaded {len(df):,} records")
-    
-    # Perform all analyses
-    print("Generating summary statistics...")
-    summary_stats = generate_summary_statistics(df)
-    
-    print("Analyzing geographic distribution...")
-    geographic_stats = analyze_geographic_distribution(df)
-    
-    print("Analyzing business categories...")
-    category_stats = analyze_business_categories(df)
-    
-    print("Analyzing service providers...")
-    provider_stats = analyze_service_providers(df)
-    
-    print("Analyzing volume patterns...")
-    volume_stats = analyze_volume_patterns(df)
-    
-    print("Analyzing temporal patterns...")
-    temporal_stats = analyze_temporal_patterns(df)
-    
-    print("Analyzing operational efficiency...")
-    efficiency_stats = analyze_operational_efficiency(df)
+    sections = analysis_sections()
+    quality = dict(exclude_invalid=exclude_invalid, quarantine_path=quarantine_path)
+    if incremental:
+        # The saved cube and profile stand in for the frame, so it is never loaded
+        with traced_stage('load') as event:
+            cube, profile = load_incremental_aggregates(filter_q1_2023=q1_2023_only, use_cache=use_cache,
+                                                        strict_schema=strict_schema, approximate=approximate, **quality)
+            event['rows'] = profile['rows']
+        df, shared = None, {'df': None, 'cube': cube, 'profile': profile}
+        del sections['cube'], sections['profile']
+        print(f"Loaded {profile['rows']:,} records")
+    elif chunked:
+        with traced_stage('load') as event:
+            cube, profile = aggregate_chunks(filter_q1_2023=q1_2023_only, strict_schema=strict_schema,
+                                             approximate=approximate, chunk_rows=chunk_rows, **quality)
+            event['rows'] = profile['rows']
+        df, shared = None, {'df': None, 'cube': cube, 'profile': profile}
+        del sections['cube'], sections['profile']
+        print(f"Aggregated {profile['rows']:,} records")
+    else:
+        # Load and clean data
+        with traced_stage('load') as event:
+            df = load_and_clean_data(filter_q1_2023=q1_2023_only, use_cache=use_cache, strict_schema=strict_schema,
+                                     **quality)
+            event['rows'] = len(df)
+        shared = {'df': df, 'approximate': approximate}
+        print(f"Loaded {len(df):,} records")
+        if workers > 1:
+            print("Building aggregation cube and profiling columns...")
+            shared['cube'], shared['profile'] = build_parallel_aggregates(df, approximate, workers)
+            del sections['cube'], sections['profile']
+
+    results = run_sections(sections, shared, workers=workers)
+    summary_stats = results['summary']
     
     # Combine all statistics
     all_stats = {
         'summary': summary_stats,
-        'geographic': geographic_stats,
-        'categories': category_stats,
-        'providers': provider_stats,
-        'volumes': volume_stats,
-        'temporal': temporal_stats,
-        'efficiency': efficiency_stats
+        'geographic': results['geographic'],
+        'categories': results['categories'],
+        'providers': results['providers'],
+        'volumes': results['volumes'],
+        'temporal': results['temporal'],
+        'efficiency': results['efficiency']
     }
     
     # Generate insights
     print("Generating insights...")
-    insights = generate_insights_and_recommendations(df, summary_stats)
+    with traced_stage('insights'):
+        insights = generate_insights_and_recommendations(df, summary_stats)
     all_stats['insights'] = insights
-    
-    # Generate markdown report
-    print("Creating markdown report...")
-    markdown_report = generate_markdown_report(df, all_stats)
+    if approximate:
+        all_stats['approximate'] = {'settings': approximate, 'estimated_statistics': APPROXIMATE_STATISTICS}
     
     # Determine output file names
     if q1_2023_only:
@@ -616,25 +773,14 @@ def main(q1_2023_only=False):
         markdown_filename = 'Dubai_Waste_Collection_Analysis.md'
         json_filename = 'data_insights.json'
     
-    # Save reports
-    with open(markdown_filename, 'w', encoding='utf-8') as f:
-        f.write(markdown_report)
-    
-    # Convert complex data structures for JSON serialization
-    def convert_for_json(obj):
-        if isinstance(obj, dict):
-            return {str(k): convert_for_json(v) for k, v in obj.items()}
-        elif isinstance(obj, (list, tuple)):
-            return [convert_for_json(item) for item in obj]
-        elif hasattr(obj, 'to_dict'):
-            return convert_for_json(obj.to_dict())
-        else:
-            return obj
-    
-    json_compatible_stats = convert_for_json(all_stats)
+    # Stream the markdown report straight to its file
+    print("Creating markdown report...")
+    with traced_stage('markdown'), open(markdown_filename, 'w', encoding='utf-8') as f:
+        write_markdown_report(f, df, all_stats)
     
-    with open(json_filename, 'w', encoding='utf-8') as f:
-        json.dump(json_compatible_stats, f, indent=2, default=str)
+    # numpy integers stay strings here, as the dashboard's data insights types expect
+    with traced_stage('json'):
+        write_json(all_stats, json_filename, numpy_text=True)
     
     print("Analysis complete!")
     print(f"Generated files:")
@@ -643,15 +789,38 @@ def main(q1_2023_only=False):
     
     return all_stats
 
-def generate_q1_2023_analysis():
+def generate_q1_2023_analysis(use_cache=True, strict_schema=False, workers=1, incremental=False, approximate=None,
+                              chunked=False, chunk_rows=CSV_CHUNK_ROWS, exclude_invalid=False, quarantine_path=None):
     """Generate Q1 2023 focused analysis"""
-    return main(q1_2023_only=True)
+    return main(q1_2023_only=True, use_cache=use_cache, strict_schema=strict_schema, workers=workers,
+                incremental=incremental, approximate=approximate, chunked=chunked, chunk_rows=chunk_rows,
+                exclude_invalid=exclude_invalid, quarantine_path=quarantine_path)
 
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) > 1 and sys.argv[1] == "--q1-2023":
-        print("Generating Q1 2023 analysis...")
-        stats = generate_q1_2023_analysis()
-    else:
-        print("Generating full dataset analysis...")
-        stats = main()
\ No newline at end of file
+    use_cache = "--no-cache" not in sys.argv
+    strict_schema = "--strict-schema" in sys.argv
+    workers = parse_workers(sys.argv)
+    incremental = "--incremental" in sys.argv
+    approximate = None
+    if "--approximate" in sys.argv:
+        errors = {}
+        if "--quantile-error" in sys.argv:
+            errors['quantile_error'] = float(sys.argv[sys.argv.index("--quantile-error") + 1])
+        if "--distinct-error" in sys.argv:
+            errors['distinct_error'] = float(sys.argv[sys.argv.index("--distinct-error") + 1])
+        approximate = approximate_settings(**errors)
+    chunk_rows = int(sys.argv[sys.argv.index("--chunk-rows") + 1]) if "--chunk-rows" in sys.argv else CSV_CHUNK_ROWS
+    options = dict(use_cache=use_cache, strict_schema=strict_schema, workers=workers, incremental=incremental,
+                   approximate=approximate, chunked="--chunked" in sys.argv, chunk_rows=chunk_rows,
+                   exclude_invalid="--exclude-invalid" in sys.argv,
+                   quarantine_path=sys.argv[sys.argv.index("--quarantine") + 1] if "--quarantine" in sys.argv else None)
+    start_trace(**parse_trace_options(sys.argv))
+    with traced_stage('data_analysis'):
+        if "--q1-2023" in sys.argv:
+            print("Generating Q1 2023 analysis...")
+            stats = generate_q1_2023_analysis(**options)
+        else:
+            print("Generating full dataset analysis...")
+            stats = main(**options)
+    finish_trace()
\ No newline at end of file
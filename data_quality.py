@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Data-quality rules for the cleaned service frame
+The ingestion schema coerces values it cannot parse to NaT/NA, and values that
+parse but make no sense (no gallons, a discharge before the collection) reach
+the reports unchecked. These rules mirror the services table of
+database/schema.sql - its NOT NULL columns and gallons_collected > 0 - plus the
+date order the duration metrics assume. Each rule is a single vectorized
+comparison, so checking costs milliseconds per million rows and is always on;
+excluding the failing rows and writing them to a quarantine file are opt-in.
+"""
+
+import numpy as np
+
+# Extract columns that are NOT NULL in the services table (bulk_load derives its list from this one)
+REQUIRED_COLUMNS = [
+    'Service Report', 'New E ID', 'Service Provider', 'Collected Date', 'Discharged Date', 'Initiated Date',
+    'Area', 'Assigned Vehicle', 'Category', 'Discharge TXN', 'Entity Mapping.Outlet', 'Sum of Gallons Collected',
+    'Initiator', 'Zone'
+]
+
+# Column of the quarantine file listing the rules a row fails
+VIOLATIONS_COLUMN = 'Violations'
+
+def is_missing(values):
+    """Mask of missing values (NaN, NA, NaT, or coerced by the ingestion schema)"""
+    return values.isna().to_numpy()
+
+def not_positive(values):
+    """Mask of values that are present and not above zero"""
+    return values.to_numpy(dtype='float64', na_value=np.nan) <= 0
+
+def earlier_than(later, earlier):
+    """Mask of rows where the later date lies before the earlier one (missing dates pass)"""
+    return later.to_numpy() < earlier.to_numpy()
+
+# Rule -> (function returning the mask of failing rows, columns it is given)
+QUALITY_RULES = {
+    **{f"{col} missing": (is_missing, [col]) for col in REQUIRED_COLUMNS},
+    'Sum of Gallons Collected <= 0': (not_positive, ['Sum of Gallons Collected']),
+    'Discharged Date before Collected Date': (earlier_than, ['Discharged Date', 'Collected Date']),
+    'Collected Date before Initiated Date': (earlier_than, ['Collected Date', 'Initiated Date'])
+}
+
+def validate_service_data(df):
+    """Evaluate the QUALITY_RULES whose columns df holds
+
+    Returns a dict with the failing-row mask of each rule ('violations') and
+    the mask of rows failing any of them ('invalid').
+    """
+    violations = {}
+    for rule, (func, columns) in QUALITY_RULES.items():
+        if all(col in df.columns for col in columns):
+            violations[rule] = func(*[df[col] for col in columns])
+    invalid = np.zeros(len(df), dtype=bool)
+    for mask in violations.values():
+        invalid |= mask
+    return {'violations': violations, 'invalid': invalid}
+
+def quality_summary(validation):
+    """Rows checked, rows failing any rule and failing rows per rule"""
+    return {
+        'rows': len(validation['invalid']),
+        'invalid_rows': int(validation['invalid'].sum()),
+        'rules': {rule: int(mask.sum()) for rule, mask in validation['violations'].items()}
+    }
+
+def merge_quality_summaries(left, right):
+    """Summary of the rows of two quality summaries together"""
+    if left is None:
+        return right
+    rules = dict(left['rules'])
+    for rule, count in right['rules'].items():
+        rules[rule] = rules.get(rule, 0) + count
+    return {'rows': left['rows'] + right['rows'], 'invalid_rows': left['invalid_rows'] + right['invalid_rows'],
+            'rules': rules}
+
+def print_quality_summary(summary, excluded=False):
+    """Report the rules rows fail, one line per rule with failures"""
+    if not summary['invalid_rows']:
+        print(f"Data quality: all {summary['rows']:,} rows pass {len(summary['rules'])} rules")
+        return
+    action = 'excluded' if excluded else 'kept'
+    print(f"[WARNING] {summary['invalid_rows']:,} of {summary['rows']:,} rows fail data-quality rules ({action}):")
+    for rule, count in summary['rules'].items():
+        if count:
+            print(f"  - {rule}: {count:,}")
+
+def write_quarantine(df, validation, path, append=False):
+    """Write the rows failing any rule to a CSV file, with the rules each fails
+
+    With append=True the rows are added to an existing file (without a header).
+    Returns the number of rows written.
+    """
+    invalid = validation['invalid']
+    rows = df[invalid].copy()
+    failed = [np.where(mask[invalid], rule, '') for rule, mask in validation['violations'].items() if mask.any()]
+    rows[VIOLATIONS_COLUMN] = ['; '.join(filter(None, names)) for names in zip(*failed)] if failed else []
+    rows.to_csv(path, mode='a' if append else 'w', header=not append, index=False)
+    return len(rows)
+
+def apply_quality_rules(df, exclude_invalid=False, quarantine_path=None, append=False):
+    """Check df against the QUALITY_RULES, optionally quarantining and excluding failing rows
+
+    Returns the frame (without the failing rows if exclude_invalid, df itself
+    otherwise) and the quality summary. Nothing is printed, so chunked callers
+    can merge the summaries of their chunks first.
+    """
+    validation = validate_service_data(df)
+    if quarantine_path:
+        write_quarantine(df, validation, quarantine_path, append=append)
+    if exclude_invalid and validation['invalid'].any():
+        df = df[~validation['invalid']].reset_index(drop=True)
+    return df, quality_summary(validation)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Derived columns of the service frame, computed on demand
+Every derived column is registered with the function that computes it from
+base columns. A column is computed the first time it is asked for on a frame
+and cached for that frame; the frame itself is never modified. Calendar columns
+take integer fast paths: dates are reduced to day numbers, and month and
+weekday labels are formatted once per distinct value instead of once per row.
+"""
+
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# Weekday names by ISO weekday number - 1 (as Series.dt.day_name)
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Derived columns computed so far, per frame; an entry is dropped when its frame is collected
+_computed = {}
+
+def day_numbers(dates):
+    """Days since 1970-01-01 of a date column, and the mask of missing dates"""
+    values = dates.to_numpy(dtype='datetime64[ns]')
+    missing = np.isnat(values)
+    return values.astype('datetime64[D]').view(np.int64), missing
+
+def label_column(labels, missing):
+    """Text column of labels, NaN where missing (the dtype strftime/day_name return)"""
+    labels = labels.astype(object)
+    labels[missing] = np.nan
+    return pd.Series(labels).array
+
+def day_difference(later, earlier):
+    """Whole days from earlier to later"""
+    return (later - earlier).dt.days
+
+def month_label(dates):
+    """YYYY-MM of each date, formatted once per distinct month"""
+    days, missing = day_numbers(dates)
+    months = days.astype('datetime64[D]').astype('datetime64[M]').view(np.int64)
+    codes, uniques = pd.factorize(months)
+    labels = np.datetime_as_string(uniques.astype('datetime64[M]'), unit='M')
+    return label_column(labels[codes], missing)
+
+def weekday_numbers(days):
+    """ISO weekday - 1 (Monday = 0) of day numbers; 1970-01-01 was a Thursday"""
+    return (days + 3) % 7
+
+def iso_week(dates):
+    """ISO week number of each date (as Series.dt.isocalendar().week)"""
+    days, missing = day_numbers(dates)
+    thursday = days - weekday_numbers(days) + 3
+    year_start = thursday.astype('datetime64[D]').astype('datetime64[Y]').astype('datetime64[D]').view(np.int64)
+    weeks = (thursday - year_start) // 7 + 1
+    return pd.arrays.IntegerArray(weeks.astype(np.uint32), missing)
+
+def weekday_name(dates):
+    """Weekday name of each date"""
+    days, missing = day_numbers(dates)
+    return label_column(np.array(WEEKDAY_NAMES, dtype=object)[weekday_numbers(days)], missing)
+
+def hour_of_day(dates):
+    """Hour of each timestamp, float with NaN where the date is missing (as Series.dt.hour)"""
+    values = dates.to_numpy(dtype='datetime64[ns]')
+    missing = np.isnat(values)
+    hours = values.view(np.int64) % (86400 * 10**9) // (3600 * 10**9)
+    if not missing.any():
+        return hours.astype(np.int32)
+    hours = hours.astype(np.float64)
+    hours[missing] = np.nan
+    return hours
+
+# Derived column -> (function, base columns it is computed from)
+DERIVED_COLUMNS = {
+    'Collection_Duration_Days': (day_difference, ['Discharged Date', 'Collected Date']),
+    'Initiation_to_Collection_Days': (day_difference, ['Collected Date', 'Initiated Date']),
+    'Month': (month_label, ['Collected Date']),
+    'Week': (iso_week, ['Collected Date']),
+    'Day_of_Week': (weekday_name, ['Collected Date']),
+    'Hour': (hour_of_day, ['Collected Date'])
+}
+
+def derived_column(df, name):
+    """Derived column name of df, computed on first use and cached for that frame
+
+    A column df already holds is returned as is. Frames are treated as
+    immutable: the cache is not invalidated if their base columns change.
+    """
+    if name in df.columns:
+        return df[name]
+    key = id(df)
+    if key not in _computed:
+        _computed[key] = {}
+        weakref.finalize(df, _computed.pop, key, None)
+    columns = _computed[key]
+    if name not in columns:
+        func, sources = DERIVED_COLUMNS[name]
+        columns[name] = pd.Series(func(*[df[col] for col in sources]), index=df.index, name=name)
+    return columns[name]
+
+def with_derived_columns(df, names):
+    """df with the derived columns in names added, as a new frame; df itself if it has them all"""
+    missing = [name for name in names if name not in df.columns]
+    if not missing:
+        return df
+    return df.assign(**{name: derived_column(df, name) for name in missing})
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Columnar on-disk cache for cleaned data frames
+Stores a frame as Parquet together with a fingerprint (size, mtime, SHA-256) of
+the source file it was built from, and reuses it until the source changes
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+CACHE_DIR = '.pie_cache'
+
+# Parquet row group size; smaller groups let filtered reads skip more of the file
+ROW_GROUP_SIZE = 65536
+
+def parquet_available():
+    """Check whether a Parquet engine is installed"""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def file_sha256(path, block_size=1 << 20):
+    """Hash a file in fixed-size blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_fingerprint(path):
+    """Fingerprint a source file by size, modification time and content hash"""
+    stat = os.stat(path)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': file_sha256(path)
+    }
+
+def cache_base(source_path, name, cache_dir=CACHE_DIR):
+    """Path prefix of the cache entries built from source_path under name"""
+    stem = os.path.splitext(os.path.basename(source_path))[0].replace(' ', '_')
+    return os.path.join(cache_dir, f"{stem}.{name}")
+
+def staging_path(path):
+    """Unique temporary file next to path, written before it is moved over path with os.replace
+
+    Every process gets its own name, so writers that start together on a
+    cold cache do not clobber each other's staging files.
+    """
+    fd, staging = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+    os.close(fd)
+    return staging
+
+def cache_paths(source_path, name, cache_dir=CACHE_DIR):
+    """Return the (data, metadata) paths of a cached frame"""
+    base = cache_base(source_path, name, cache_dir)
+    return f"{base}.parquet", f"{base}.json"
+
+def read_cache_meta(meta_path, version):
+    """Metadata of a cache entry if it exists and has the given version, else None"""
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('version') == version else None
+
+def source_unchanged(meta, source_path):
+    """Check that the source file still matches the fingerprint in a cache entry's metadata
+
+    Size and mtime are checked first; the content hash is only recomputed when
+    the size matches but the mtime changed (e.g. the file was touched or copied).
+    """
+    stat = os.stat(source_path)
+    source = meta.get('source', {})
+    if source.get('size') != stat.st_size:
+        return False
+    return source.get('mtime_ns') == stat.st_mtime_ns or source.get('sha256') == file_sha256(source_path)
+
+def cached_frame_current(source_path, name, version, cache_dir=CACHE_DIR):
+    """Check whether a cached frame exists and was built from the current source file"""
+    if not parquet_available():
+        return False
+
+    data_path, meta_path = cache_paths(source_path, name, cache_dir)
+    if not os.path.exists(data_path):
+        return False
+
+    meta = read_cache_meta(meta_path, version)
+    return meta is not None and source_unchanged(meta, source_path)
+
+def load_cached_frame(source_path, name, version, cache_dir=CACHE_DIR, filters=None):
+    """Load a cached frame if it was built from the current source file
+
+    Optional pyarrow filters are pushed down so only matching rows are read.
+    Returns None on any miss.
+    """
+    if not cached_frame_current(source_path, name, version, cache_dir):
+        return None
+
+    data_path, _ = cache_paths(source_path, name, cache_dir)
+
+    try:
+        return pd.read_parquet(data_path, filters=filters)
+    except Exception as e:
+        print(f"[WARNING] Ignoring unreadable cache {data_path}: {e}")
+        return None
+
+def store_cached_frame(df, source_path, name, version, cache_dir=CACHE_DIR):
+    """Write a frame and its source fingerprint to the cache"""
+    if not parquet_available():
+        print("[WARNING] pyarrow not installed - frame cache disabled")
+        return None
+
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path, meta_path = cache_paths(source_path, name, cache_dir)
+
+    # Write to temporary files first so readers never see a partial cache entry
+    data_staging, meta_staging = staging_path(data_path), staging_path(meta_path)
+    try:
+        df.to_parquet(data_staging, index=False, row_group_size=ROW_GROUP_SIZE)
+        with open(meta_staging, 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'source': file_fingerprint(source_path), 'rows': len(df)}, f, indent=2)
+        os.replace(data_staging, data_path)
+        os.replace(meta_staging, meta_path)
+    finally:
+        for staging in (data_staging, meta_staging):
+            if os.path.exists(staging):
+                os.remove(staging)
+    return data_path
+
+def cache_chunks(chunks, source_path, name, version, cache_dir=CACHE_DIR):
+    """Pass frames through while writing them to the cache as one frame
+
+    Each chunk is appended as row groups of up to ROW_GROUP_SIZE rows with a
+    pyarrow ParquetWriter as soon as it is read, so warming the cache never
+    holds more than one chunk. Chunks must have the columns of the first and
+    types castable to its types; otherwise caching stops and the remaining
+    chunks are only passed through. The entry is published once the chunks
+    are exhausted, with the fingerprint the source had before the first was
+    read; if the consumer stops early nothing is stored.
+    """
+    if not parquet_available():
+        print("[WARNING] pyarrow not installed - frame cache disabled")
+        yield from chunks
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path, meta_path = cache_paths(source_path, name, cache_dir)
+    source = file_fingerprint(source_path)
+    data_staging, meta_staging = staging_path(data_path), staging_path(meta_path)
+    writer, rows, caching = None, 0, True
+    try:
+        for chunk in chunks:
+            if caching:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(data_staging, table.schema)
+                try:
+                    writer.write_table(table.cast(writer.schema), row_group_size=ROW_GROUP_SIZE)
+                    rows += len(chunk)
+                except (pa.ArrowException, ValueError) as e:
+                    print(f"[WARNING] Frame cache skipped: a chunk of {source_path} does not match the first ({e})")
+                    writer.close()
+                    writer, caching = None, False
+            yield chunk
+
+        if writer is not None:
+            writer.close()
+            writer = None
+            with open(meta_staging, 'w', encoding='utf-8') as f:
+                json.dump({'version': version, 'source': source, 'rows': rows}, f, indent=2)
+            os.replace(data_staging, data_path)
+            os.replace(meta_staging, meta_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        for staging in (data_staging, meta_staging):
+            if os.path.exists(staging):
+                os.remove(staging)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Secondary indexes over the service frame for point and range lookups
+Built once after loading: for each indexed column the row positions grouped by
+key (with the offset where each key's group starts), and the dated rows sorted
+by Collected Date. Slicing one key or date range out of the frame is then a
+dictionary lookup or binary search instead of a scan of the whole column.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Columns indexed by build_frame_index: entity, area and provider lookups
+INDEXED_COLUMNS = ['New E ID', 'Area', 'Service Provider']
+
+def build_key_index(values):
+    """Group the row positions of a column by key
+
+    Returns a dict with the distinct non-null 'keys' (in order of first
+    appearance), 'lookup' from key to its number, 'order' with the row
+    positions grouped by key (ascending within each group) and 'offsets',
+    where key number k's positions are order[offsets[k]:offsets[k + 1]].
+    """
+    codes, keys = pd.factorize(values)
+    order = np.argsort(codes, kind='stable')
+    offsets = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+    return {
+        'keys': keys,
+        'lookup': {key: number for number, key in enumerate(keys)},
+        'order': order,
+        'offsets': offsets
+    }
+
+def key_positions(key_index, key):
+    """Row positions holding key, in ascending order (empty if it does not occur)"""
+    number = key_index['lookup'].get(key)
+    if number is None:
+        return key_index['order'][:0]
+    return key_index['order'][key_index['offsets'][number]:key_index['offsets'][number + 1]]
+
+def build_date_index(df):
+    """Sort the dated rows of a loaded extract by Collected Date once
+
+    Returns the row positions in date order and their dates, so any period can
+    be sliced out with a binary search (see slice_period).
+    """
+    collected = df['Collected Date'].to_numpy()
+    dated = np.flatnonzero(~np.isnat(collected))
+    order = dated[np.argsort(collected[dated], kind='stable')]
+    return order, collected[order]
+
+def date_positions(date_index, start=None, end=None):
+    """Row positions whose Collected Date lies in the inclusive [start, end] range, in date order"""
+    order, dates = date_index
+    lo = np.searchsorted(dates, pd.to_datetime(start).to_datetime64(), side='left') if start is not None else 0
+    hi = np.searchsorted(dates, pd.to_datetime(end).to_datetime64(), side='right') if end is not None else len(dates)
+    return order[lo:hi]
+
+def slice_period(df, date_index, period):
+    """Rows of df whose Collected Date lies in the period, in their original order"""
+    return df.iloc[np.sort(date_positions(date_index, period['start'], period['end']))].reset_index(drop=True)
+
+def restrict_key_index(key_index, inside, remap):
+    """Key index of the rows marked inside, from the key index of the whole column
+
+    Keys keep their numbers; only those with rows inside are listed in 'keys'
+    and 'lookup' (in order of first appearance among those rows), and positions
+    become remap[position], the row's position among them.
+    """
+    keep = inside[key_index['order']]
+    offsets = np.r_[0, np.cumsum(keep)][key_index['offsets']]
+    order = remap[key_index['order'][keep]]
+    present = np.flatnonzero(np.diff(offsets))
+    present = present[np.argsort(order[offsets[present]], kind='stable')]
+    keys = key_index['keys'][present]
+    return {
+        'keys': keys,
+        'lookup': dict(zip(keys, present)),
+        'order': order,
+        'offsets': offsets
+    }
+
+def restrict_frame_index(frame_index, positions, rows):
+    """Index of df.iloc[positions] from the index of df (rows long); positions must be ascending
+
+    Answers every lookup as build_frame_index of the selected rows would,
+    without grouping or sorting them again.
+    """
+    inside = np.zeros(rows, dtype=bool)
+    inside[positions] = True
+    remap = np.cumsum(inside) - 1
+    order, dates = frame_index['dates']
+    keep = inside[order]
+    return {
+        'columns': {col: restrict_key_index(key_index, inside, remap) for col, key_index in frame_index['columns'].items()},
+        'dates': (remap[order[keep]], dates[keep])
+    }
+
+def build_frame_index(df, columns=INDEXED_COLUMNS):
+    """Key indexes of the indexed columns present in df, and its date index"""
+    return {
+        'columns': {col: build_key_index(df[col]) for col in columns if col in df.columns},
+        'dates': build_date_index(df)
+    }
+
+def rows_for_key(df, frame_index, column, key):
+    """Rows of df where column equals key, in their original order (as df[df[column] == key])"""
+    return df.iloc[key_positions(frame_index['columns'][column], key)]
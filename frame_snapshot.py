@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped columnar snapshot of a cleaned data frame
+Kept next to the Parquet cache: categorical codes, dates, integer values and
+null masks are stored as .npy arrays and text columns in an uncompressed Arrow
+IPC file. Loading maps the files read-only instead of decoding them, so it is
+near-instant and every process that loads the snapshot (report runs side by
+side, their pool workers) shares the same physical pages of the page cache.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from frame_cache import CACHE_DIR, cache_base, file_fingerprint, parquet_available, read_cache_meta, source_unchanged
+
+# Bump whenever the snapshot layout changes
+SNAPSHOT_FORMAT = 1
+
+STRINGS_FILE = 'strings.arrow'
+
+# Nullable array types stored as a values array plus a null mask
+MASKED_ARRAYS = (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)
+
+def snapshot_dir(source_path, name, cache_dir=CACHE_DIR):
+    """Directory of the snapshot of the frame built from source_path under name"""
+    return f"{cache_base(source_path, name, cache_dir)}.snapshot"
+
+def column_layout(series):
+    """How a column is stored: its kind and the metadata needed to rebuild it, or None if unsupported"""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype) and pd.api.types.is_string_dtype(dtype.categories):
+        return {'kind': 'category', 'categories': dtype.categories.tolist(), 'ordered': bool(dtype.ordered)}
+    if isinstance(dtype, pd.StringDtype):
+        return {'kind': 'string', 'dtype': str(dtype)}
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.construct_array_type() in MASKED_ARRAYS:
+        return {'kind': 'masked', 'dtype': str(dtype)}
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufmM':
+        return {'kind': 'numpy'}
+    return None
+
+def store_snapshot(df, source_path, name, version, cache_dir=CACHE_DIR):
+    """Write a frame as a memory-mappable snapshot, with the fingerprint of its source file
+
+    Returns the snapshot directory, or None if the frame has a column type the
+    snapshot cannot hold or pyarrow is not installed.
+    """
+    if not parquet_available():
+        return None
+
+    layouts = [column_layout(df[col]) for col in df.columns]
+    unsupported = [col for col, layout in zip(df.columns, layouts) if layout is None]
+    if unsupported:
+        print(f"[WARNING] Snapshot skipped: unsupported column types in {', '.join(unsupported)}")
+        return None
+
+    path = snapshot_dir(source_path, name, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=cache_dir, prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        write_snapshot_files(df, layouts, staging, version, source_path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Swap the complete snapshot in; processes still mapping the old files keep them until they exit.
+    # If another process swapped its snapshot in first, it was built from the same source, so it is kept.
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.replace(staging, path)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+    return path
+
+def write_snapshot_files(df, layouts, staging, version, source_path):
+    """Write the column files and metadata of a snapshot into the staging directory"""
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    columns, strings = [], {}
+    for position, (col, layout) in enumerate(zip(df.columns, layouts)):
+        values = df[col].array
+        stem = os.path.join(staging, str(position))
+        if layout['kind'] == 'category':
+            np.save(f"{stem}.codes.npy", values.codes)
+        elif layout['kind'] == 'string':
+            strings[str(position)] = pa.array(values, type=pa.large_string(), from_pandas=True)
+        elif layout['kind'] == 'masked':
+            np.save(f"{stem}.values.npy", values.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0))
+            np.save(f"{stem}.mask.npy", values.isna())
+        else:
+            np.save(f"{stem}.values.npy", df[col].to_numpy())
+        columns.append({'name': col, **layout})
+
+    table = pa.table(strings) if strings else pa.table({})
+    with ipc.new_file(os.path.join(staging, STRINGS_FILE), table.schema) as writer:
+        writer.write_table(table)
+    with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'format': SNAPSHOT_FORMAT, 'source': file_fingerprint(source_path),
+                   'rows': len(df), 'columns': columns}, f, indent=2)
+
+def load_snapshot(source_path, name, version, cache_dir=CACHE_DIR):
+    """Map the snapshot of a frame read-only if it was built from the current source file
+
+    Columns are backed by the mapped files, so the frame is not writable in
+    place; assigning new or replaced columns works as usual. Returns None on any miss.
+    """
+    if not parquet_available():
+        return None
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    path = snapshot_dir(source_path, name, cache_dir)
+    meta = read_cache_meta(os.path.join(path, 'meta.json'), version)
+    if meta is None or meta.get('format') != SNAPSHOT_FORMAT or not source_unchanged(meta, source_path):
+        return None
+
+    # Empty arrays cannot be mapped
+    mmap_mode = 'r' if meta['rows'] else None
+    try:
+        strings = ipc.open_file(pa.memory_map(os.path.join(path, STRINGS_FILE))).read_all()
+        data = {}
+        for position, column in enumerate(meta['columns']):
+            stem = os.path.join(path, str(position))
+            if column['kind'] == 'category':
+                dtype = pd.CategoricalDtype(column['categories'], ordered=column['ordered'])
+                values = pd.Categorical.from_codes(np.load(f"{stem}.codes.npy", mmap_mode=mmap_mode),
+                                                   dtype=dtype, validate=False)
+            elif column['kind'] == 'string':
+                values = pd.array(strings.column(str(position)), dtype=column['dtype'])
+            elif column['kind'] == 'masked':
+                array_type = pd.api.types.pandas_dtype(column['dtype']).construct_array_type()
+                values = array_type(np.load(f"{stem}.values.npy", mmap_mode=mmap_mode),
+                                    np.load(f"{stem}.mask.npy", mmap_mode=mmap_mode))
+            else:
+                values = np.load(f"{stem}.values.npy", mmap_mode=mmap_mode)
+            data[column['name']] = values
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[WARNING] Ignoring unreadable snapshot {path}: {e}")
+        return None
+    return pd.DataFrame(data, copy=False)
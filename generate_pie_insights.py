@@ -1,285 +1,771 @@
 #!/usr/bin/env python3
 """
 Pie AI Assistant Data Generator
-Generates optimized Q1 2023 insights for Dubai grease collection with intelligent delay analysis
+Generates optimized insights for Dubai grease collection with intelligent delay analysis,
+for Q1 2023 by default or any quarter/month/date range, one at a time or in batch
 Target: 35K-40K tokens for GPT-5 integration
 """
 
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import json
-from collections import Counter, defaultdict
+from datetime import timedelta
 import re
+import os
 
-def load_q1_2023_data():
+from aggregation_cube import (CUBOIDS, appearance_order, build_aggregation_cube, build_partitioned_cube, cells,
+                              cube_histogram, cube_value_counts, distinct, first_value, group_totals, merge_cubes,
+                              mode_value, partition_cube, rollup, select_cuboid, total)
+from column_profile import histogram_describe, histogram_median, histogram_quantile, histogram_std
+from data_quality import apply_quality_rules, merge_quality_summaries, print_quality_summary
+from frame_index import build_date_index, date_positions
+from incremental_state import (advance_state, applied_digest, load_state, merge_applied_digests, new_state,
+                               read_new_rows, same_digest, store_state)
+from insights_budget import BudgetError, compile_insights
+from json_output import estimate_tokens, write_json
+from section_runner import map_row_ranges, parse_workers, run_sections
+from service_data import CSV_PATH, date_window_mask, load_service_data
+from stage_trace import finish_trace, parse_trace_options, start_trace, traced_stage
+
+# Analysis period used when none is given
+DEFAULT_PERIOD = '2023Q1'
+
+# Delays are assessed this many days after the end of the period unless a reference date is given
+REFERENCE_LAG_DAYS = 10
+
+# Cuboids the insight sections read besides the CUBOIDS: gallon and turnaround
+# histograms, weekly volumes, monthly gallons per area and the per-entity measures
+PIE_CUBOIDS = CUBOIDS + [
+    ('Sum of Gallons Collected',),
+    ('Initiation_to_Collection_Days',),
+    ('Week',),
+    ('Area', 'Month'),
+    ('New E ID', 'Month', 'Assigned Vehicle'),
+    ('New E ID', 'Entity Mapping.Outlet', 'Category', 'Area', 'Zone', 'Service Provider')
+]
+
+# Cuboids over New E ID built with every measure instead of as pair tables
+PIE_ENTITY_CUBOIDS = PIE_CUBOIDS[-2:]
+
+# Dimensions of the per-entity cuboid, and the columns of entity_volumes read from it
+ENTITY_PROFILE = PIE_CUBOIDS[-1]
+ENTITY_FIRST_VALUES = {
+    'Outlet': 'Entity Mapping.Outlet',
+    'Category': 'Category',
+    'Area': 'Area',
+    'Zone': 'Zone',
+    'Provider': 'Service Provider'
+}
+
+# --batch frequencies -> pandas period frequency
+BATCH_FREQUENCIES = {'quarter': 'Q', 'month': 'M'}
+
+def analysis_period(spec=DEFAULT_PERIOD, reference_date=None):
+    """Describe an analysis period
+
+    spec is a quarter ('2023Q1'), month ('2023-02'), year ('2023') or an inclusive
+    date range ('2023-01-01:2023-06-30'). Returns a dict with the start and end
+    dates, display labels, the output file slug and the reference date that
+    delays are measured against.
+    """
+    if ':' in spec:
+        start, end = (pd.to_datetime(part) for part in spec.split(':'))
+        label = f"{start:%Y-%m-%d} to {end:%Y-%m-%d}"
+        slug = f"{start:%Y%m%d}_{end:%Y%m%d}"
+        description = short_label = label
+    else:
+        period = pd.Period(spec)
+        start, end = period.start_time.normalize(), period.end_time.normalize()
+        if period.freqstr.startswith('Q'):
+            label = f"Q{period.quarter} {period.year}"
+            slug = f"q{period.quarter}_{period.year}"
+            description = f"{label} ({start:%B} - {end:%B %Y})"
+            short_label = f"{label} ({start:%b}-{end:%b})"
+        elif period.freqstr.startswith('M'):
+            label = f"{start:%B %Y}"
+            slug = f"{start:%Y_%m}"
+            description = short_label = label
+        else:
+            label = slug = str(period)
+            description = f"{label} ({start:%B} - {end:%B %Y})"
+            short_label = f"{label} ({start:%b}-{end:%b})"
+
+    if reference_date is None:
+        reference_date = end + timedelta(days=REFERENCE_LAG_DAYS)
+    return {
+        'start': start,
+        'end': end,
+        'label': label,
+        'description': description,
+        'short_label': short_label,
+        'slug': slug,
+        'days': (end - start).days + 1,
+        'reference_date': pd.to_datetime(reference_date)
+    }
+
+def load_period_data(period, use_cache=True, strict_schema=False, exclude_invalid=False, quarantine_path=None):
+    """Load and filter data for one analysis period
+
+    Rows failing a data-quality rule are reported, written to quarantine_path
+    if given and dropped with exclude_invalid=True.
+    """
+    return read_period_data(period, use_cache, strict_schema, exclude_invalid, quarantine_path)[0]
+
+def read_period_data(period, use_cache=True, strict_schema=False, exclude_invalid=False, quarantine_path=None):
+    """load_period_data, also returning the quality summary of the period's rows"""
+    print(f"Loading {period['label']} data...")
+    
+    # Load only the period's rows with dates and numeric columns converted
+    df_period = load_service_data(use_cache=use_cache, strict=strict_schema, start=period['start'], end=period['end'])
+    df_period, quality = apply_quality_rules(df_period, exclude_invalid, quarantine_path)
+    print_quality_summary(quality, exclude_invalid)
+    
+    print(f"{period['label']} dataset: {len(df_period):,} records")
+    return df_period, quality
+
+def load_q1_2023_data(use_cache=True, strict_schema=False):
     """Load and filter data for Q1 2023 only"""
-    print("Loading Q1 2023 data...")
-    
-    # Load the CSV file
-    df = pd.read_csv('public/Blue Data Analysis.csv')
-    
-    # Convert date columns
-    df['Collected Date'] = pd.to_datetime(df['Collected Date'], errors='coerce')
-    df['Discharged Date'] = pd.to_datetime(df['Discharged Date'], errors='coerce')
-    df['Initiated Date'] = pd.to_datetime(df['Initiated Date'], errors='coerce')
-    
-    # Filter to Q1 2023 only (Jan 1 - Mar 31, 2023)
-    q1_2023_start = pd.to_datetime('2023-01-01')
-    q1_2023_end = pd.to_datetime('2023-03-31')
-    
-    df_q1 = df[
-        (df['Collected Date'] >= q1_2023_start) & 
-        (df['Collected Date'] <= q1_2023_end)
-    ].copy()
-    
-    # Clean numeric columns
-    df_q1['Sum of Gallons Collected'] = pd.to_numeric(df_q1['Sum of Gallons Collected'], errors='coerce')
-    df_q1['Sum of No of Traps'] = pd.to_numeric(df_q1['Sum of No of Traps'], errors='coerce')
-    df_q1['Trade License Number'] = pd.to_numeric(df_q1['Trade License Number'], errors='coerce')
-    
-    # Calculate operational metrics
-    df_q1['Collection_Duration_Days'] = (df_q1['Discharged Date'] - df_q1['Collected Date']).dt.days
-    df_q1['Initiation_to_Collection_Days'] = (df_q1['Collected Date'] - df_q1['Initiated Date']).dt.days
-    df_q1['Month'] = df_q1['Collected Date'].dt.strftime('%Y-%m')
-    df_q1['Week'] = df_q1['Collected Date'].dt.isocalendar().week
-    df_q1['Day_of_Week'] = df_q1['Collected Date'].dt.day_name()
-    
-    print(f"Q1 2023 dataset: {len(df_q1):,} records")
-    return df_q1
-
-def calculate_collection_patterns(df):
-    """Calculate intelligent collection patterns for delay analysis"""
+    return load_period_data(analysis_period('2023Q1'), use_cache=use_cache, strict_schema=strict_schema)
+
+def calculate_collection_patterns(df, reference_date, collections=None, cube=None):
+    """Calculate intelligent collection patterns for delay analysis as of reference_date
+
+    The entity patterns and the interval table are read from the collection
+    state of df's rows (see collection_state) and the counts and volumes from
+    their cube (see build_pie_cube), each built here unless given; df is not
+    read when both are.
+    """
     print("Calculating collection patterns...")
+    if collections is None:
+        collections = collection_state(df)
+    cube = cube if cube is not None else build_pie_cube(df)
     
     patterns = {}
-    reference_date = pd.to_datetime('2023-04-10')
-    
+
     # Entity-level patterns (by Trade License)
-    entity_patterns = []
-    for trade_license in df['Trade License Number'].dropna().unique():
-        entity_data = df[df['Trade License Number'] == trade_license].sort_values('Collected Date')
-        
-        if len(entity_data) >= 2:
-            # Calculate average interval between collections
-            intervals = []
-            for i in range(1, len(entity_data)):
-                interval = (entity_data.iloc[i]['Collected Date'] - entity_data.iloc[i-1]['Collected Date']).days
-                if 1 <= interval <= 120:  # Reasonable interval range
-                    intervals.append(interval)
-            
-            if intervals:
-                avg_interval = np.mean(intervals)
-                last_collection = entity_data.iloc[-1]['Collected Date']
-                days_since_last = (reference_date - last_collection).days
-                expected_next = last_collection + timedelta(days=avg_interval)
-                days_overdue = (reference_date - expected_next).days
-                
-                entity_patterns.append({
-                    'trade_license': int(trade_license),
-                    'entity_id': entity_data.iloc[-1]['New E ID'],
-                    'outlet_name': entity_data.iloc[-1]['Entity Mapping.Outlet'],
-                    'category': entity_data.iloc[-1]['Category'],
-                    'area': entity_data.iloc[-1]['Area'],
-                    'zone': entity_data.iloc[-1]['Zone'],
-                    'collections_count': len(entity_data),
-                    'avg_interval_days': round(avg_interval, 1),
-                    'last_collection_date': last_collection.strftime('%Y-%m-%d'),
-                    'days_since_last': days_since_last,
-                    'days_overdue': max(0, days_overdue),
-                    'risk_level': get_risk_level(days_overdue),
-                    'avg_gallons': round(entity_data['Sum of Gallons Collected'].mean(), 1)
-                })
-    
-    patterns['entities'] = entity_patterns
+    patterns['entities'] = entity_patterns(collections['licenses'], reference_date)
+    
+    # Consecutive-collection intervals shared by every dimension summary
+    intervals = collections['intervals']
+    patterns['intervals'] = intervals
     
     # Category-level patterns
+    category_intervals = summarize_intervals(intervals, 'category')
+    category_volumes = rollup(cube, 'Category')
+    category_counts = category_volumes['collections']
+    category_avg_gallons = category_volumes['gallons_mean']
     category_patterns = {}
-    for category in df['Category'].unique():
-        category_data = df[df['Category'] == category]
-        intervals = calculate_category_intervals(category_data)
+    for category in appearance_order(cube, 'Category'):
+        avg_interval = category_intervals.get(category)
         category_patterns[category] = {
-            'avg_interval_days': round(np.mean(intervals), 1) if intervals else 14,
-            'collections': len(category_data),
-            'avg_gallons': round(category_data['Sum of Gallons Collected'].mean(), 1)
+            'avg_interval_days': round(avg_interval, 1) if avg_interval is not None else 14,
+            'collections': int(category_counts.get(category, 0)),
+            'avg_gallons': round(category_avg_gallons.get(category, np.nan), 1)
         }
     
     patterns['categories'] = category_patterns
     
     # Geographic patterns
+    area_intervals = summarize_intervals(intervals, 'area')
+    area_volumes = rollup(cube, 'Area', distinct=['New E ID'])
+    area_counts = area_volumes['collections']
+    area_avg_gallons = area_volumes['gallons_mean']
+    area_entities = area_volumes['distinct:New E ID']
     geographic_patterns = {}
-    for area in df['Area'].unique():
-        area_data = df[df['Area'] == area]
-        intervals = calculate_area_intervals(area_data)
+    for area in appearance_order(cube, 'Area'):
+        avg_interval = area_intervals.get(area)
         geographic_patterns[area] = {
-            'avg_interval_days': round(np.mean(intervals), 1) if intervals else 14,
-            'collections': len(area_data),
-            'avg_gallons': round(area_data['Sum of Gallons Collected'].mean(), 1),
-            'unique_entities': area_data['New E ID'].nunique()
+            'avg_interval_days': round(avg_interval, 1) if avg_interval is not None else 14,
+            'collections': int(area_counts.get(area, 0)),
+            'avg_gallons': round(area_avg_gallons.get(area, np.nan), 1),
+            'unique_entities': int(area_entities.get(area, 0))
         }
     
     patterns['geographic'] = geographic_patterns
     
     return patterns
 
+# Columns of the entity pattern frame
+ENTITY_COLUMNS = [
+    'trade_license', 'entity_id', 'outlet_name', 'category', 'area', 'zone', 'collections_count',
+    'avg_interval_days', 'last_collection_date', 'days_since_last', 'days_overdue', 'risk_level', 'avg_gallons'
+]
+
+# Risk levels from least to most urgent, and the inclusive days-overdue upper bound of all but the last
+RISK_LEVELS = ['normal', 'upcoming', 'warning', 'critical']
+RISK_THRESHOLDS = [0, 5, 10]
+
+def calculate_entity_patterns(df, reference_date):
+    """Calculate per-license collection patterns as of reference_date (see license_state)"""
+    return entity_patterns(license_state(df), reference_date)
+
+def entity_patterns(licenses, reference_date):
+    """Entity patterns of a license state as of reference_date
+
+    Only intervals in the 1-120 day range count towards the average, and only
+    licenses with at least one are kept. Averages are rounded with numpy's
+    rounding, as round() of the np.float64 means of the per-license loop was
+    (round(np.float64(0.15), 1) is 0.2, not 0.1). A license without gallons
+    averages NaN, as the loop's float64 mean did. Returns one row per license
+    with ENTITY_COLUMNS, risk_level as a categorical.
+    """
+    licenses = licenses[licenses['interval_count'].to_numpy() > 0]
+    avg_intervals = (licenses['interval_sum'] / licenses['interval_count']).to_numpy()
+    gallons_counts = licenses['gallons_count'].to_numpy()
+    avg_gallons = np.where(gallons_counts > 0, licenses['gallons_sum'].to_numpy() / np.maximum(gallons_counts, 1), np.nan)
+
+    last_collections = pd.DatetimeIndex(licenses['last_date'])
+    expected_next = last_collections + pd.to_timedelta(avg_intervals, unit='D')
+    days_since_last = (reference_date - last_collections).days
+    days_overdue = (reference_date - expected_next).days.to_numpy()
+
+    return pd.DataFrame({
+        'trade_license': licenses.index.to_numpy(dtype=np.int64),
+        'entity_id': licenses['entity_id'].to_numpy(),
+        'outlet_name': licenses['outlet_name'].to_numpy(),
+        'category': licenses['category'].to_numpy(),
+        'area': licenses['area'].to_numpy(),
+        'zone': licenses['zone'].to_numpy(),
+        'collections_count': licenses['collections'].to_numpy(),
+        'avg_interval_days': np.round(avg_intervals, 1),
+        'last_collection_date': last_collections.strftime('%Y-%m-%d'),
+        'days_since_last': days_since_last,
+        'days_overdue': np.maximum(days_overdue, 0),
+        'risk_level': get_risk_level(days_overdue),
+        'avg_gallons': np.round(avg_gallons, 1)
+    })
+
 def get_risk_level(days_overdue):
-    """Determine risk level based on days overdue"""
-    if days_overdue <= 0:
-        return 'normal'
-    elif days_overdue <= 5:
-        return 'upcoming'
-    elif days_overdue <= 10:
-        return 'warning'
-    else:
-        return 'critical'
-
-def calculate_category_intervals(category_data):
-    """Calculate intervals for a specific category"""
-    intervals = []
-    for entity_id in category_data['New E ID'].unique():
-        entity_data = category_data[category_data['New E ID'] == entity_id].sort_values('Collected Date')
-        if len(entity_data) >= 2:
-            for i in range(1, len(entity_data)):
-                interval = (entity_data.iloc[i]['Collected Date'] - entity_data.iloc[i-1]['Collected Date']).days
-                if 1 <= interval <= 120:
-                    intervals.append(interval)
-    return intervals
-
-def calculate_area_intervals(area_data):
-    """Calculate intervals for a specific area"""
-    intervals = []
-    for entity_id in area_data['New E ID'].unique():
-        entity_data = area_data[area_data['New E ID'] == entity_id].sort_values('Collected Date')
-        if len(entity_data) >= 2:
-            for i in range(1, len(entity_data)):
-                interval = (entity_data.iloc[i]['Collected Date'] - entity_data.iloc[i-1]['Collected Date']).days
-                if 1 <= interval <= 120:
-                    intervals.append(interval)
-    return intervals
-
-def generate_pie_insights(df, patterns):
-    """Generate comprehensive 7-dimensional analysis for Pie AI"""
-    print("Generating Pie insights...")
-    
-    insights = {
-        "pie_assistant_context": {
-            "name": "Pie",
-            "company": "PivotPie",
-            "data_period": "Q1 2023 (January - March 2023)",
-            "scope": "Dubai Grease Trap Collection Analysis",
-            "reference_date": "2023-04-10",
-            "total_records": len(df),
-            "date_range": {
-                "start": "2023-01-01",
-                "end": "2023-03-31",
-                "analysis_date": "2023-04-10"
-            }
-        }
+    """Determine risk levels from an array of days overdue
+
+    normal: on time, upcoming: 1-5 days, warning: 6-10 days, critical: more than 10.
+    Returned as an ordered categorical so risk counts are a single bincount.
+    """
+    codes = np.digitize(days_overdue, RISK_THRESHOLDS, right=True)
+    return pd.Categorical.from_codes(codes, categories=RISK_LEVELS, ordered=True)
+
+def count_risk_levels(entities, by=None):
+    """Count entities per risk level in one pass, overall or per value of a column
+
+    Returns a Series indexed by risk level, or with by a table with one row per
+    value (in order of first appearance, missing values included) and one column
+    per risk level plus 'total'.
+    """
+    risk_codes = entities['risk_level'].cat.codes.to_numpy()
+    if by is None:
+        counts = np.bincount(risk_codes, minlength=len(RISK_LEVELS))
+        return pd.Series(counts, index=RISK_LEVELS)
+
+    key_codes, keys = pd.factorize(entities[by], use_na_sentinel=False)
+    counts = np.zeros((len(keys), len(RISK_LEVELS)), dtype=np.int64)
+    np.add.at(counts, (key_codes, risk_codes), 1)
+    table = pd.DataFrame(counts, index=pd.Index(keys, dtype=object), columns=RISK_LEVELS)
+    table['total'] = counts.sum(axis=1)
+    return table
+
+def group_means(entities, by, column):
+    """np.mean of column per value of by, over entities in their original order"""
+    key_codes, keys = pd.factorize(entities[by], use_na_sentinel=False)
+    order = np.argsort(key_codes, kind='stable')
+    bounds = np.flatnonzero(np.diff(key_codes[order])) + 1
+    values = np.split(entities[column].to_numpy()[order], bounds) if len(order) else []
+    return {key: np.mean(group) for key, group in zip(keys, values)}
+
+def collection_order(df, key_column):
+    """Sort the collections with a key and a Collected Date by key and date
+
+    Returns their row positions in sorted order and the group code of each
+    (keys numbered in order of first appearance). Collections of a key on the
+    same date keep their row order.
+    """
+    rows = np.flatnonzero((df[key_column].notna() & df['Collected Date'].notna()).to_numpy())
+    key_codes = pd.factorize(df[key_column].iloc[rows])[0]
+    order = np.lexsort((df['Collected Date'].to_numpy()[rows], key_codes))
+    return rows[order], key_codes[order]
+
+def restrict_collection_order(sorted_rows, positions, rows):
+    """collection_order of df.iloc[positions] from that of df (rows long); positions must be ascending
+
+    Each key's collections stay in date order, so only the keys are renumbered
+    by their first appearance among the selected rows.
+    """
+    positions_in, codes = sorted_rows
+    inside = np.zeros(rows, dtype=bool)
+    inside[positions] = True
+    keep = inside[positions_in]
+    positions_in, codes = positions_in[keep], codes[keep]
+    firsts, lasts = group_bounds(codes)
+    first_rows = np.minimum.reduceat(positions_in, firsts) if len(firsts) else firsts
+    numbers = np.empty(len(firsts), dtype=np.int64)
+    numbers[np.argsort(first_rows, kind='stable')] = np.arange(len(firsts))
+    codes = np.repeat(numbers, lasts - firsts + 1)
+    order = np.argsort(codes, kind='stable')
+    return (np.cumsum(inside) - 1)[positions_in[order]], codes[order]
+
+def sort_collection_intervals(df, key_column, sorted_rows=None):
+    """Sort collections once by key and date and diff consecutive collections within each key
+
+    Only collections with a key and a Collected Date are kept. Returns the
+    sorted frame, the group code of each sorted row (keys numbered in order of
+    first appearance) and the days since the previous collection of the same
+    key, NaN where there is none or it falls outside the 1-120 day range.
+    sorted_rows is the collection_order of df, if already known.
+    """
+    order, codes = sorted_rows if sorted_rows is not None else collection_order(df, key_column)
+    ordered = df.iloc[order]
+
+    intervals = ordered['Collected Date'].diff().dt.days.to_numpy(dtype=float, na_value=np.nan)
+    same_key = np.r_[False, codes[1:] == codes[:-1]]
+    in_range = same_key & (intervals >= 1) & (intervals <= 120)  # Reasonable interval range
+    return ordered, codes, np.where(in_range, intervals, np.nan)
+
+def group_bounds(codes):
+    """Positions of the first and last row of each group in an array of sorted group codes"""
+    changes = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    if not len(codes):
+        return changes, changes
+    return np.r_[0, changes], np.r_[changes - 1, len(codes) - 1]
+
+# License state column -> source column, taken from the license's last collection
+LICENSE_ATTRIBUTES = {
+    'entity_id': 'New E ID',
+    'outlet_name': 'Entity Mapping.Outlet',
+    'category': 'Category',
+    'area': 'Area',
+    'zone': 'Zone'
+}
+
+# License state columns added up when two states are merged
+LICENSE_SUMS = ['collections', 'interval_sum', 'interval_count', 'gallons_sum', 'gallons_count']
+
+def license_state(df, sorted_rows=None):
+    """Mergeable collection state per Trade License, in order of first appearance
+
+    Rows are sorted once by license and Collected Date (see
+    sort_collection_intervals, which takes sorted_rows). Each license keeps its
+    first and last collection dates, its LICENSE_SUMS (intervals in the 1-120
+    day range only) and the LICENSE_ATTRIBUTES of its last collection.
+    """
+    ordered, codes, intervals = sort_collection_intervals(df, 'Trade License Number', sorted_rows)
+    firsts, lasts = group_bounds(codes)
+    valid = ~np.isnan(intervals)
+    gallons = ordered['Sum of Gallons Collected'].to_numpy(dtype='float64', na_value=np.nan)
+    has_gallons = ~np.isnan(gallons)
+    dates = ordered['Collected Date'].to_numpy()
+    last_rows = ordered.iloc[lasts]
+
+    return pd.DataFrame({
+        'first_date': dates[firsts],
+        'last_date': dates[lasts],
+        'collections': np.bincount(codes, minlength=len(firsts)),
+        'interval_sum': np.bincount(codes[valid], weights=intervals[valid], minlength=len(firsts)),
+        'interval_count': np.bincount(codes[valid], minlength=len(firsts)),
+        'gallons_sum': np.bincount(codes[has_gallons], weights=gallons[has_gallons], minlength=len(firsts)),
+        'gallons_count': np.bincount(codes[has_gallons], minlength=len(firsts)),
+        **{name: last_rows[column].to_numpy(dtype=object) for name, column in LICENSE_ATTRIBUTES.items()}
+    }, index=pd.Index(last_rows['Trade License Number'].to_numpy(dtype=np.int64), name='trade_license'))
+
+# Interval table dimension -> source column
+INTERVAL_DIMENSIONS = {
+    'category': 'Category',
+    'sub_category': 'Sub Category',
+    'area': 'Area',
+    'zone': 'Zone',
+    'provider': 'Service Provider'
+}
+
+# Interval table columns added up when two states are merged
+INTERVAL_SUMS = ['interval_sum', 'interval_count']
+
+def dimension_intervals(ordered, codes, dimension, column):
+    """Interval sums per New E ID and value of one dimension, over rows sorted by entity and date
+
+    As calculate_category_intervals did, each entity's collections with the
+    same value are diffed in date order on their own, so collections with
+    another value in between do not split an interval. Rows without a value
+    are left out.
+    """
+    values = ordered[column]
+    value_codes, uniques = pd.factorize(values)
+    keep = np.flatnonzero(value_codes >= 0)
+    order = keep[np.lexsort((value_codes[keep], codes[keep]))]
+    group_codes = codes[order] * len(uniques) + value_codes[order]
+
+    dates = ordered['Collected Date'].iloc[order]
+    days = dates.diff().dt.days.to_numpy(dtype=float, na_value=np.nan)
+    same_group = np.r_[False, group_codes[1:] == group_codes[:-1]]
+    valid = same_group & (days >= 1) & (days <= 120)  # Reasonable interval range
+    groups = np.cumsum(~same_group) - 1
+    firsts, lasts = group_bounds(group_codes)
+    first_rows = ordered.iloc[order[firsts]]
+
+    return pd.DataFrame({
+        'first_date': dates.to_numpy()[firsts],
+        'last_date': dates.to_numpy()[lasts],
+        'interval_sum': np.bincount(groups[valid], weights=days[valid], minlength=len(firsts)),
+        'interval_count': np.bincount(groups[valid], minlength=len(firsts))
+    }, index=pd.MultiIndex.from_arrays([
+        np.full(len(firsts), dimension, dtype=object),
+        first_rows['New E ID'].to_numpy(dtype=object),
+        first_rows[column].to_numpy(dtype=object)
+    ], names=['dimension', 'entity_id', 'value']))
+
+def interval_state(df, sorted_rows=None):
+    """Mergeable table of consecutive-collection intervals per New E ID and dimension value
+
+    One row per entity and value of each of the INTERVAL_DIMENSIONS, holding
+    the sum and count of the 1-120 day intervals between the entity's
+    consecutive collections with that value and their first and last dates,
+    so any per-dimension interval statistic is a groupby on it (see
+    summarize_intervals). Rows are sorted by entity and date once (see
+    sort_collection_intervals, which takes sorted_rows) and each dimension
+    only regroups that order.
+    """
+    ordered, codes, _ = sort_collection_intervals(df, 'New E ID', sorted_rows)
+    return pd.concat([
+        dimension_intervals(ordered, codes, dimension, column)
+        for dimension, column in INTERVAL_DIMENSIONS.items() if column in ordered.columns
+    ])
+
+def build_interval_pool(df):
+    """Build the table of consecutive-collection intervals per New E ID (see interval_state)"""
+    return interval_state(df)
+
+def summarize_intervals(intervals, dimension):
+    """Average interval in days per value of a dimension of the interval table
+
+    Values without an interval in the 1-120 day range are left out.
+    """
+    totals = intervals.xs(dimension, level='dimension').groupby(level='value')[INTERVAL_SUMS].sum()
+    totals = totals[totals['interval_count'] > 0]
+    return totals['interval_sum'] / totals['interval_count']
+
+# Keys collections are sorted by for the collection state
+COLLECTION_KEYS = ['Trade License Number', 'New E ID']
+
+def collection_orders(df):
+    """collection_order of df by each of the COLLECTION_KEYS"""
+    return {key: collection_order(df, key) for key in COLLECTION_KEYS}
+
+def collection_state(df, orders=None):
+    """Collection state of a period's rows: everything calculate_collection_patterns reads besides df
+
+    Holds the license_state, the interval table of interval_state and the
+    number of rows. Its size follows the number of licenses and entities, and
+    the state of rows appended to the period can be merged in (see
+    merge_collection_states) instead of re-sorting the period.
+    orders are the collection_orders of df, if already known.
+    """
+    orders = orders or {}
+    intervals = interval_state(df, orders.get('New E ID'))
+    licenses = license_state(df, orders.get('Trade License Number'))
+    return {'rows': len(df), 'licenses': licenses, 'intervals': intervals}
+
+def bridging_intervals(old, new):
+    """Days from each key's last collection in old to its first in new, for the keys of both
+
+    Days outside the 1-120 day range are NaN. Returns None if a key's
+    collections in new start before its last one in old.
+    """
+    shared = old.index.intersection(new.index)
+    days = (new.loc[shared, 'first_date'] - old.loc[shared, 'last_date']).dt.days
+    if (days < 0).any():
+        return None
+    return days.where((days >= 1) & (days <= 120))
+
+def merge_keyed_states(old, new, summed):
+    """Per-key state of old's collections followed by new's (keys first seen in new last)
+
+    Summed columns add up, first_* columns keep old's values and the others
+    take new's.
+    """
+    shared = old.index.intersection(new.index)
+    latest = [column for column in old.columns if column not in summed and not column.startswith('first_')]
+    merged = pd.concat([old, new[~new.index.isin(shared)]])
+    merged.loc[shared, summed] = old.loc[shared, summed] + new.loc[shared, summed]
+    merged.loc[shared, latest] = new.loc[shared, latest]
+    return merged
+
+def merge_collection_states(old, new):
+    """Collection state of old's rows followed by new's, or None if it cannot be derived from the two
+
+    Collections are ordered by date within each key (a license, or an entity
+    and dimension value of the interval table), so the intervals of the
+    combined rows are those of each state plus the one bridging a key's last
+    collection in old to its first in new. That holds only if no key's
+    collections in new start before its last one in old; otherwise None is
+    returned and the state has to be built from the rows.
+    """
+    license_days = bridging_intervals(old['licenses'], new['licenses'])
+    group_days = bridging_intervals(old['intervals'], new['intervals'])
+    if license_days is None or group_days is None:
+        return None
+
+    licenses = merge_keyed_states(old['licenses'], new['licenses'], LICENSE_SUMS)
+    bridged = license_days.dropna()
+    licenses.loc[bridged.index, 'interval_sum'] += bridged
+    licenses.loc[bridged.index, 'interval_count'] += 1
+
+    intervals = merge_keyed_states(old['intervals'], new['intervals'], INTERVAL_SUMS)
+    bridged = group_days.dropna()
+    intervals.loc[bridged.index, 'interval_sum'] += bridged
+    intervals.loc[bridged.index, 'interval_count'] += 1
+
+    return {
+        'rows': old['rows'] + new['rows'],
+        'licenses': licenses,
+        'intervals': intervals
     }
+
+# Token budget declarations: section -> (priority, [(path in section, min items, max items[, rank])]).
+# Each path is a ranked collection the compiler may truncate; lower priorities fill
+# first and max items (None for no ceiling) also bounds what the sections generate.
+# Collections listed in order of first appearance rank their items with a rank function.
+INSIGHT_BUDGETS = {
+    'delays_alerts_analysis': (1, [
+        (('critical_alerts',), 3, 100),
+        (('delay_patterns', 'by_area'), 3, None, lambda item: item[1]['critical']),
+        (('delay_patterns', 'by_category'), 3, None, lambda item: item[1]['critical'])
+    ]),
+    'predictive_patterns': (2, [
+        (('risk_escalation', 'critical_hotspots'), 3, 60),
+        (('provider_workload_forecast',), 3, 100),
+        (('seasonal_patterns', 'weekly_volumes'), 3, None),
+        (('growth_trajectory', 'monthly_progression'), 3, None)
+    ]),
+    'entity_intelligence': (3, [
+        (('entity_risk_profiles',), 3, 500),
+        (('high_value_entities',), 3, 200),
+        (('detailed_outlet_analysis',), 1, 100),
+        (('frequent_collection_entities',), 3, 100),
+        (('category_behavior_patterns',), 3, None, lambda item: item[1]['total_entities'])
+    ]),
+    'geographical_analysis': (4, [
+        (('top_areas',), 3, None),
+        (('zone_distribution',), 3, None),
+        (('detailed_area_analysis',), 1, 30)
+    ]),
+    'service_provider_analysis': (5, [
+        (('top_providers',), 3, None),
+        (('provider_detailed_analysis',), 1, 40)
+    ]),
+    'business_category_analysis': (6, [
+        (('category_breakdown',), 3, None),
+        (('volume_by_category',), 3, None)
+    ]),
+    'operational_analysis': (7, [
+        (('fleet_performance', 'top_vehicles'), 3, 50)
+    ])
+}
+
+# Items of each collection kept without a token budget: the caps the sections had before
+# budgeting (section, collection) -> max items; collections not listed are kept whole
+UNBUDGETED_MAX_ITEMS = {
+    ('delays_alerts_analysis', 'critical_alerts'): 20,
+    ('predictive_patterns', 'critical_hotspots'): 20,
+    ('entity_intelligence', 'entity_risk_profiles'): 100,
+    ('entity_intelligence', 'high_value_entities'): 50,
+    ('entity_intelligence', 'detailed_outlet_analysis'): 50,
+    ('entity_intelligence', 'frequent_collection_entities'): 30,
+    ('geographical_analysis', 'detailed_area_analysis'): 8,
+    ('service_provider_analysis', 'provider_detailed_analysis'): 15,
+    ('operational_analysis', 'top_vehicles'): 10
+}
+
+# No budget by default: the document keeps the UNBUDGETED_MAX_ITEMS; --budget N opts in
+DEFAULT_TOKEN_BUDGET = None
+BUDGET_TIERS = [8000, 40000, 128000]
+
+def insight_budgets(forecast_days=30):
+    """INSIGHT_BUDGETS plus the capacity forecast, whose key names its horizon (nearest days first)"""
+    budgets = dict(INSIGHT_BUDGETS)
+    priority, truncatable = budgets['predictive_patterns']
+    forecast = (('capacity_planning', f"next_{forecast_days}_days_forecast"), 3, None)
+    budgets['predictive_patterns'] = (priority, [*truncatable, forecast])
+    return budgets
+
+def unbudgeted_budgets(budgets):
+    """Declarations compiling the document without a budget: every collection cut to its UNBUDGETED_MAX_ITEMS"""
+    return {
+        section: (priority, [(path, 0, UNBUDGETED_MAX_ITEMS.get((section, path[-1]))) for path, *_ in truncatable])
+        for section, (priority, truncatable) in budgets.items()
+    }
+
+def budget_max_items(section, key):
+    """Largest number of items any budget keeps of a section's collection"""
+    for path, _, max_items, *_ in INSIGHT_BUDGETS[section][1]:
+        if path[-1] == key:
+            return max_items
+    raise KeyError(f"{section} declares no truncatable collection '{key}'")
+
+def generate_pie_insights(df, patterns=None, cube=None, workers=1, forecast_days=30, period=None, collections=None):
+    """Generate comprehensive 7-dimensional analysis for Pie AI
+
+    df holds the rows of period (an analysis_period, Q1 2023 by default). The
+    sections read the period's aggregates only: its cube (see build_pie_cube),
+    its collection state (see collection_state) and the patterns derived from
+    them, each computed here from df when not supplied. df is not read when
+    the cube and collection state are both given, e.g. merged from a saved
+    incremental state. With workers > 1 the cube is built per range of rows
+    on the pool and the insight sections run concurrently once the patterns
+    and cube are built. forecast_days sets the capacity planning horizon.
+    """
+    print("Generating Pie insights...")
+    period = period if period is not None else analysis_period()
     
-    # 1. Overall Analysis
-    insights["overall_analysis"] = generate_overall_analysis(df)
-    
-    # 2. Geographical Analysis
-    insights["geographical_analysis"] = generate_geographical_analysis(df)
-    
-    # 3. Business Category Analysis
-    insights["business_category_analysis"] = generate_category_analysis(df)
-    
-    # 4. Volumetrical Analysis
-    insights["volumetrical_analysis"] = generate_volume_analysis(df)
-    
-    # 5. Service Provider Analysis
-    insights["service_provider_analysis"] = generate_provider_analysis(df)
-    
-    # 6. Operational Analysis
-    insights["operational_analysis"] = generate_operational_analysis(df)
-    
-    # 7. Delays & Alerts Analysis
-    insights["delays_alerts_analysis"] = generate_delays_analysis(patterns)
-    
-    # 8. Enhanced Entity Intelligence
-    insights["entity_intelligence"] = generate_entity_intelligence(df, patterns)
-    
-    # 9. Predictive Patterns
-    insights["predictive_patterns"] = generate_predictive_patterns(df, patterns)
+    shared = {'df': df, 'forecast_days': forecast_days, 'period': period, 'reference_date': period['reference_date'],
+              'workers': workers}
+    sections = {}
+    if cube is None:
+        sections['cube'] = (build_parallel_cube, ['df', 'workers'], "Building aggregation cube...")
+    else:
+        shared['cube'] = cube
+    if collections is None:
+        sections['collections'] = (collection_state, ['df'], None)
+    else:
+        shared['collections'] = collections
+    if patterns is None:
+        sections['patterns'] = (calculate_collection_patterns, ['df', 'reference_date', 'collections', 'cube'], None)
+    else:
+        shared['patterns'] = patterns
     
-    # 10. AI Query Examples and Context
-    insights["ai_query_examples"] = generate_ai_query_examples()
+    outputs = insight_sections()
+    sections.update(outputs)
+    results = run_sections(sections, shared, workers=workers)
+    insights = {"pie_assistant_context": generate_assistant_context(results['cube'], period)}
+    for name in outputs:
+        insights[name] = results[name]
     
     return insights
 
-def generate_overall_analysis(df):
+def build_pie_cube(df, row_offset=0):
+    """Cuboid set of the PIE_CUBOIDS the insight sections read (see build_aggregation_cube)"""
+    return build_aggregation_cube(df, row_offset=row_offset, cuboids=PIE_CUBOIDS, measured=PIE_ENTITY_CUBOIDS)
+
+def build_parallel_cube(df, workers=1):
+    """Pie cube of df, built per range of rows on the worker pool and merged (see map_row_ranges)"""
+    if workers <= 1:
+        return build_pie_cube(df)
+    return merge_cubes(*map_row_ranges('cube', build_pie_cube, df, workers))
+
+def generate_assistant_context(cube, period):
+    """Describe the period and data the insights were generated from"""
+    reference_date = period['reference_date'].strftime('%Y-%m-%d')
+    return {
+        "name": "Pie",
+        "company": "PivotPie",
+        "data_period": period['description'],
+        "scope": "Dubai Grease Trap Collection Analysis",
+        "reference_date": reference_date,
+        "total_records": int(total(cube, 'collections')),
+        "date_range": {
+            "start": period['start'].strftime('%Y-%m-%d'),
+            "end": period['end'].strftime('%Y-%m-%d'),
+            "analysis_date": reference_date
+        }
+    }
+
+def insight_sections():
+    """The insight sections in output order, as run_sections entries
+
+    They read the period's 'cube', 'patterns', 'forecast_days' and 'period'.
+    """
+    return {
+        # 1. Overall Analysis
+        "overall_analysis": (generate_overall_analysis, ['cube', 'period'], None),
+        # 2. Geographical Analysis
+        "geographical_analysis": (generate_geographical_analysis, ['cube'], None),
+        # 3. Business Category Analysis
+        "business_category_analysis": (generate_category_analysis, ['cube'], None),
+        # 4. Volumetrical Analysis
+        "volumetrical_analysis": (generate_volume_analysis, ['cube'], None),
+        # 5. Service Provider Analysis
+        "service_provider_analysis": (generate_provider_analysis, ['cube'], None),
+        # 6. Operational Analysis
+        "operational_analysis": (generate_operational_analysis, ['cube'], None),
+        # 7. Delays & Alerts Analysis
+        "delays_alerts_analysis": (generate_delays_analysis, ['patterns'], None),
+        # 8. Enhanced Entity Intelligence
+        "entity_intelligence": (generate_entity_intelligence, ['cube', 'patterns'], None),
+        # 9. Predictive Patterns
+        "predictive_patterns": (generate_predictive_patterns, ['cube', 'patterns', 'forecast_days', 'period'], None),
+        # 10. AI Query Examples and Context
+        "ai_query_examples": (generate_ai_query_examples, ['period'], None)
+    }
+
+def generate_overall_analysis(cube, period=None):
     """Generate executive summary and key metrics"""
-    total_gallons = df['Sum of Gallons Collected'].sum()
-    avg_gallons = df['Sum of Gallons Collected'].mean()
+    period = period if period is not None else analysis_period()
+    records = int(total(cube, 'collections'))
+    total_gallons = total(cube, 'gallons_sum')
+    avg_gallons = total_gallons / total(cube, 'gallons_count')
+    
+    # Collections per calendar month of the period, keyed by month name (and year
+    # when the period spans more than one)
+    monthly_counts = cube_value_counts(cube, 'Month')
+    month_format = '%B' if period['start'].year == period['end'].year else '%B_%Y'
+    period_trends = {
+        f"{month.strftime(month_format).lower()}_collections": int(monthly_counts.get(str(month), 0))
+        for month in pd.period_range(period['start'], period['end'], freq='M')
+    }
+    period_trends["growth_trend"] = f"Analyzing {period['label']} progression patterns"
     
     return {
         "executive_summary": {
-            "total_records": len(df),
+            "total_records": records,
             "total_gallons": int(total_gallons),
             "average_gallons_per_collection": round(avg_gallons, 1),
-            "unique_entities": df['New E ID'].nunique(),
-            "unique_service_providers": df['Service Provider'].nunique(),
-            "unique_vehicles": df['Assigned Vehicle'].nunique(),
-            "unique_areas": df['Area'].nunique(),
-            "unique_zones": df['Zone'].nunique(),
-            "unique_categories": df['Category'].nunique(),
-            "completion_rate": round((df['Status'] == 'Discharged').mean() * 100, 2)
+            "unique_entities": distinct(cube, 'New E ID'),
+            "unique_service_providers": distinct(cube, 'Service Provider'),
+            "unique_vehicles": distinct(cube, 'Assigned Vehicle'),
+            "unique_areas": distinct(cube, 'Area'),
+            "unique_zones": distinct(cube, 'Zone'),
+            "unique_categories": distinct(cube, 'Category'),
+            "completion_rate": round(total(cube, 'discharged') / total(cube, 'collections') * 100, 2)
         },
         "key_performance_indicators": {
-            "daily_average_collections": round(len(df) / 90, 1),  # Q1 = ~90 days
-            "peak_collection_month": df['Month'].value_counts().index[0],
-            "most_active_area": df['Area'].value_counts().index[0],
-            "dominant_category": df['Category'].value_counts().index[0],
-            "top_provider": df['Service Provider'].value_counts().index[0],
-            "average_turnaround_days": round(df['Initiation_to_Collection_Days'].mean(), 1)
+            "daily_average_collections": round(records / period['days'], 1),
+            "peak_collection_month": monthly_counts.index[0],
+            "most_active_area": cube_value_counts(cube, 'Area').index[0],
+            "dominant_category": cube_value_counts(cube, 'Category').index[0],
+            "top_provider": cube_value_counts(cube, 'Service Provider').index[0],
+            "average_turnaround_days": round(total(cube, 'turnaround_sum') / total(cube, 'turnaround_count'), 1)
         },
-        "quarterly_trends": {
-            "january_collections": len(df[df['Month'] == '2023-01']),
-            "february_collections": len(df[df['Month'] == '2023-02']),
-            "march_collections": len(df[df['Month'] == '2023-03']),
-            "growth_trend": "Analyzing Q1 2023 progression patterns"
-        }
+        "quarterly_trends": period_trends
     }
 
-def generate_geographical_analysis(df):
+def generate_geographical_analysis(cube):
     """Generate area and zone analysis"""
+    records = total(cube, 'collections')
+    
     # Top areas analysis
-    area_stats = df.groupby('Area').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean'],
-        'New E ID': 'nunique',
-        'Service Provider': 'nunique',
-        'Assigned Vehicle': 'nunique'
-    }).round(1)
+    area_stats = rollup(cube, 'Area', distinct=['New E ID', 'Service Provider', 'Assigned Vehicle'])[[
+        'reports', 'gallons_sum', 'gallons_mean',
+        'distinct:New E ID', 'distinct:Service Provider', 'distinct:Assigned Vehicle'
+    ]].round(1)
     
     area_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Unique_Entities', 'Service_Providers', 'Vehicles']
-    area_stats['Percentage'] = round((area_stats['Collections'] / len(df)) * 100, 2)
+    area_stats['Percentage'] = round((area_stats['Collections'] / records) * 100, 2)
     area_stats = area_stats.sort_values('Collections', ascending=False)
     
     # Zone analysis
-    zone_stats = df.groupby('Zone').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean'],
-        'New E ID': 'nunique',
-        'Area': 'nunique'
-    }).round(1)
+    zone_stats = rollup(cube, 'Zone', distinct=['New E ID', 'Area'])[[
+        'reports', 'gallons_sum', 'gallons_mean', 'distinct:New E ID', 'distinct:Area'
+    ]].round(1)
     
     zone_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Unique_Entities', 'Areas']
-    zone_stats['Percentage'] = round((zone_stats['Collections'] / len(df)) * 100, 2)
+    zone_stats['Percentage'] = round((zone_stats['Collections'] / records) * 100, 2)
     zone_stats = zone_stats.sort_values('Collections', ascending=False)
     
     # Detailed area analysis (optimized)
     detailed_area_analysis = {}
-    for area in area_stats.head(8).index:  # Reduced from 10 to 8
-        area_data = df[df['Area'] == area]
+    for area in area_stats.head(budget_max_items('geographical_analysis', 'detailed_area_analysis')).index:
+        in_area = {'Area': area}
         detailed_area_analysis[area] = {
             'summary': area_stats.loc[area].to_dict(),
-            'top_entities_count': area_data.groupby('New E ID')['Sum of Gallons Collected'].sum().sort_values(ascending=False).head(10).to_dict(),
-            'category_breakdown': area_data['Category'].value_counts().to_dict(),
-            'provider_distribution': area_data['Service Provider'].value_counts().head(5).to_dict(),
-            'monthly_trends': area_data.groupby('Month')['Sum of Gallons Collected'].sum().to_dict()
+            'top_entities_count': group_totals(cube, 'New E ID', 'gallons_sum', in_area).sort_values(ascending=False).head(10).to_dict(),
+            'category_breakdown': cube_value_counts(cube, 'Category', in_area).to_dict(),
+            'provider_distribution': cube_value_counts(cube, 'Service Provider', in_area).head(5).to_dict(),
+            'monthly_trends': group_totals(cube, 'Month', 'gallons_sum', in_area).to_dict()
         }
     
     return {
@@ -294,18 +780,15 @@ def generate_geographical_analysis(df):
         }
     }
 
-def generate_category_analysis(df):
+def generate_category_analysis(cube):
     """Generate business category analysis"""
-    category_stats = df.groupby('Category').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean', 'std'],
-        'New E ID': 'nunique',
-        'Area': 'nunique',
-        'Service Provider': 'nunique'
-    }).round(1)
+    category_stats = rollup(cube, 'Category', distinct=['New E ID', 'Area', 'Service Provider'])[[
+        'reports', 'gallons_sum', 'gallons_mean', 'gallons_std',
+        'distinct:New E ID', 'distinct:Area', 'distinct:Service Provider'
+    ]].round(1)
     
     category_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Std_Gallons', 'Unique_Entities', 'Areas_Served', 'Service_Providers']
-    category_stats['Percentage'] = round((category_stats['Collections'] / len(df)) * 100, 2)
+    category_stats['Percentage'] = round((category_stats['Collections'] / total(cube, 'collections')) * 100, 2)
     category_stats = category_stats.sort_values('Collections', ascending=False)
     
     return {
@@ -319,9 +802,10 @@ def generate_category_analysis(df):
         "volume_by_category": category_stats[['Avg_Gallons', 'Std_Gallons']].to_dict('index')
     }
 
-def generate_volume_analysis(df):
-    """Generate volume pattern analysis"""
-    gallons = df['Sum of Gallons Collected'].dropna()
+def generate_volume_analysis(cube):
+    """Generate volume pattern analysis from the histogram of gallon values"""
+    values, counts = cube_histogram(cube, 'Sum of Gallons Collected')
+    gallons = values * counts
     
     # Volume ranges
     volume_ranges = [
@@ -336,11 +820,11 @@ def generate_volume_analysis(df):
     
     distribution = {}
     for min_val, max_val, label in volume_ranges:
-        mask = (gallons >= min_val) & (gallons < max_val if max_val != float('inf') else gallons >= min_val)
-        count = mask.sum()
-        percentage = round((count / len(gallons)) * 100, 2)
+        mask = (values >= min_val) & (values < max_val if max_val != float('inf') else values >= min_val)
+        count = counts[mask].sum()
+        percentage = round((count / counts.sum()) * 100, 2)
         total_vol = gallons[mask].sum()
-        avg_vol = round(gallons[mask].mean(), 1) if count > 0 else 0
+        avg_vol = round(total_vol / count, 1) if count > 0 else 0
         
         distribution[label] = {
             'count': int(count),
@@ -350,54 +834,49 @@ def generate_volume_analysis(df):
         }
     
     # Most common volumes
-    common_volumes = gallons.value_counts().head(10).to_dict()
+    common_volumes = cube_value_counts(cube, 'Sum of Gallons Collected').head(10).to_dict()
     
     return {
         "volume_distribution": distribution,
         "common_volumes": {str(k): int(v) for k, v in common_volumes.items()},
         "volume_statistics": {
-            "min_gallons": int(gallons.min()),
-            "max_gallons": int(gallons.max()),
-            "mean_gallons": round(gallons.mean(), 1),
-            "median_gallons": round(gallons.median(), 1),
-            "std_gallons": round(gallons.std(), 1),
-            "q25": round(gallons.quantile(0.25), 1),
-            "q75": round(gallons.quantile(0.75), 1)
+            "min_gallons": int(values[0]),
+            "max_gallons": int(values[-1]),
+            "mean_gallons": round(gallons.sum() / counts.sum(), 1),
+            "median_gallons": round(histogram_median(values, counts), 1),
+            "std_gallons": round(histogram_std(values, counts), 1),
+            "q25": round(histogram_quantile(values, counts, 0.25), 1),
+            "q75": round(histogram_quantile(values, counts, 0.75), 1)
         },
         "volume_insights": {
-            "most_common_size": str(gallons.mode().iloc[0]),
+            "most_common_size": str(values[np.argmax(counts)]),
             "high_volume_threshold": "Collections >100 gallons considered high-volume",
             "standard_sizes": "15, 25, 40, 100 gallon containers most common"
         }
     }
 
-def generate_provider_analysis(df):
+def generate_provider_analysis(cube):
     """Generate service provider analysis"""
-    provider_stats = df.groupby('Service Provider').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean'],
-        'New E ID': 'nunique',
-        'Area': 'nunique',
-        'Zone': 'nunique',
-        'Assigned Vehicle': 'nunique',
-        'Initiation_to_Collection_Days': 'mean'
-    }).round(1)
+    provider_stats = rollup(cube, 'Service Provider', distinct=['New E ID', 'Area', 'Zone', 'Assigned Vehicle'])[[
+        'reports', 'gallons_sum', 'gallons_mean', 'distinct:New E ID', 'distinct:Area',
+        'distinct:Zone', 'distinct:Assigned Vehicle', 'turnaround_mean'
+    ]].round(1)
     
     provider_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Unique_Entities', 'Areas_Served', 'Zones_Served', 'Vehicles_Used', 'Avg_Turnaround_Days']
-    provider_stats['Market_Share'] = round((provider_stats['Collections'] / len(df)) * 100, 2)
+    provider_stats['Market_Share'] = round((provider_stats['Collections'] / total(cube, 'collections')) * 100, 2)
     provider_stats['Collections_Per_Vehicle'] = round(provider_stats['Collections'] / provider_stats['Vehicles_Used'], 1)
     provider_stats = provider_stats.sort_values('Collections', ascending=False)
     
     # Provider detailed analysis (optimized)
     provider_details = {}
-    for provider in provider_stats.head(15).index:  # Reduced from 20 to 15
-        provider_data = df[df['Service Provider'] == provider]
+    for provider in provider_stats.head(budget_max_items('service_provider_analysis', 'provider_detailed_analysis')).index:
+        by_provider = {'Service Provider': provider}
         provider_details[provider] = {
             'performance_metrics': provider_stats.loc[provider].to_dict(),
-            'area_coverage': provider_data['Area'].value_counts().head(8).to_dict(),
-            'category_specialization': provider_data['Category'].value_counts().head(5).to_dict(),
-            'monthly_activity': provider_data.groupby('Month')['Sum of Gallons Collected'].sum().to_dict(),
-            'vehicle_fleet': provider_data['Assigned Vehicle'].nunique()
+            'area_coverage': cube_value_counts(cube, 'Area', by_provider).head(8).to_dict(),
+            'category_specialization': cube_value_counts(cube, 'Category', by_provider).head(5).to_dict(),
+            'monthly_activity': group_totals(cube, 'Month', 'gallons_sum', by_provider).to_dict(),
+            'vehicle_fleet': int(provider_stats.loc[provider, 'Vehicles_Used'])
         }
     
     return {
@@ -416,29 +895,26 @@ def generate_provider_analysis(df):
         }
     }
 
-def generate_operational_analysis(df):
+def generate_operational_analysis(cube):
     """Generate operational efficiency analysis"""
     # Vehicle performance
-    vehicle_stats = df.groupby('Assigned Vehicle').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': ['sum', 'mean'],
-        'Area': 'nunique',
-        'New E ID': 'nunique'
-    }).round(1)
+    vehicle_stats = rollup(cube, 'Assigned Vehicle', distinct=['Area', 'New E ID'])[[
+        'reports', 'gallons_sum', 'gallons_mean', 'distinct:Area', 'distinct:New E ID'
+    ]].round(1)
     
     vehicle_stats.columns = ['Collections', 'Total_Gallons', 'Avg_Gallons', 'Areas_Served', 'Entities_Served']
     vehicle_stats = vehicle_stats.sort_values('Collections', ascending=False)
     
     # Temporal patterns
-    daily_patterns = df['Day_of_Week'].value_counts()
-    monthly_patterns = df['Month'].value_counts().sort_index()
+    daily_patterns = cube_value_counts(cube, 'Day_of_Week')
+    monthly_patterns = cube_value_counts(cube, 'Month').sort_index()
     
     # Efficiency metrics
-    turnaround_stats = df['Initiation_to_Collection_Days'].describe()
+    turnaround_stats = histogram_describe(*cube_histogram(cube, 'Initiation_to_Collection_Days'))
     
     return {
         "fleet_performance": {
-            "top_vehicles": vehicle_stats.head(10).to_dict('index'),
+            "top_vehicles": vehicle_stats.head(budget_max_items('operational_analysis', 'top_vehicles')).to_dict('index'),
             "total_vehicles": len(vehicle_stats),
             "avg_collections_per_vehicle": round(vehicle_stats['Collections'].mean(), 1),
             "most_productive_vehicle": vehicle_stats.index[0]
@@ -447,142 +923,138 @@ def generate_operational_analysis(df):
             "daily_distribution": daily_patterns.to_dict(),
             "monthly_progression": monthly_patterns.to_dict(),
             "peak_day": daily_patterns.index[0],
-            "peak_month": monthly_patterns.index[-1]  # Last month in Q1
+            "peak_month": monthly_patterns.index[-1]  # Last month in the period
         },
         "efficiency_metrics": {
             "avg_turnaround_days": round(turnaround_stats['mean'], 1),
             "median_turnaround": round(turnaround_stats['50%'], 1),
             "fastest_turnaround": int(turnaround_stats['min']),
-            "completion_rate": f"{((df['Status'] == 'Discharged').mean() * 100):.2f}%"
+            "completion_rate": f"{(total(cube, 'discharged') / total(cube, 'collections') * 100):.2f}%"
         }
     }
 
+def delay_table(risk_table):
+    """Critical/warning/total entity counts per key of a count_risk_levels table"""
+    return {
+        key: {'critical': int(critical), 'warning': int(warning), 'total': int(count)}
+        for key, critical, warning, count in zip(
+            risk_table.index, risk_table['critical'], risk_table['warning'], risk_table['total']
+        )
+    }
+
 def generate_delays_analysis(patterns):
     """Generate comprehensive delay and alert analysis"""
-    entity_patterns = patterns['entities']
+    entities = patterns['entities']
     
     # Risk classification
-    risk_summary = {
-        'critical': len([e for e in entity_patterns if e['risk_level'] == 'critical']),
-        'warning': len([e for e in entity_patterns if e['risk_level'] == 'warning']),
-        'upcoming': len([e for e in entity_patterns if e['risk_level'] == 'upcoming']),
-        'normal': len([e for e in entity_patterns if e['risk_level'] == 'normal'])
-    }
+    risk_counts = count_risk_levels(entities)
+    risk_summary = {level: int(risk_counts[level]) for level in ['critical', 'warning', 'upcoming', 'normal']}
     
     # Critical alerts (>10 days overdue)
-    critical_alerts = [e for e in entity_patterns if e['risk_level'] == 'critical']
-    critical_alerts_summary = []
-    
-    for alert in critical_alerts[:20]:  # Top 20 critical alerts
-        critical_alerts_summary.append({
-            'entity_id': alert['entity_id'],
-            'outlet_name': alert['outlet_name'],
-            'category': alert['category'],
-            'area': alert['area'],
-            'days_overdue': alert['days_overdue'],
-            'last_collection': alert['last_collection_date'],
-            'expected_interval': alert['avg_interval_days']
-        })
-    
-    # Area-wise delay analysis
-    area_delays = defaultdict(lambda: {'critical': 0, 'warning': 0, 'total': 0})
-    for entity in entity_patterns:
-        area = entity['area']
-        if entity['risk_level'] == 'critical':
-            area_delays[area]['critical'] += 1
-        elif entity['risk_level'] == 'warning':
-            area_delays[area]['warning'] += 1
-        area_delays[area]['total'] += 1
-    
-    # Category-wise delay analysis
-    category_delays = defaultdict(lambda: {'critical': 0, 'warning': 0, 'total': 0})
-    for entity in entity_patterns:
-        category = entity['category']
-        if entity['risk_level'] == 'critical':
-            category_delays[category]['critical'] += 1
-        elif entity['risk_level'] == 'warning':
-            category_delays[category]['warning'] += 1
-        category_delays[category]['total'] += 1
-    
+    critical_alerts = entities[entities['risk_level'] == 'critical'].head(
+        budget_max_items('delays_alerts_analysis', 'critical_alerts')
+    )
+    critical_alerts_summary = critical_alerts[[
+        'entity_id', 'outlet_name', 'category', 'area', 'days_overdue', 'last_collection_date', 'avg_interval_days'
+    ]].rename(columns={
+        'last_collection_date': 'last_collection', 'avg_interval_days': 'expected_interval'
+    }).to_dict('records')
+    
+    # Area- and category-wise delay analysis
+    area_delays = delay_table(count_risk_levels(entities, 'area'))
+    category_delays = delay_table(count_risk_levels(entities, 'category'))
+    
+    overdue_days = entities['days_overdue'].to_numpy()
     return {
         "risk_summary": risk_summary,
         "critical_alerts": critical_alerts_summary,
         "delay_patterns": {
-            "by_area": dict(area_delays),
-            "by_category": dict(category_delays),
+            "by_area": area_delays,
+            "by_category": category_delays,
             "high_risk_areas": sorted(area_delays.keys(), key=lambda x: area_delays[x]['critical'], reverse=True)[:10],
             "high_risk_categories": sorted(category_delays.keys(), key=lambda x: category_delays[x]['critical'], reverse=True)[:5]
         },
         "intelligence_insights": {
-            "total_entities_analyzed": len(entity_patterns),
+            "total_entities_analyzed": len(entities),
             "entities_with_delays": risk_summary['critical'] + risk_summary['warning'],
-            "delay_rate": f"{((risk_summary['critical'] + risk_summary['warning']) / len(entity_patterns) * 100):.1f}%",
-            "avg_overdue_days": round(np.mean([e['days_overdue'] for e in entity_patterns if e['days_overdue'] > 0]), 1)
+            "delay_rate": f"{((risk_summary['critical'] + risk_summary['warning']) / len(entities) * 100):.1f}%",
+            "avg_overdue_days": round(np.mean(overdue_days[overdue_days > 0]), 1)
         }
     }
 
-def generate_entity_intelligence(df, patterns):
+def entity_volumes(cube):
+    """Gallon totals, averages and counts and the first outlet, category, area, zone and provider of each entity
+
+    One row per New E ID (sorted), with the dtypes groupby().agg() gives on the
+    rows, from the per-entity cuboid.
+    """
+    entities = cells(cube, ENTITY_PROFILE)
+    grouped = entities.groupby('New E ID', sort=True)
+    totals = grouped['gallons_sum'].sum()
+    counts = grouped['gallons_count'].sum().astype('Int64')
+    table = pd.DataFrame({
+        'Total_Gallons': totals,
+        'Avg_Gallons': (totals.astype('Float64') / counts).where(counts > 0),
+        'Collections': counts
+    })
+    for name, column in ENTITY_FIRST_VALUES.items():
+        table[name] = first_value(entities, 'New E ID', column).reindex(table.index)
+    return table
+
+def generate_entity_intelligence(cube, patterns):
     """Generate detailed entity-level intelligence and behavior patterns"""
-    entity_patterns = patterns['entities']
+    entities = patterns['entities']
     
     # High-value entities analysis
-    high_volume_entities = df.groupby('New E ID').agg({
-        'Sum of Gallons Collected': ['sum', 'mean', 'count'],
-        'Entity Mapping.Outlet': 'first',
-        'Category': 'first',
-        'Area': 'first',
-        'Zone': 'first',
-        'Service Provider': 'first'
-    }).round(1)
-    
-    high_volume_entities.columns = ['Total_Gallons', 'Avg_Gallons', 'Collections', 'Outlet', 'Category', 'Area', 'Zone', 'Provider']
-    high_volume_entities = high_volume_entities.sort_values('Total_Gallons', ascending=False).head(50)
+    high_volume_entities = entity_volumes(cube).round(1)
+    high_volume_entities = high_volume_entities.sort_values('Total_Gallons', ascending=False).head(
+        budget_max_items('entity_intelligence', 'high_value_entities')
+    )
     
     # Frequent collection entities
-    frequent_entities = df.groupby('New E ID').size().sort_values(ascending=False).head(30)
-    
-    # Entity risk profiles
-    entity_risks = []
-    for entity in entity_patterns[:100]:  # Top 100 entities by pattern analysis
-        entity_risks.append({
-            'entity_id': entity['entity_id'],
-            'outlet_name': entity['outlet_name'],
-            'category': entity['category'],
-            'area': entity['area'],
-            'zone': entity['zone'],
-            'risk_level': entity['risk_level'],
-            'days_overdue': entity['days_overdue'],
-            'avg_interval': entity['avg_interval_days'],
-            'collections_count': entity['collections_count'],
-            'avg_gallons': entity['avg_gallons']
-        })
-    
-    # Category behavior patterns
+    frequent_entities = group_totals(cube, 'New E ID', 'collections').sort_values(ascending=False).head(
+        budget_max_items('entity_intelligence', 'frequent_collection_entities')
+    )
+    
+    # Entity risk profiles (in pattern analysis order)
+    entity_risks = entities[[
+        'entity_id', 'outlet_name', 'category', 'area', 'zone', 'risk_level', 'days_overdue',
+        'avg_interval_days', 'collections_count', 'avg_gallons'
+    ]].head(budget_max_items('entity_intelligence', 'entity_risk_profiles')).rename(columns={'avg_interval_days': 'avg_interval'}).to_dict('records')
+    
+    # Category behavior patterns: entity risk counts and intervals in one grouped pass,
+    # volume statistics from the cube
+    categories = appearance_order(cube, 'Category')
+    category_risks = count_risk_levels(entities, 'category').reindex(list(categories), fill_value=0)
+    category_intervals = group_means(entities, 'category', 'avg_interval_days')
+    category_volumes = rollup(cube, 'Category')
+    # Read apart from the rest of the row, whose nullable dtypes would turn a NaN std into NA
+    category_stds = category_volumes['gallons_std'].astype('float64')
     category_behaviors = {}
-    for category in df['Category'].unique():
-        cat_data = df[df['Category'] == category]
-        cat_entities = [e for e in entity_patterns if e['category'] == category]
+    for category in categories:
+        risks = category_risks.loc[category]
+        volumes = category_volumes.loc[category]
         
         category_behaviors[category] = {
-            'total_entities': len(cat_entities),
-            'avg_collection_interval': round(np.mean([e['avg_interval_days'] for e in cat_entities]), 1),
+            'total_entities': int(risks['total']),
+            'avg_collection_interval': round(category_intervals.get(category, np.nan), 1),
             'risk_distribution': {
-                'critical': len([e for e in cat_entities if e['risk_level'] == 'critical']),
-                'warning': len([e for e in cat_entities if e['risk_level'] == 'warning']),
-                'normal': len([e for e in cat_entities if e['risk_level'] == 'normal'])
+                'critical': int(risks['critical']),
+                'warning': int(risks['warning']),
+                'normal': int(risks['normal'])
             },
             'volume_patterns': {
-                'min_gallons': int(cat_data['Sum of Gallons Collected'].min()),
-                'max_gallons': int(cat_data['Sum of Gallons Collected'].max()),
-                'avg_gallons': round(cat_data['Sum of Gallons Collected'].mean(), 1),
-                'std_gallons': round(cat_data['Sum of Gallons Collected'].std(), 1)
+                'min_gallons': int(volumes['gallons_min']),
+                'max_gallons': int(volumes['gallons_max']),
+                'avg_gallons': round(volumes['gallons_mean'], 1),
+                'std_gallons': round(category_stds[category], 1)
             }
         }
     
-    # Detailed outlet analysis (optimized for token count)
+    # Detailed outlet analysis
     outlet_analysis = {}
-    for idx, row in high_volume_entities.head(50).iterrows():  # Reduced from 100 to 50
-        outlet_data = df[df['New E ID'] == idx]
+    primary_vehicles = mode_value(cube, 'New E ID', 'Assigned Vehicle')
+    for idx, row in high_volume_entities.head(budget_max_items('entity_intelligence', 'detailed_outlet_analysis')).iterrows():
         outlet_analysis[str(idx)] = {
             'outlet_name': row['Outlet'],
             'category': row['Category'],
@@ -592,74 +1064,129 @@ def generate_entity_intelligence(df, patterns):
             'total_gallons': int(row['Total_Gallons']),
             'avg_gallons': row['Avg_Gallons'],
             'collections': int(row['Collections']),
-            'monthly_breakdown': outlet_data.groupby('Month')['Sum of Gallons Collected'].sum().to_dict(),
-            'primary_vehicle': outlet_data['Assigned Vehicle'].mode().iloc[0] if len(outlet_data) > 0 else None
+            'monthly_breakdown': group_totals(cube, 'Month', 'gallons_sum', {'New E ID': idx}).to_dict(),
+            'primary_vehicle': primary_vehicles.get(idx)
         }
     
     return {
-        "high_value_entities": high_volume_entities.head(50).to_dict('index'),
+        "high_value_entities": high_volume_entities.to_dict('index'),
         "detailed_outlet_analysis": outlet_analysis,
         "frequent_collection_entities": {str(k): int(v) for k, v in frequent_entities.to_dict().items()},
         "entity_risk_profiles": entity_risks,
         "category_behavior_patterns": category_behaviors,
         "intelligence_summary": {
-            "total_entities_analyzed": len(entity_patterns),
-            "high_risk_entities": len([e for e in entity_patterns if e['risk_level'] in ['critical', 'warning']]),
-            "entities_needing_attention": len([e for e in entity_patterns if e['days_overdue'] > 5]),
-            "avg_collection_frequency": round(np.mean([e['avg_interval_days'] for e in entity_patterns]), 1)
+            "total_entities_analyzed": len(entities),
+            "high_risk_entities": int(entities['risk_level'].isin(['critical', 'warning']).sum()),
+            "entities_needing_attention": int((entities['days_overdue'] > 5).sum()),
+            "avg_collection_frequency": round(np.mean(entities['avg_interval_days'].to_numpy()), 1)
         }
     }
 
-def generate_predictive_patterns(df, patterns):
+def forecast_daily_collections(entities, reference_date, horizon_days=30):
+    """Project the number of collections due on each of the next horizon_days
+
+    An entity is counted on every day whose whole-day distance to its expected
+    next collection (last collection + average interval) is at most one day,
+    which is always three consecutive days starting at ceil(days_until - 1).
+    """
+    forecast_dates = pd.date_range(reference_date + timedelta(days=1), periods=horizon_days)
+    counts = np.zeros(horizon_days + 1, dtype=np.int64)
+
+    if len(entities):
+        last_collections = pd.to_datetime(entities['last_collection_date'], format='%Y-%m-%d')
+        intervals = pd.to_timedelta(entities['avg_interval_days'], unit='D')
+        days_until = ((last_collections + intervals) - reference_date) / pd.Timedelta(days=1)
+        first_day = np.ceil(np.asarray(days_until) - 1).astype(np.int64)
+        due_days = np.concatenate([first_day, first_day + 1, first_day + 2])
+        due_days = due_days[(due_days >= 1) & (due_days <= horizon_days)]
+        counts += np.bincount(due_days, minlength=horizon_days + 1)
+
+    return {date.strftime('%Y-%m-%d'): int(count) for date, count in zip(forecast_dates, counts[1:])}
+
+def build_entity_provider_index(cube):
+    """Distinct (New E ID, Service Provider) pairs - every provider that served each entity
+
+    Read from the smallest cuboid holding both, or from a frame of rows.
+    """
+    pairs = select_cuboid(cube, ['New E ID', 'Service Provider'])
+    return pairs[['New E ID', 'Service Provider']].dropna().drop_duplicates()
+
+def forecast_provider_workloads(providers, entities, provider_index):
+    """Summarize upcoming and overdue collections per service provider
+
+    providers lists the period's providers in order of first appearance, and
+    provider_index their entities (see build_entity_provider_index). Entity
+    patterns are joined to the index once, so an entity served by several
+    providers counts towards each of them, and every provider is reduced from
+    its own slice of the joined table.
+    """
+    entities = entities[['entity_id', 'days_overdue', 'avg_interval_days']].assign(position=np.arange(len(entities)))
+
+    served = entities.merge(provider_index, left_on='entity_id', right_on='New E ID')
+    served = served.sort_values('position', kind='stable')
+    served['upcoming'] = (served['days_overdue'] > -7) & (served['days_overdue'] <= 0)
+    served['overdue'] = served['days_overdue'] > 0
+    by_provider = dict(tuple(served.groupby('Service Provider', observed=True, sort=False)))
+
+    provider_workloads = {}
+    for provider in providers:
+        provider_entities = by_provider.get(provider)
+        if provider_entities is None or provider_entities.empty:
+            provider_workloads[provider] = {
+                'upcoming_week_estimate': 0,
+                'overdue_collections': 0,
+                'total_managed_entities': 0,
+                'avg_entity_interval': 14
+            }
+            continue
+        
+        provider_workloads[provider] = {
+            'upcoming_week_estimate': int(provider_entities['upcoming'].sum()),
+            'overdue_collections': int(provider_entities['overdue'].sum()),
+            'total_managed_entities': len(provider_entities),
+            'avg_entity_interval': round(np.mean(provider_entities['avg_interval_days'].to_numpy()), 1)
+        }
+    
+    return provider_workloads
+
+def weekly_volume_table(cube):
+    """Gallon total, average and count per ISO week (sorted), with the dtypes groupby().agg() gives on the rows"""
+    grouped = cells(cube, ['Week']).groupby('Week', sort=True)
+    totals = grouped['gallons_sum'].sum()
+    counts = grouped['gallons_count'].sum().astype('Int64')
+    table = pd.DataFrame({
+        'Total_Gallons': totals,
+        'Avg_Gallons': (totals.astype('Float64') / counts).where(counts > 0),
+        'Collections': counts
+    })
+    return table.rename_axis('Week_Number')
+
+def generate_predictive_patterns(cube, patterns, forecast_days=30, period=None):
     """Generate predictive insights and forecasting patterns"""
-    entity_patterns = patterns['entities']
+    period = period if period is not None else analysis_period()
+    entities = patterns['entities']
     
     # Seasonal patterns analysis
-    df['Week_Number'] = df['Collected Date'].dt.isocalendar().week
-    weekly_volumes = df.groupby('Week_Number')['Sum of Gallons Collected'].agg(['sum', 'mean', 'count']).round(1)
-    weekly_volumes.columns = ['Total_Gallons', 'Avg_Gallons', 'Collections']
+    weekly_volumes = weekly_volume_table(cube).round(1)
     
     # Growth trajectory analysis
-    monthly_growth = df.groupby('Month').agg({
-        'Service Report': 'count',
-        'Sum of Gallons Collected': 'sum',
-        'New E ID': 'nunique'
-    }).round(1)
+    monthly_growth = rollup(cube, 'Month', distinct=['New E ID'])[[
+        'reports', 'gallons_sum', 'distinct:New E ID'
+    ]].round(1)
     monthly_growth.columns = ['Collections', 'Total_Gallons', 'Active_Entities']
     
     # Risk escalation patterns
-    critical_entities = [e for e in entity_patterns if e['risk_level'] == 'critical']
-    warning_entities = [e for e in entity_patterns if e['risk_level'] == 'warning']
+    risk_counts = count_risk_levels(entities)
+    critical_hotspots = entities[entities['risk_level'] == 'critical'].head(
+        budget_max_items('predictive_patterns', 'critical_hotspots')
+    )
     
     # Provider workload predictions
-    provider_workloads = {}
-    for provider in df['Service Provider'].unique():
-        provider_data = df[df['Service Provider'] == provider]
-        provider_entities = [e for e in entity_patterns if e['entity_id'] in provider_data['New E ID'].values]
-        
-        upcoming_collections = len([e for e in provider_entities if e['days_overdue'] > -7 and e['days_overdue'] <= 0])
-        overdue_collections = len([e for e in provider_entities if e['days_overdue'] > 0])
-        
-        provider_workloads[provider] = {
-            'upcoming_week_estimate': upcoming_collections,
-            'overdue_collections': overdue_collections,
-            'total_managed_entities': len(provider_entities),
-            'avg_entity_interval': round(np.mean([e['avg_interval_days'] for e in provider_entities]), 1) if provider_entities else 14
-        }
+    provider_workloads = forecast_provider_workloads(appearance_order(cube, 'Service Provider', dropna=False), entities,
+                                                     build_entity_provider_index(cube))
     
     # Capacity planning insights
-    daily_capacity_needed = {}
-    for i in range(1, 31):  # Next 30 days
-        future_date = pd.to_datetime('2023-04-10') + timedelta(days=i)
-        collections_needed = 0
-        
-        for entity in entity_patterns:
-            last_collection = pd.to_datetime(entity['last_collection_date'])
-            next_expected = last_collection + timedelta(days=entity['avg_interval_days'])
-            if abs((future_date - next_expected).days) <= 1:
-                collections_needed += 1
-        
-        daily_capacity_needed[future_date.strftime('%Y-%m-%d')] = collections_needed
+    daily_capacity_needed = forecast_daily_collections(entities, period['reference_date'], forecast_days)
     
     return {
         "seasonal_patterns": {
@@ -669,38 +1196,38 @@ def generate_predictive_patterns(df, patterns):
         },
         "growth_trajectory": {
             "monthly_progression": monthly_growth.to_dict('index'),
-            "volume_trend": "Analyzing Q1 2023 volume progression",
+            "volume_trend": f"Analyzing {period['label']} volume progression",
             "entity_growth": "New entity onboarding patterns"
         },
         "risk_escalation": {
-            "critical_hotspots": [
-                {
-                    'area': entity['area'],
-                    'category': entity['category'],
-                    'days_overdue': entity['days_overdue'],
-                    'outlet': entity['outlet_name']
-                } for entity in critical_entities[:20]
-            ],
-            "warning_trends": len(warning_entities),
-            "escalation_rate": f"{(len(critical_entities) / len(entity_patterns) * 100):.1f}%"
+            "critical_hotspots": critical_hotspots[['area', 'category', 'days_overdue', 'outlet_name']].rename(
+                columns={'outlet_name': 'outlet'}
+            ).to_dict('records'),
+            "warning_trends": int(risk_counts['warning']),
+            "escalation_rate": f"{(risk_counts['critical'] / len(entities) * 100):.1f}%"
         },
         "provider_workload_forecast": provider_workloads,
         "capacity_planning": {
-            "next_30_days_forecast": daily_capacity_needed,
+            f"next_{forecast_days}_days_forecast": daily_capacity_needed,
             "peak_demand_days": sorted(daily_capacity_needed.items(), key=lambda x: x[1], reverse=True)[:10],
             "resource_optimization": "Predictive scheduling recommendations"
         }
     }
 
-def generate_ai_query_examples():
+def generate_ai_query_examples(period=None):
     """Generate example queries and AI assistant context"""
+    period = period if period is not None else analysis_period()
+    label = period['label']
+    reference = period['reference_date']
+    reference_text = f"{reference:%B} {reference.day}, {reference.year}"
+    
     return {
         "sample_queries": [
             "What are the top 5 areas with the most overdue collections?",
             "Which restaurant category entities need immediate attention?",
             "Show me the collection patterns for Al Quoz area",
             "What's the average turnaround time for Service Provider 4?",
-            "Which entities collected the most grease in Q1 2023?",
+            f"Which entities collected the most grease in {label}?",
             "What are the peak collection days of the week?",
             "Show entities that are more than 10 days overdue",
             "Compare volume patterns between hotels and restaurants",
@@ -730,76 +1257,405 @@ def generate_ai_query_examples():
             ]
         },
         "ai_response_guidelines": {
-            "data_scope": "Always specify responses are based on Q1 2023 Dubai grease trap collection data",
-            "date_context": "Reference date for delay calculations is April 10, 2023",
+            "data_scope": f"Always specify responses are based on {label} Dubai grease trap collection data",
+            "date_context": f"Reference date for delay calculations is {reference_text}",
             "entity_privacy": "Use entity IDs and outlet names, avoid personal information",
             "metric_focus": "Emphasize gallons collected, collection frequency, and delay patterns",
             "actionable_insights": "Provide specific, actionable recommendations when possible"
         },
         "response_templates": {
-            "delay_analysis": "Based on Q1 2023 data, [X] entities are overdue as of April 10, 2023...",
-            "performance_comparison": "Comparing [category/area/provider] performance in Q1 2023...",
-            "trend_analysis": "During Q1 2023 (Jan-Mar), the data shows...",
+            "delay_analysis": f"Based on {label} data, [X] entities are overdue as of {reference_text}...",
+            "performance_comparison": f"Comparing [category/area/provider] performance in {label}...",
+            "trend_analysis": f"During {period['short_label']}, the data shows...",
             "capacity_planning": "Based on collection patterns, the recommended capacity for..."
         }
     }
 
-def main():
-    """Main execution function"""
-    print("Starting Pie AI insights generation...")
-    
-    # Load Q1 2023 data
-    df = load_q1_2023_data()
-    
-    # Calculate intelligent patterns
-    patterns = calculate_collection_patterns(df)
-    
-    # Generate comprehensive insights
-    pie_insights = generate_pie_insights(df, patterns)
-    
-    # Convert for JSON serialization
-    def convert_for_json(obj):
-        if isinstance(obj, dict):
-            return {str(k): convert_for_json(v) for k, v in obj.items()}
-        elif isinstance(obj, (list, tuple)):
-            return [convert_for_json(item) for item in obj]
-        elif isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif hasattr(obj, 'to_dict'):
-            return convert_for_json(obj.to_dict())
-        else:
-            return obj
-    
-    json_compatible_insights = convert_for_json(pie_insights)
-    
-    # Save optimized insights
-    output_file = 'pie_insights_q1_2023.json'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(json_compatible_insights, f, indent=2, default=str)
-    
-    # Calculate approximate token count (rough estimate: 1 token ≈ 4 characters)
-    json_str = json.dumps(json_compatible_insights, indent=2, default=str)
-    estimated_tokens = len(json_str) // 4
+def write_period_insights(df, period, workers=1, forecast_days=30, token_budget=DEFAULT_TOKEN_BUDGET, tiers=(),
+                          collections=None, cube=None):
+    """Generate the insights of one period and write them to pie_insights_<period>.json
+
+    The insights are compiled to token_budget for the main output file (without
+    one, to the UNBUDGETED_MAX_ITEMS), and to each budget in tiers for
+    pie_insights_<period>_<N>k.json files. Every budget
+    is compiled before any file is written, so a budget the minimum items do not
+    fit raises BudgetError without leaving a partial set of files. collections
+    (the collection state of df's rows) and cube are used if given, in which
+    case df may be None (see generate_pie_insights).
+    """
+    # Generate comprehensive insights (collection patterns and aggregation cube included)
+    pie_insights = generate_pie_insights(df, workers=workers, forecast_days=forecast_days, period=period,
+                                         collections=collections, cube=cube)
+    budgets = insight_budgets(forecast_days)
+    
+    # Fit the insights to the token budget, if any; the compiled size is exact
+    output_file = f"pie_insights_{period['slug']}.json"
+    with traced_stage('compile'):
+        compiled_insights, json_size = compile_insights(
+            pie_insights, budgets if token_budget is not None else unbudgeted_budgets(budgets), token_budget
+        )
+    estimated_tokens = estimate_tokens(json_size)
+    
+    # Additional budget tiers for other model context sizes
+    tier_files = []
+    for tier in tiers:
+        tier_file = f"pie_insights_{period['slug']}_{tier // 1000}k.json"
+        with traced_stage(f"tier_{tier // 1000}k"):
+            tier_insights, tier_size = compile_insights(pie_insights, budgets, tier)
+        tier_files.append((tier_file, tier, tier_insights, estimate_tokens(tier_size)))
+    
+    with traced_stage('serialize'):
+        write_json(compiled_insights, output_file)
+        for tier_file, _, tier_insights, _ in tier_files:
+            write_json(tier_insights, tier_file)
     
     print(f"\n[SUCCESS] Pie AI insights generated successfully!")
     print(f"Output file: {output_file}")
-    print(f"Data period: Q1 2023 (Jan-Mar)")
-    print(f"Records analyzed: {len(df):,}")
-    print(f"Entities tracked: {df['New E ID'].nunique():,}")
-    print(f"Critical alerts: {len([e for e in patterns['entities'] if e['risk_level'] == 'critical'])}")
-    print(f"File size: {len(json_str):,} characters")
-    print(f"Estimated tokens: {estimated_tokens:,} (Target: 35K-40K)")
-    
-    if 35000 <= estimated_tokens <= 40000:
-        print("[SUCCESS] Token count within target range!")
-    elif estimated_tokens < 35000:
-        print("[WARNING] Below target - consider adding more detail")
+    print(f"Data period: {period['short_label']}")
+    print(f"Records analyzed: {pie_insights['pie_assistant_context']['total_records']:,}")
+    print(f"Entities tracked: {pie_insights['overall_analysis']['executive_summary']['unique_entities']:,}")
+    print(f"Critical alerts: {pie_insights['delays_alerts_analysis']['risk_summary']['critical']}")
+    print(f"File size: {json_size:,} characters")
+    if token_budget is not None:
+        print(f"Estimated tokens: {estimated_tokens:,} (Budget: {token_budget:,})")
     else:
-        print("[WARNING] Above target - consider optimization")
+        print(f"Estimated tokens: {estimated_tokens:,} (no budget - use --budget N to fit one)")
+    for tier_file, tier, _, tier_tokens in tier_files:
+        print(f"Tier {tier_file}: {tier_tokens:,} tokens (Budget: {tier:,})")
     
     return pie_insights
 
+def load_output_state(use_cache=True, strict_schema=False):
+    """Incremental state of the written insights files and of their periods' aggregates
+
+    state['outputs'] maps a period slug to the settings its files were written
+    with, and state['periods'] to the aggregates of the period's rows (its cube,
+    collection state and quality summary) with the window and quality settings
+    they were built with and the applied_digest of those rows. Service Report
+    ids not seen before are read from the extract; every output whose period
+    received one of those rows is dropped from the map, so it is regenerated
+    on its next incremental run, and appended rows are merged into the
+    aggregates of their periods (see update_period_aggregates). When rows were
+    not only appended, or applied rows were removed or rewritten (no output is
+    current then), the saved aggregates are kept but only reused once the
+    period's rows are loaded and match their digest (see matching_aggregates).
+    """
+    state = load_state(CSV_PATH, 'pie')
+    delta, snapshot, appended = read_new_rows(CSV_PATH, state, strict=strict_schema) if state else (None, None, False)
+    if delta is None:
+        print("Building incremental state from the full extract...")
+        periods = state['periods'] if state else {}
+        state = new_state(load_service_data(use_cache=use_cache, strict=strict_schema), CSV_PATH)
+        state['outputs'] = {}
+        state['periods'] = unverified_periods(periods)
+        return state
+    
+    advance_state(state, delta, snapshot)
+    stale = [slug for slug, settings in state['outputs'].items()
+             if date_window_mask(delta, settings['start'], settings['end']).any()]
+    for slug in stale:
+        del state['outputs'][slug]
+    if appended:
+        update_period_aggregates(state['periods'], delta)
+    else:
+        unverified_periods(state['periods'])
+    print(f"{len(delta):,} new service records; {len(stale)} written periods affected")
+    return state
+
+def unverified_periods(periods):
+    """Mark saved period aggregates as to be checked against the period's rows before reuse"""
+    for saved in periods.values():
+        saved['verified'] = False
+    return periods
+
+def update_period_aggregates(periods, delta):
+    """Merge appended rows into the saved aggregates of their periods
+
+    The rows of each period are checked against the data-quality rules as the
+    period's were, their failures appended to its quarantine file and their
+    quality summary merged into the saved one. Their cube and collection state
+    are built and merged in, so nothing is recomputed over the period's earlier
+    rows; aggregates the rows cannot be merged into are dropped, and rebuilt
+    when their period is next regenerated.
+    """
+    for slug, saved in list(periods.items()):
+        rows = delta[date_window_mask(delta, saved['start'], saved['end'])].reset_index(drop=True)
+        if rows.empty:
+            continue
+        quarantine_path = saved['quarantine_path']
+        if quarantine_path and not os.path.exists(quarantine_path):
+            del periods[slug]
+            continue
+        rows, quality = apply_quality_rules(rows, saved['exclude_invalid'], quarantine_path, append=True)
+        merged = merge_period_aggregates(saved['aggregates'], rows, quality)
+        if merged is None:
+            print(f"Appended collections of {slug} predate saved ones - its aggregates will be rebuilt")
+            del periods[slug]
+            continue
+        saved['aggregates'] = merged
+        saved['applied'] = merge_applied_digests(saved['applied'], applied_digest(rows, saved['applied']['rows']))
+
+def merge_period_aggregates(aggregates, rows, quality):
+    """Aggregates of a period's rows followed by rows, or None if their collection state cannot be merged
+
+    The rows' cube continues the period's row positions from next_row, so
+    first-appearance order is that of the period's rows followed by them.
+    """
+    merged = dict(aggregates)
+    if aggregates['quality'] is not None:
+        merged['quality'] = merge_quality_summaries(aggregates['quality'], quality)
+    if rows.empty:
+        return merged
+    merged['collections'] = merge_collection_states(aggregates['collections'], collection_state(rows))
+    if merged['collections'] is None:
+        return None
+    merged['cube'] = merge_cubes(aggregates['cube'], build_pie_cube(rows, row_offset=aggregates['next_row']))
+    merged['next_row'] = aggregates['next_row'] + len(rows)
+    return merged
+
+def aggregates_key(period, exclude_invalid=False):
+    """Settings the aggregates of a period's rows depend on"""
+    return {'start': period['start'], 'end': period['end'], 'exclude_invalid': exclude_invalid}
+
+def saved_aggregates(state, period, exclude_invalid=False, quarantine_path=None):
+    """Saved aggregates of a period known to cover its current rows, or None if its rows have to be loaded
+
+    They must have been kept up to date with every row added since they were
+    built (or checked against the period's rows since), with the same quality
+    settings, and with a quarantine file holding the period's failing rows.
+    """
+    key = aggregates_key(period, exclude_invalid)
+    saved = state['periods'].get(period['slug'])
+    if saved is None or not saved['verified'] or {name: saved[name] for name in key} != key:
+        return None
+    if saved['quarantine_path'] != quarantine_path or (quarantine_path and not os.path.exists(quarantine_path)):
+        return None
+    if saved['aggregates']['quality'] is None:
+        return None
+    return saved['aggregates']
+
+def matching_aggregates(state, period, df, quality, exclude_invalid=False, quarantine_path=None):
+    """Saved aggregates of a period if they cover exactly its loaded rows df, else None
+
+    The rows' applied_digest must match the one saved with them, so rows
+    rewritten or removed since are noticed. quality is the quality summary of
+    df (None if unknown) and quarantine_path the file its failing rows were
+    written to; both are recorded with the reused aggregates.
+    """
+    key = aggregates_key(period, exclude_invalid)
+    saved = state['periods'].get(period['slug'])
+    if saved is None or {name: saved[name] for name in key} != key or not same_digest(saved['applied'], applied_digest(df)):
+        return None
+    print(f"Aggregates of {period['label']} read from the saved state ({len(df):,} rows)")
+    saved.update(verified=True, quarantine_path=quarantine_path)
+    saved['aggregates']['quality'] = quality
+    return saved['aggregates']
+
+def store_aggregates(state, period, df, aggregates, exclude_invalid=False, quarantine_path=None):
+    """Save the aggregates of a period's loaded rows df with their settings and applied_digest"""
+    state['periods'][period['slug']] = {**aggregates_key(period, exclude_invalid), 'quarantine_path': quarantine_path,
+                                        'applied': applied_digest(df), 'verified': True, 'aggregates': aggregates}
+    return aggregates
+
+def output_settings(period, forecast_days, token_budget, tiers, exclude_invalid=False):
+    """Everything the insights files of a period depend on besides the data"""
+    return {
+        'start': period['start'],
+        'end': period['end'],
+        'reference_date': period['reference_date'],
+        'forecast_days': forecast_days,
+        'token_budget': token_budget,
+        'tiers': list(tiers),
+        'exclude_invalid': exclude_invalid
+    }
+
+def output_is_current(state, period, settings):
+    """Check whether a period's insights files were written from the current data and settings"""
+    files = [f"pie_insights_{period['slug']}.json"]
+    files += [f"pie_insights_{period['slug']}_{tier // 1000}k.json" for tier in settings['tiers']]
+    return state['outputs'].get(period['slug']) == settings and all(os.path.exists(f) for f in files)
+
+def main(use_cache=True, strict_schema=False, workers=1, forecast_days=30, token_budget=DEFAULT_TOKEN_BUDGET, tiers=(),
+         period=DEFAULT_PERIOD, reference_date=None, incremental=False, exclude_invalid=False, quarantine_path=None):
+    """Main execution function for one analysis period (see analysis_period)
+
+    With incremental=True the period is only regenerated if service records were
+    added to it, or its settings changed, since its files were last written.
+    When the records were appended, the period's rows are not loaded again:
+    the sections read its saved aggregates, into which the appended rows were
+    merged (see load_output_state).
+    exclude_invalid and quarantine_path apply to the data-quality rules (see
+    load_period_data).
+    """
+    print("Starting Pie AI insights generation...")
+    period = analysis_period(period, reference_date)
+    
+    aggregates = None
+    if incremental:
+        state = load_output_state(use_cache=use_cache, strict_schema=strict_schema)
+        settings = output_settings(period, forecast_days, token_budget, tiers, exclude_invalid)
+        if output_is_current(state, period, settings):
+            store_state(state, CSV_PATH, 'pie')
+            print(f"{period['label']} insights are up to date - no new service records in the period")
+            return None
+        aggregates = saved_aggregates(state, period, exclude_invalid, quarantine_path)
+    
+    if aggregates is not None:
+        # Appended rows are already merged in, so the period's rows are not read
+        with traced_stage('load') as event:
+            df = None
+            event['rows'] = int(total(aggregates['cube'], 'collections'))
+            print_quality_summary(aggregates['quality'], exclude_invalid)
+            print(f"{period['label']} dataset: {event['rows']:,} records (from the saved aggregates)")
+    else:
+        # Load only the period's rows
+        with traced_stage('load') as event:
+            df, quality = read_period_data(period, use_cache=use_cache, strict_schema=strict_schema,
+                                           exclude_invalid=exclude_invalid, quarantine_path=quarantine_path)
+            event['rows'] = len(df)
+        if incremental:
+            aggregates = matching_aggregates(state, period, df, quality, exclude_invalid, quarantine_path)
+            if aggregates is None:
+                aggregates = store_aggregates(state, period, df, {
+                    'cube': build_parallel_cube(df, workers), 'collections': collection_state(df),
+                    'quality': quality, 'next_row': len(df)
+                }, exclude_invalid, quarantine_path)
+    
+    insights = write_period_insights(df, period, workers=workers, forecast_days=forecast_days,
+                                     token_budget=token_budget, tiers=tiers,
+                                     collections=aggregates['collections'] if aggregates else None,
+                                     cube=aggregates['cube'] if aggregates else None)
+    if incremental:
+        state['outputs'][period['slug']] = settings
+        store_state(state, CSV_PATH, 'pie')
+    return insights
+
+def run_batch(frequency='quarter', use_cache=True, strict_schema=False, workers=1, forecast_days=30,
+              token_budget=DEFAULT_TOKEN_BUDGET, tiers=(), incremental=False, exclude_invalid=False,
+              quarantine_path=None):
+    """Write insights for every quarter or month in the extract
+
+    The extract is loaded and checked against the data-quality rules once (see
+    load_period_data); each period is then sliced out through a single
+    Collected Date index instead of re-reading the data. Empty periods are
+    skipped, and with incremental=True so are the periods whose files are
+    current (see main), while the others reuse their saved aggregates when
+    those still cover their rows (see matching_aggregates). The full-frame work
+    for the remaining periods is shared: one aggregation cube partitioned by
+    period and one sort of the collections by license and by entity are built,
+    and each period's cube and collection state are cut from them. Returns the
+    insights per regenerated period slug.
+    """
+    print(f"Starting Pie AI insights generation for every {frequency} in the extract...")
+    
+    state = load_output_state(use_cache=use_cache, strict_schema=strict_schema) if incremental else None
+    with traced_stage('load') as event:
+        df, quality = apply_quality_rules(load_service_data(use_cache=use_cache, strict=strict_schema),
+                                          exclude_invalid, quarantine_path)
+        print_quality_summary(quality, exclude_invalid)
+        date_index = build_date_index(df)
+        event['rows'] = len(df)
+    if len(date_index[0]) == 0:
+        print("[WARNING] No dated collections in the extract")
+        return {}
+    
+    first, last = date_index[1][0], date_index[1][-1]
+    periods = []
+    for month_or_quarter in pd.period_range(first, last, freq=BATCH_FREQUENCIES[frequency]):
+        period = analysis_period(str(month_or_quarter))
+        settings = output_settings(period, forecast_days, token_budget, tiers, exclude_invalid)
+        positions = np.sort(date_positions(date_index, period['start'], period['end']))
+        if incremental and output_is_current(state, period, settings):
+            print(f"Skipping {period['label']}: up to date")
+        elif not len(positions):
+            print(f"Skipping {period['label']}: no collections")
+        else:
+            periods.append((period, settings, positions))
+    
+    # Periods whose saved aggregates still cover their rows reuse them (quality
+    # summaries and quarantine files are not kept apart from the extract's)
+    saved = {}
+    if incremental:
+        for period, _, positions in periods:
+            aggregates = matching_aggregates(state, period, df.iloc[positions].reset_index(drop=True), None,
+                                             exclude_invalid)
+            if aggregates is not None:
+                saved[period['slug']] = aggregates
+    
+    # Shared full-frame aggregates of the other periods, cut per period below
+    pending = [(period, positions) for period, _, positions in periods if period['slug'] not in saved]
+    if pending:
+        with traced_stage('shared_aggregates'):
+            partitions = np.full(len(df), -1, dtype=np.int64)
+            for number, (_, positions) in enumerate(pending):
+                partitions[positions] = number
+            print("Building aggregation cube...")
+            cube = build_partitioned_cube(df, partitions, PIE_CUBOIDS, PIE_ENTITY_CUBOIDS)
+            orders = collection_orders(df)
+        for number, (period, positions) in enumerate(pending):
+            period_orders = {key: restrict_collection_order(order, positions, len(df)) for key, order in orders.items()}
+            df_period = df.iloc[positions].reset_index(drop=True)
+            saved[period['slug']] = {'cube': partition_cube(cube, number),
+                                     'collections': collection_state(df_period, period_orders),
+                                     'quality': None, 'next_row': int(positions[-1]) + 1}
+            if incremental:
+                store_aggregates(state, period, df_period, saved[period['slug']], exclude_invalid)
+    
+    results = {}
+    for period, settings, positions in periods:
+        df_period = df.iloc[positions].reset_index(drop=True)
+        print(f"\n{period['label']} dataset: {len(df_period):,} records")
+        aggregates = saved[period['slug']]
+        with traced_stage(f"period_{period['slug']}", rows=len(df_period)):
+            results[period['slug']] = write_period_insights(df_period, period, workers=workers,
+                                                            forecast_days=forecast_days, token_budget=token_budget,
+                                                            tiers=tiers, collections=aggregates['collections'],
+                                                            cube=aggregates['cube'])
+        if incremental:
+            state['outputs'][period['slug']] = settings
+            store_state(state, CSV_PATH, 'pie')
+    
+    if incremental:
+        store_state(state, CSV_PATH, 'pie')
+    print(f"\n[SUCCESS] Generated insights for {len(results)} {frequency} periods")
+    return results
+
+def parse_tiers(argv):
+    """Read the --tiers option: comma-separated token budgets, BUDGET_TIERS if none are given"""
+    if "--tiers" not in argv:
+        return []
+    position = argv.index("--tiers") + 1
+    if position < len(argv) and not argv[position].startswith("--"):
+        return [int(tier) for tier in argv[position].split(",")]
+    return list(BUDGET_TIERS)
+
 if __name__ == "__main__":
-    insights = main()
\ No newline at end of file
+    import sys
+    options = dict(
+        use_cache="--no-cache" not in sys.argv,
+        strict_schema="--strict-schema" in sys.argv,
+        workers=parse_workers(sys.argv),
+        forecast_days=int(sys.argv[sys.argv.index("--forecast-days") + 1]) if "--forecast-days" in sys.argv else 30,
+        token_budget=int(sys.argv[sys.argv.index("--budget") + 1]) if "--budget" in sys.argv else DEFAULT_TOKEN_BUDGET,
+        tiers=parse_tiers(sys.argv),
+        incremental="--incremental" in sys.argv,
+        exclude_invalid="--exclude-invalid" in sys.argv,
+        quarantine_path=sys.argv[sys.argv.index("--quarantine") + 1] if "--quarantine" in sys.argv else None
+    )
+    start_trace(**parse_trace_options(sys.argv))
+    try:
+        with traced_stage('generate_pie_insights'):
+            if "--batch" in sys.argv:
+                frequency = sys.argv[sys.argv.index("--batch") + 1]
+                if frequency not in BATCH_FREQUENCIES:
+                    sys.exit(f"--batch must be one of: {', '.join(BATCH_FREQUENCIES)}")
+                insights = run_batch(frequency, **options)
+            else:
+                insights = main(
+                    period=sys.argv[sys.argv.index("--period") + 1] if "--period" in sys.argv else DEFAULT_PERIOD,
+                    reference_date=sys.argv[sys.argv.index("--reference-date") + 1] if "--reference-date" in sys.argv else None,
+                    **options
+                )
+    except BudgetError as e:
+        sys.exit(f"{e} - raise --budget/--tiers or lower the minimums in INSIGHT_BUDGETS")
+    finish_trace()
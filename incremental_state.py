@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Persisted state for incremental runs over a growing service extract
+Remembers hashes of the Service Report ids already applied, a content hash of
+the rows applied under each id, and a fingerprint of the source file they came
+from, next to whatever mergeable aggregates the caller keeps, so a refresh only
+parses and aggregates the rows added since the last run. The fingerprint is the
+file size and a hash of its whole content: an append is recognised by hashing
+the bytes read before, without parsing them again.
+"""
+
+import hashlib
+import io
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from frame_cache import CACHE_DIR, staging_path
+from service_data import CATEGORICAL_COLUMNS, CLEANING_VERSION, SchemaError, apply_schema
+from stat_sketches import hash_values
+
+# Bump whenever the layout of the state or of the aggregates kept in it changes
+STATE_VERSION = 10
+
+# Checkpoint blocks hashed to fingerprint the source file, and the bytes in each
+CHECKPOINTS = 16
+CHECKPOINT_BYTES = 1 << 16
+
+def state_path(source_path, name, cache_dir=CACHE_DIR):
+    """Path of the incremental state kept for a source file"""
+    stem = os.path.splitext(os.path.basename(source_path))[0].replace(' ', '_')
+    return os.path.join(cache_dir, f"{stem}.{name}.state.pkl")
+
+def load_state(source_path, name, cache_dir=CACHE_DIR):
+    """Load the incremental state, or None if there is none or it is outdated"""
+    path = state_path(source_path, name, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+    except Exception as e:
+        print(f"[WARNING] Ignoring unreadable incremental state {path}: {e}")
+        return None
+    if state.get('version') != (STATE_VERSION, CLEANING_VERSION):
+        return None
+    return state
+
+def store_state(state, source_path, name, cache_dir=CACHE_DIR):
+    """Write the incremental state, replacing the previous one atomically"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = state_path(source_path, name, cache_dir)
+    staging = staging_path(path)
+    with open(staging, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(staging, path)
+    return path
+
+def checkpoint_offsets(size):
+    """Start of each checkpoint block of a file of size bytes: evenly spaced, the last ending at its end"""
+    last = max(size - CHECKPOINT_BYTES, 0)
+    return sorted({int(offset) for offset in np.linspace(0, last, CHECKPOINTS)})
+
+def hash_checkpoints(f, size):
+    """SHA-256 of each checkpoint block of the first size bytes of an open file"""
+    checkpoints = []
+    for offset in checkpoint_offsets(size):
+        f.seek(offset)
+        block = f.read(min(CHECKPOINT_BYTES, size - offset))
+        checkpoints.append((offset, hashlib.sha256(block).hexdigest()))
+    return checkpoints
+
+def fingerprint(f, size):
+    """Fingerprint of the first size bytes of an open file: their size, checkpoint hashes and final line break"""
+    f.seek(max(size - 1, 0))
+    last_byte = f.read(1) if size else b''
+    return {
+        'size': size,
+        'checkpoints': hash_checkpoints(f, size),
+        'ends_with_newline': last_byte == b'\n'
+    }
+
+def source_snapshot(path):
+    """Fingerprint of a source file"""
+    with open(path, 'rb') as f:
+        return fingerprint(f, os.fstat(f.fileno()).st_size)
+
+def contains_hashes(known, hashes):
+    """Mask of the hashes present in the sorted array known"""
+    if not len(known):
+        return np.zeros(len(hashes), dtype=bool)
+    positions = np.minimum(np.searchsorted(known, hashes), len(known) - 1)
+    return known[positions] == hashes
+
+def row_hashes(df):
+    """64-bit hash of the content of each row (categorical and text columns holding the same values hash alike)"""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def applied_rows(df):
+    """Service Report ids of df's rows and the content they were applied with
+
+    Returns the sorted distinct id hashes, the content hash of each id's rows
+    (the wrapping sum of their row_hashes, so it does not depend on row order),
+    and the number and summed content hash of the rows without an id.
+    """
+    ids = df['Service Report']
+    present = ids.notna().to_numpy()
+    contents = row_hashes(df)
+    report_hashes, groups = np.unique(hash_values(ids[present].astype(str)), return_inverse=True)
+    content_hashes = np.zeros(len(report_hashes), dtype=np.uint64)
+    np.add.at(content_hashes, groups, contents[present])
+    return report_hashes, content_hashes, int((~present).sum()), int(contents[~present].sum(dtype=np.uint64))
+
+def merge_applied_rows(report_hashes, content_hashes, new_report_hashes, new_content_hashes):
+    """Id hashes and content hashes of two sets of applied rows together"""
+    merged, groups = np.unique(np.concatenate([report_hashes, new_report_hashes]), return_inverse=True)
+    contents = np.zeros(len(merged), dtype=np.uint64)
+    np.add.at(contents, groups, np.concatenate([content_hashes, new_content_hashes]))
+    return merged, contents
+
+def row_order_hash(df, row_offset=0):
+    """Wrapping sum of each row's content hash times its 1-based position, so reordered rows hash apart"""
+    positions = np.arange(row_offset + 1, row_offset + len(df) + 1, dtype=np.uint64)
+    return int((row_hashes(df) * positions).sum(dtype=np.uint64))
+
+def applied_digest(df, row_offset=0):
+    """Digest of a frame's rows: their count, applied_rows and row_order_hash
+
+    Two frames with equal digests hold the same rows in the same order. The
+    digest of rows appended to a frame of row_offset rows merges into the
+    frame's with merge_applied_digests.
+    """
+    report_hashes, content_hashes, null_rows, null_content = applied_rows(df)
+    return {
+        'rows': len(df),
+        'report_hashes': report_hashes,
+        'content_hashes': content_hashes,
+        'null_report_rows': null_rows,
+        'null_report_content': null_content,
+        'row_order': row_order_hash(df, row_offset)
+    }
+
+def merge_applied_digests(digest, appended):
+    """Digest of a frame's rows followed by the appended ones"""
+    report_hashes, content_hashes = merge_applied_rows(digest['report_hashes'], digest['content_hashes'],
+                                                       appended['report_hashes'], appended['content_hashes'])
+    return {
+        'rows': digest['rows'] + appended['rows'],
+        'report_hashes': report_hashes,
+        'content_hashes': content_hashes,
+        'null_report_rows': digest['null_report_rows'] + appended['null_report_rows'],
+        'null_report_content': (digest['null_report_content'] + appended['null_report_content']) % (1 << 64),
+        'row_order': (digest['row_order'] + appended['row_order']) % (1 << 64)
+    }
+
+def same_digest(digest, other):
+    """Check whether two applied_digests describe the same rows"""
+    return digest.keys() == other.keys() and all(np.array_equal(digest[name], other[name]) for name in digest)
+
+def new_state(df, source_path):
+    """Incremental state for a frame read from the whole of source_path"""
+    report_hashes, content_hashes, null_rows, null_content = applied_rows(df)
+    return {
+        'version': (STATE_VERSION, CLEANING_VERSION),
+        'source': source_snapshot(source_path),
+        'report_hashes': report_hashes,
+        'content_hashes': content_hashes,
+        'null_report_rows': null_rows,
+        'null_report_content': null_content
+    }
+
+def advance_state(state, delta, snapshot):
+    """Record the rows of delta as applied and the source they were read from"""
+    if len(delta):
+        report_hashes, content_hashes, null_rows, null_content = applied_rows(delta)
+        state['report_hashes'], state['content_hashes'] = merge_applied_rows(
+            state['report_hashes'], state['content_hashes'], report_hashes, content_hashes)
+        state['null_report_rows'] += null_rows
+        state['null_report_content'] = (state['null_report_content'] + null_content) % (1 << 64)
+    state['source'] = snapshot
+    return state
+
+def read_appended_text(path, source):
+    """Bytes appended to path since source was fingerprinted, and the new fingerprint
+
+    Returns (None, None) unless the file still holds the checkpoint blocks
+    fingerprinted and is at least as long, the old content ending on a line
+    break, i.e. the extract was only appended to. Only the checkpoint blocks
+    of the old bytes are read; the appended ones are returned.
+    """
+    if not source.get('ends_with_newline') or os.path.getsize(path) < source['size']:
+        return None, None
+
+    with open(path, 'rb') as f:
+        if hash_checkpoints(f, source['size']) != source['checkpoints']:
+            return None, None
+        f.seek(source['size'])
+        tail = f.read()
+        return tail, fingerprint(f, source['size'] + len(tail))
+
+def read_csv_text(header, body):
+    """Parse CSV rows with the extract's header and apply the ingestion schema"""
+    text_dtypes = {col: 'str' for col in CATEGORICAL_COLUMNS}
+    text_dtypes['Service Report'] = 'str'
+    return apply_schema(pd.read_csv(io.BytesIO(header + body), dtype=text_dtypes))
+
+def read_new_rows(csv_path, state, strict=False):
+    """Rows of the extract not applied yet
+
+    If the extract was only appended to, just the appended bytes are parsed
+    and every appended row is new. Otherwise (re-exported or reordered) the
+    whole CSV is parsed, the rows of each applied Service Report id are checked
+    against the content they were applied with, and the rows of ids not seen
+    before are new. Returns the typed rows (no derived columns), the new source
+    fingerprint and whether the rows were appended, or (None, None, False) when
+    applied rows were removed or rewritten (or rows without an id changed) and
+    the state has to be rebuilt.
+    """
+    tail, snapshot = read_appended_text(csv_path, state['source'])
+    if tail is not None:
+        with open(csv_path, 'rb') as f:
+            header = f.readline()
+        df, failures = read_csv_text(header, tail)
+        if strict and len(failures):
+            raise SchemaError(failures)
+        return df, snapshot, True
+
+    with open(csv_path, 'rb') as f:
+        df, failures = read_csv_text(b'', f.read())
+    snapshot = source_snapshot(csv_path)
+    if strict and len(failures):
+        raise SchemaError(failures)
+
+    report_hashes, content_hashes, null_rows, null_content = applied_rows(df)
+    if null_rows != state['null_report_rows'] or null_content != state['null_report_content']:
+        return None, None, False
+    if not contains_hashes(report_hashes, state['report_hashes']).all():
+        return None, None, False
+    if (content_hashes[np.searchsorted(report_hashes, state['report_hashes'])] != state['content_hashes']).any():
+        return None, None, False
+
+    ids = df['Service Report']
+    present = ids.notna().to_numpy()
+    new = np.zeros(len(df), dtype=bool)
+    new[present] = ~contains_hashes(state['report_hashes'], hash_values(ids[present].astype(str)))
+    return df[new].reset_index(drop=True), snapshot, False
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Token-budgeted compilation of the Pie insights document
+Sections declare ranked collections (lists, or dicts in rank order, or in any
+order with a rank function) that may be truncated. The document is sized with every collection cut to its minimum and
+items are then added back in rounds, highest priority first, while they fit the
+budget. Items are measured with the JSON encoder at their nesting depth, so the
+size of the compiled document is exact before it is written.
+"""
+
+from json_output import CHARS_PER_TOKEN, measure_json
+
+# Each collection regains up to 1/FILL_ROUNDS of its maximum per round, so all
+# collections grow together and priority decides who fits when the budget runs out
+FILL_ROUNDS = 10
+
+class BudgetError(ValueError):
+    """Raised when the document does not fit a token budget even with every collection at its minimum"""
+
+    def __init__(self, token_budget, minimum_tokens):
+        self.token_budget = token_budget
+        self.minimum_tokens = minimum_tokens
+        super().__init__(f"The insights need {minimum_tokens:,} tokens with every collection at its minimum, "
+                         f"over the {token_budget:,} token budget")
+
+def get_path(doc, keys):
+    """Value at a key path inside nested dicts"""
+    for key in keys:
+        doc = doc[key]
+    return doc
+
+def set_path(doc, keys, value):
+    """Set a key path inside doc, copying the dicts along the path instead of mutating them"""
+    parent = doc
+    for key in keys[:-1]:
+        parent[key] = dict(parent[key])
+        parent = parent[key]
+    parent[keys[-1]] = value
+
+def collection_items(doc, keys, min_items, max_items, rank=None):
+    """Describe one truncatable collection of the document
+
+    Items are kept in rank order: the collection's own order, or by descending
+    rank(item) (a (key, value) pair for dicts) with ties in collection order.
+    """
+    node = get_path(doc, keys)
+    items = list(enumerate(node.items() if isinstance(node, dict) else node))
+    if rank is not None:
+        items.sort(key=lambda item: rank(item[1]), reverse=True)
+    if max_items is not None:
+        items = items[:max_items]
+    return {
+        'keys': keys,
+        'is_dict': isinstance(node, dict),
+        'items': items,
+        'kept': min(min_items, len(items)),
+        'step': max(1, -(-len(items) // FILL_ROUNDS)),
+        'open': True
+    }
+
+def item_cost(collection, indent=2):
+    """Characters added to the document by keeping the collection's next item
+
+    Every item but the first adds a separator and its line wherever it lands,
+    so the cost does not depend on its position in the collection.
+    """
+    level = len(collection['keys'])
+    item = collection['items'][collection['kept']][1]
+    if collection['is_dict']:
+        key, value = item
+        text = measure_json(str(key)) + 2 + measure_json(value, indent, level + 1)
+    else:
+        text = measure_json(item, indent, level + 1)
+
+    newline_inner = 1 + indent * (level + 1)
+    if collection['kept'] == 0:
+        # An empty container '{}' opens up and gains its closing line
+        return newline_inner + text + 1 + indent * level
+    return 1 + newline_inner + text
+
+def build_collection(collection):
+    """The kept items of a collection in their original order, as the list or dict it was read from"""
+    items = [item for _, item in sorted(collection['items'][:collection['kept']], key=lambda item: item[0])]
+    return dict(items) if collection['is_dict'] else items
+
+def compile_insights(insights, budgets, token_budget, indent=2):
+    """Fit the insights document to a token budget
+
+    budgets maps a section name to (priority, [(path, min_items, max_items[, rank]), ...]):
+    path is a tuple of keys inside the section, min_items are always kept and
+    max_items (None for no ceiling) caps the collection in any budget. An
+    optional rank function picks which items are kept first (see
+    collection_items); they are written in the collection's order. Lower
+    priority numbers fill first. Returns the compiled document, which shares
+    everything but the truncated collections with insights, and its size in
+    characters. Raises BudgetError if the minimums alone exceed the budget.
+    With token_budget None every collection keeps up to max_items.
+    """
+    collections = []
+    for section, (_, truncatable) in sorted(budgets.items(), key=lambda item: item[1][0]):
+        if section not in insights:
+            continue
+        for path, *limits in truncatable:
+            collections.append(collection_items(insights, (section, *path), *limits))
+
+    compiled = dict(insights)
+    if token_budget is None:
+        for collection in collections:
+            collection['kept'] = len(collection['items'])
+            set_path(compiled, collection['keys'], build_collection(collection))
+        return compiled, measure_json(compiled, indent)
+
+    limit = token_budget * CHARS_PER_TOKEN
+    for collection in collections:
+        set_path(compiled, collection['keys'], build_collection(collection))
+    size = measure_json(compiled, indent)
+    if size > limit:
+        raise BudgetError(token_budget, -(-size // CHARS_PER_TOKEN))
+
+    pending = [c for c in collections if c['kept'] < len(c['items'])]
+    while pending:
+        for collection in pending:
+            for _ in range(collection['step']):
+                if collection['kept'] == len(collection['items']):
+                    break
+                cost = item_cost(collection, indent)
+                if size + cost > limit:
+                    # Collections are ranked, so later items are not considered once one does not fit
+                    collection['open'] = False
+                    break
+                size += cost
+                collection['kept'] += 1
+        pending = [c for c in pending if c['open'] and c['kept'] < len(c['items'])]
+
+    for collection in collections:
+        set_path(compiled, collection['keys'], build_collection(collection))
+    return compiled, size
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Single-pass JSON writer for the insights documents
+Encodes numpy scalars, pandas objects, timestamps and missing values while
+streaming the document to its file, and measures its size in the same pass
+"""
+
+from datetime import date, datetime
+from json.encoder import encode_basestring_ascii
+import math
+
+import numpy as np
+import pandas as pd
+
+# Rough token estimate used for the LLM context budget: 1 token ≈ 4 characters
+CHARS_PER_TOKEN = 4
+
+def _float_text(value):
+    """Float literal as json.dump writes it (NaN/Infinity allowed)"""
+    if value != value:
+        return 'NaN'
+    if value == math.inf:
+        return 'Infinity'
+    if value == -math.inf:
+        return '-Infinity'
+    return float.__repr__(float(value))
+
+def encode_json(obj, write, indent=2, numpy_text=False, level=0):
+    """Encode obj as JSON, passing each piece of text to write
+
+    The layout matches json.dump(obj, indent=indent). Dict keys are written as
+    str(key), so tuple and numpy keys need no conversion pass. numpy scalars are
+    written as numbers and booleans, pd.NA/NaT as null, timestamps as their
+    string form, and Series/DataFrames through to_dict(); anything else falls
+    back to str(). numpy_text=True writes non-float numpy scalars as strings
+    instead, as json.dump(default=str) does. level is the nesting depth obj is
+    encoded at, for measuring a value that will sit inside a larger document.
+    """
+    def encode(value, level):
+        if isinstance(value, str):
+            write(encode_basestring_ascii(value))
+        elif value is None:
+            write('null')
+        elif value is True or value is False:
+            write('true' if value else 'false')
+        elif isinstance(value, int):
+            write(int.__repr__(value))
+        elif isinstance(value, float):
+            write(_float_text(value))
+        elif isinstance(value, dict):
+            if not value:
+                write('{}')
+                return
+            inner = '\n' + ' ' * (indent * (level + 1))
+            separator = '{' + inner
+            for key, item in value.items():
+                write(separator)
+                write(encode_basestring_ascii(str(key)))
+                write(': ')
+                encode(item, level + 1)
+                separator = ',' + inner
+            write('\n' + ' ' * (indent * level) + '}')
+        elif isinstance(value, (list, tuple)):
+            if not value:
+                write('[]')
+                return
+            inner = '\n' + ' ' * (indent * (level + 1))
+            separator = '[' + inner
+            for item in value:
+                write(separator)
+                encode(item, level + 1)
+                separator = ',' + inner
+            write('\n' + ' ' * (indent * level) + ']')
+        elif isinstance(value, np.generic):
+            if numpy_text and not isinstance(value, np.floating):
+                write(encode_basestring_ascii(str(value)))
+            elif isinstance(value, np.bool_):
+                write('true' if value else 'false')
+            elif isinstance(value, np.integer):
+                write(int.__repr__(int(value)))
+            elif isinstance(value, np.floating):
+                write(_float_text(value))
+            else:
+                encode(value.item(), level)
+        elif value is pd.NA or value is pd.NaT:
+            write('null')
+        elif isinstance(value, (datetime, date)):
+            write(encode_basestring_ascii(str(value)))
+        elif isinstance(value, np.ndarray):
+            encode(value.tolist(), level)
+        elif hasattr(value, 'to_dict'):
+            encode(value.to_dict(), level)
+        else:
+            write(encode_basestring_ascii(str(value)))
+
+    encode(obj, level)
+
+def write_json(obj, path, indent=2, numpy_text=False):
+    """Write obj as JSON to path in one pass and return its size in characters
+
+    Output is ASCII-escaped, so the size in characters is also the size in bytes.
+    """
+    size = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        def write(text):
+            nonlocal size
+            size += len(text)
+            f.write(text)
+        encode_json(obj, write, indent=indent, numpy_text=numpy_text)
+    return size
+
+def measure_json(obj, indent=2, level=0):
+    """Size in characters of obj encoded at the given nesting depth"""
+    size = 0
+    def write(text):
+        nonlocal size
+        size += len(text)
+    encode_json(obj, write, indent=indent, level=level)
+    return size
+
+def estimate_tokens(size):
+    """Approximate token count of a JSON document of the given size in characters"""
+    return size // CHARS_PER_TOKEN
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Local query service for the Pie assistant
+Loads one period's cleaned service records and entity patterns once, indexes
+them by dimension and Collected Date, and answers parameterized filter, group
+and top-k queries as JSON over HTTP, so the assistant can fetch what a question
+needs instead of carrying the whole pie_insights file in its prompt.
+
+  GET /                     period, row counts and the accepted parameters
+  GET /entities             entity patterns, filtered, sorted and cut to the top k
+  GET /entities/summary     risk level counts and overdue rate per group
+  GET /collections/summary  collections, gallons, entities and turnaround per group
+
+Dimension filters take exact values (case-insensitive) and may be repeated to
+match any of several, e.g. /entities?zone=Zone%201&risk_level=critical&limit=5.
+"""
+
+import time
+from urllib.parse import parse_qs
+from wsgiref.simple_server import make_server
+
+import numpy as np
+import pandas as pd
+
+from derived_columns import with_derived_columns
+from frame_index import build_date_index, build_key_index, date_positions, key_positions
+from generate_pie_insights import (
+    DEFAULT_PERIOD, RISK_LEVELS, analysis_period, calculate_entity_patterns, count_risk_levels, load_period_data
+)
+from json_output import encode_json
+
+QUERY_HOST = '127.0.0.1'
+QUERY_PORT = 8765
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 1000
+
+# Query parameter -> column of the collections frame it filters and groups by
+COLLECTION_DIMENSIONS = {
+    'area': 'Area',
+    'sub_area': 'Sub Area',
+    'zone': 'Zone',
+    'category': 'Category',
+    'provider': 'Service Provider',
+    'vehicle': 'Assigned Vehicle',
+    'entity': 'New E ID',
+    'trap_type': 'Trap Type',
+    'month': 'Month',
+    'day_of_week': 'Day_of_Week'
+}
+
+# Query parameter -> column of the entity pattern frame it filters and groups by
+ENTITY_DIMENSIONS = {
+    'area': 'area',
+    'zone': 'zone',
+    'category': 'category',
+    'risk_level': 'risk_level',
+    'entity': 'entity_id'
+}
+
+# Entity filters answered from the collections index: an entity matches if one
+# of its collections in the period has the value
+ENTITY_COLLECTION_FILTERS = ['provider']
+
+# Numeric entity columns that can be sorted on and bounded with min_<column>/max_<column>
+ENTITY_METRICS = ['days_overdue', 'days_since_last', 'avg_interval_days', 'collections_count', 'avg_gallons']
+
+# Per-group collection metrics, in output order
+COLLECTION_METRICS = ['collections', 'gallons', 'avg_gallons', 'entities', 'avg_turnaround_days']
+
+def build_value_index(values):
+    """Row positions of every value of a column, keyed by its lower-cased text"""
+    key_index = build_key_index(values)
+    return {str(key).lower(): key_positions(key_index, key) for key in key_index['keys']}
+
+def load_query_state(period, use_cache=True, strict_schema=False):
+    """Load a period's collections and entity patterns and build their indexes"""
+    df = with_derived_columns(load_period_data(period, use_cache=use_cache, strict_schema=strict_schema),
+                              ['Month', 'Day_of_Week', 'Initiation_to_Collection_Days'])
+    entities = calculate_entity_patterns(df, period['reference_date'])
+    print("Indexing collections and entities...")
+    return {
+        'period': period,
+        'df': df,
+        'entities': entities,
+        'collection_index': {name: build_value_index(df[col]) for name, col in COLLECTION_DIMENSIONS.items()},
+        'entity_index': {name: build_value_index(entities[col]) for name, col in ENTITY_DIMENSIONS.items()},
+        'date_index': build_date_index(df)
+    }
+
+def check_parameters(params, allowed):
+    """Raise ValueError for a query parameter the endpoint does not accept"""
+    unknown = sorted(set(params) - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown parameter {unknown[0]!r}; accepted: {', '.join(sorted(allowed))}")
+
+def single(params, name, default=None):
+    """The value of a parameter that may only be given once"""
+    values = params.get(name)
+    if not values:
+        return default
+    if len(values) > 1:
+        raise ValueError(f"{name} may only be given once")
+    return values[0]
+
+def choice(params, name, options, default):
+    """A single parameter value that must be one of options"""
+    value = single(params, name, default)
+    if value not in options:
+        raise ValueError(f"{name} must be one of: {', '.join(options)}")
+    return value
+
+def limit_parameter(params):
+    """The k of a top-k query"""
+    limit = int(single(params, 'limit', DEFAULT_LIMIT))
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+def dimension_mask(indexes, params, rows):
+    """Mask of the rows matching every dimension filter in params (any of its values)"""
+    mask = np.ones(rows, dtype=bool)
+    for name, index in indexes.items():
+        if name not in params:
+            continue
+        matched = np.zeros(rows, dtype=bool)
+        for value in params[name]:
+            positions = index.get(value.lower())
+            if positions is not None:
+                matched[positions] = True
+        mask &= matched
+    return mask
+
+def date_mask(date_index, params, rows):
+    """Mask of the collections in the inclusive [start, end] Collected Date range, or None"""
+    start, end = single(params, 'start'), single(params, 'end')
+    if start is None and end is None:
+        return None
+    mask = np.zeros(rows, dtype=bool)
+    mask[date_positions(date_index, start, end)] = True
+    return mask
+
+def collection_mask(state, params):
+    """Mask of the collections matching the dimension and date filters"""
+    rows = len(state['df'])
+    mask = dimension_mask(state['collection_index'], params, rows)
+    window = date_mask(state['date_index'], params, rows)
+    return mask if window is None else mask & window
+
+def entity_mask(state, params):
+    """Mask of the entities matching the dimension and collection filters and min_/max_ metric bounds"""
+    entities = state['entities']
+    mask = dimension_mask(state['entity_index'], params, len(entities))
+    for name in ENTITY_COLLECTION_FILTERS:
+        if name in params:
+            rows = dimension_mask({name: state['collection_index'][name]}, params, len(state['df']))
+            mask &= entities['entity_id'].isin(state['df']['New E ID'].to_numpy()[rows]).to_numpy()
+    for metric in ENTITY_METRICS:
+        values = entities[metric].to_numpy(dtype=float)
+        low, high = single(params, f"min_{metric}"), single(params, f"max_{metric}")
+        if low is not None:
+            mask &= values >= float(low)
+        if high is not None:
+            mask &= values <= float(high)
+    return mask
+
+def records(table, key=None):
+    """Rows of a table as dicts, NaN as None, with the index under key if given"""
+    if key is not None:
+        table = table.rename_axis(key).reset_index()
+    table = table.astype(object).where(table.notna(), None)
+    return table.to_dict('records')
+
+def top_rows(table, params, sort_options, default_sort):
+    """Table sorted by the sort parameter (descending unless order=asc), cut to limit rows"""
+    sort = choice(params, 'sort', sort_options, default_sort)
+    ascending = choice(params, 'order', ['desc', 'asc'], 'desc') == 'asc'
+    return table.sort_values(sort, ascending=ascending, kind='stable', na_position='last').head(limit_parameter(params))
+
+def query_entities(state, params):
+    """Entities matching the filters, top k by a metric (days_overdue by default)"""
+    check_parameters(params, [*ENTITY_DIMENSIONS, *ENTITY_COLLECTION_FILTERS, 'sort', 'order', 'limit',
+                              *[f"{bound}_{metric}" for metric in ENTITY_METRICS for bound in ('min', 'max')]])
+    entities = state['entities']
+    selected = entities[entity_mask(state, params)]
+    top = top_rows(selected, params, ENTITY_METRICS, 'days_overdue')
+    return {'matched': len(selected), 'entities': records(top.assign(risk_level=top['risk_level'].astype(str)))}
+
+def query_entity_summary(state, params):
+    """Risk level counts per group of entities matching the filters, top k by overdue rate"""
+    group_dimensions = [name for name in ENTITY_DIMENSIONS if name != 'entity']
+    check_parameters(params, [*ENTITY_DIMENSIONS, *ENTITY_COLLECTION_FILTERS, 'group_by', 'sort', 'order', 'limit'])
+    group_by = choice(params, 'group_by', group_dimensions, 'zone')
+    selected = state['entities'][entity_mask(state, params)]
+
+    table = count_risk_levels(selected, by=ENTITY_DIMENSIONS[group_by])
+    overdue = table['total'] - table['normal']
+    table['overdue_rate'] = (overdue / table['total'] * 100).round(1)
+    table['avg_days_overdue'] = selected.groupby(ENTITY_DIMENSIONS[group_by], observed=True,
+                                                 dropna=False)['days_overdue'].mean().round(1)
+    top = top_rows(table, params, [*RISK_LEVELS, 'total', 'overdue_rate', 'avg_days_overdue'], 'overdue_rate')
+    return {
+        'group_by': group_by,
+        'matched': len(selected),
+        'totals': count_risk_levels(selected).to_dict(),
+        'groups': records(top, key=group_by)
+    }
+
+def collection_metrics(groups):
+    """COLLECTION_METRICS of each group of a collections groupby"""
+    gallons = groups['Sum of Gallons Collected']
+    return pd.DataFrame({
+        'collections': groups.size(),
+        'gallons': gallons.sum(),
+        'avg_gallons': gallons.mean().round(1),
+        'entities': groups['New E ID'].nunique(),
+        'avg_turnaround_days': groups['Initiation_to_Collection_Days'].mean().round(1)
+    })
+
+def query_collection_summary(state, params):
+    """Collection metrics of the matching collections, overall and per group, top k by a metric"""
+    check_parameters(params, [*COLLECTION_DIMENSIONS, 'start', 'end', 'group_by', 'sort', 'order', 'limit'])
+    group_by = choice(params, 'group_by', list(COLLECTION_DIMENSIONS), 'area')
+    selected = state['df'][collection_mask(state, params)]
+
+    totals = collection_metrics(selected.assign(_all='all').groupby('_all'))
+    table = collection_metrics(selected.groupby(COLLECTION_DIMENSIONS[group_by], observed=True, sort=False))
+    top = top_rows(table, params, COLLECTION_METRICS, 'collections')
+    return {
+        'group_by': group_by,
+        'matched': len(selected),
+        'totals': records(totals)[0] if len(selected) else None,
+        'group_count': len(table),
+        'groups': records(top, key=group_by)
+    }
+
+def describe_service(state, params):
+    """What the service has loaded and the parameters each query accepts"""
+    period = state['period']
+    return {
+        'period': period['label'],
+        'start': period['start'].strftime('%Y-%m-%d'),
+        'end': period['end'].strftime('%Y-%m-%d'),
+        'reference_date': period['reference_date'].strftime('%Y-%m-%d'),
+        'collections': len(state['df']),
+        'entities': len(state['entities']),
+        'queries': {
+            '/entities': {'filters': [*ENTITY_DIMENSIONS, *ENTITY_COLLECTION_FILTERS], 'bounds': [f"min_/max_{m}" for m in ENTITY_METRICS],
+                          'sort': ENTITY_METRICS},
+            '/entities/summary': {'filters': [*ENTITY_DIMENSIONS, *ENTITY_COLLECTION_FILTERS],
+                                  'group_by': [name for name in ENTITY_DIMENSIONS if name != 'entity']},
+            '/collections/summary': {'filters': [*COLLECTION_DIMENSIONS, 'start', 'end'],
+                                     'group_by': list(COLLECTION_DIMENSIONS), 'sort': COLLECTION_METRICS}
+        },
+        'common': {'order': ['desc', 'asc'], 'limit': f"1-{MAX_LIMIT} (default {DEFAULT_LIMIT})"}
+    }
+
+# Path -> query function(state, params)
+QUERY_ROUTES = {
+    '/': describe_service,
+    '/entities': query_entities,
+    '/entities/summary': query_entity_summary,
+    '/collections/summary': query_collection_summary
+}
+
+def run_query(state, path, query_string):
+    """Answer one request; returns the HTTP status and the response document"""
+    query = QUERY_ROUTES.get(path.rstrip('/') or '/')
+    if query is None:
+        return '404 Not Found', {'error': f"Unknown path {path}", 'paths': list(QUERY_ROUTES)}
+
+    started = time.perf_counter()
+    try:
+        result = query(state, parse_qs(query_string))
+    except ValueError as e:
+        return '400 Bad Request', {'error': str(e)}
+    result['query_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return '200 OK', result
+
+def query_app(state):
+    """WSGI application answering queries against a loaded state"""
+    def app(environ, start_response):
+        status, document = run_query(state, environ.get('PATH_INFO', '/'), environ.get('QUERY_STRING', ''))
+        parts = []
+        encode_json(document, parts.append)
+        body = ''.join(parts).encode('utf-8')
+        start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+        return [body]
+    return app
+
+def main(period=DEFAULT_PERIOD, reference_date=None, host=QUERY_HOST, port=QUERY_PORT, use_cache=True,
+         strict_schema=False):
+    """Load the period and serve queries until interrupted"""
+    period = analysis_period(period, reference_date)
+    state = load_query_state(period, use_cache=use_cache, strict_schema=strict_schema)
+    with make_server(host, port, query_app(state)) as server:
+        print(f"Serving {len(state['df']):,} collections and {len(state['entities']):,} entities "
+              f"of {period['label']} on http://{host}:{port}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Stopped")
+
+if __name__ == "__main__":
+    import sys
+    def option(flag, default=None):
+        return sys.argv[sys.argv.index(flag) + 1] if flag in sys.argv else default
+    main(
+        period=option("--period", DEFAULT_PERIOD),
+        reference_date=option("--reference-date"),
+        host=option("--host", QUERY_HOST),
+        port=int(option("--port", QUERY_PORT)),
+        use_cache="--no-cache" not in sys.argv,
+        strict_schema="--strict-schema" in sys.argv
+    )
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Dependency-aware execution of analysis sections
+Sections run in declaration order, or with --workers N the sections no other
+section reads run concurrently on one process pool. The sections they depend
+on (the aggregation cube, collection state and patterns) run first in the
+parent, and the pool is forked after them, so the shared frame and those
+row-sized intermediates are inherited by the workers instead of being pickled
+in either direction; only the final, small section results travel back.
+Aggregates that merge (the cube, the column profile) are built the same way,
+one consecutive range of rows per worker (see map_row_ranges).
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from stage_trace import add_events, call_traced, take_events
+
+# Inputs and tasks of the pool being run; inherited by forked workers
+_shared = {}
+_tasks = {}
+
+def _run_task(name):
+    func, deps, _ = _tasks[name]
+    take_events()  # drop the stages the worker inherited from the parent
+    result = call_traced(name, func, [_shared[dep] for dep in deps])
+    return result, take_events()
+
+def fork_available():
+    """Check whether worker processes can inherit memory from the parent"""
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+def parse_workers(argv, default=1):
+    """Read the --workers N command line option"""
+    if "--workers" not in argv:
+        return default
+    return max(1, int(argv[argv.index("--workers") + 1]))
+
+def intermediate_sections(sections):
+    """Names of the sections other sections depend on"""
+    return {dep for _, deps, _ in sections.values() for dep in deps if dep in sections}
+
+def run_sections(sections, shared, workers=1):
+    """Run analysis sections in dependency order
+
+    sections maps a result name to (function, dependency names, progress message);
+    dependencies are keys of shared or names of earlier sections, and the function
+    is called with them positionally. Returns shared extended with every result.
+    Each section is recorded as a stage of the active trace (see stage_trace.py).
+    With workers > 1 the sections no other section depends on run on a process
+    pool once the others are computed.
+    """
+    global _shared, _tasks
+
+    results = dict(shared)
+    if workers > 1 and not fork_available():
+        print("[WARNING] Process fork not available - running sections sequentially")
+        workers = 1
+
+    intermediates = intermediate_sections(sections)
+    pooled = {}
+    for name, (func, deps, message) in sections.items():
+        missing = [dep for dep in deps if dep not in results]
+        if missing:
+            raise ValueError(f"Section '{name}' depends on {missing}, which are not computed before it")
+        if workers > 1 and name not in intermediates:
+            pooled[name] = (func, deps, message)
+            continue
+        if message:
+            print(message)
+        results[name] = call_traced(name, func, [results[dep] for dep in deps])
+
+    if len(pooled) == 1:
+        [(name, (func, deps, message))] = pooled.items()
+        if message:
+            print(message)
+        results[name] = call_traced(name, func, [results[dep] for dep in deps])
+    elif pooled:
+        for name, (_, _, message) in pooled.items():
+            if message:
+                print(message)
+        _shared, _tasks = results, pooled
+        try:
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=min(workers, len(pooled)), mp_context=context) as pool:
+                futures = {name: pool.submit(_run_task, name) for name in pooled}
+                for name, future in futures.items():
+                    results[name], events = future.result()
+                    add_events(events)
+        finally:
+            _shared, _tasks = {}, {}
+
+    return results
+
+def row_ranges(rows, parts):
+    """Bounds [start, stop) of up to parts consecutive ranges of near-equal size covering rows rows"""
+    bounds = np.linspace(0, rows, max(1, min(parts, rows)) + 1).astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+def map_row_ranges(name, func, df, workers=1):
+    """Call func(rows, row_offset) on consecutive ranges of df's rows, one per worker
+
+    The ranges run as sections of one run_sections pool, so the workers
+    inherit them from the parent instead of receiving pickled copies, and each
+    is recorded as a stage name[i] of the active trace. row_offset is the
+    position of the range's first row in df. Returns the results in row
+    order, for the caller to merge (e.g. with merge_cubes).
+    """
+    shared, sections = {}, {}
+    for i, (start, stop) in enumerate(row_ranges(len(df), workers)):
+        section = f"{name}[{i}]"
+        shared[f"{section}:rows"], shared[f"{section}:offset"] = df.iloc[start:stop], start
+        sections[section] = (func, [f"{section}:rows", f"{section}:offset"], None)
+    results = run_sections(sections, shared, workers=workers)
+    return [results[section] for section in sections]
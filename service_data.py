@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Shared loading and cleaning of the Blue Data Analysis service records
+Used by data_analysis.py and generate_pie_insights.py
+"""
+
+import numpy as np
+import pandas as pd
+
+from frame_cache import cache_chunks, cached_frame_current, load_cached_frame, store_cached_frame
+from frame_snapshot import load_snapshot, store_snapshot
+
+CSV_PATH = 'public/Blue Data Analysis.csv'
+
+# Ingestion schema. Dates use the MM/DD/YYYY layout that migrate-data.js parseDate
+# assumes; low-cardinality text columns load as categoricals and counts as compact
+# nullable integers (widened to Int64 if a value does not fit).
+DATE_FORMAT = '%m/%d/%Y'
+DATE_COLUMNS = ['Collected Date', 'Discharged Date', 'Initiated Date']
+CATEGORICAL_COLUMNS = [
+    'Area', 'Sub Area', 'Zone', 'Category', 'Sub Category', 'Service Provider',
+    'Assigned Vehicle', 'Trap Type', 'Status', 'Initiator'
+]
+INTEGER_COLUMNS = {
+    'Sum of Gallons Collected': 'Int32',
+    'Sum of No of Traps': 'Int16',
+    'Trade License Number': 'Int32'
+}
+NUMERIC_COLUMNS = list(INTEGER_COLUMNS)
+
+# Rows per chunk when scanning the CSV for a date window
+CSV_CHUNK_ROWS = 200_000
+
+# Bump whenever the schema or clean_service_data changes so cached frames are rebuilt
+CLEANING_VERSION = 3
+
+class SchemaError(ValueError):
+    """Raised in strict mode when rows do not match the ingestion schema"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        summary = failures.groupby(['column', 'rule']).size()
+        details = ', '.join(f"{column} ({rule}): {count:,}" for (column, rule), count in summary.items())
+        super().__init__(f"{failures['row'].nunique():,} rows fail the ingestion schema - {details}")
+
+def parse_dates(values):
+    """Parse a date column with the declared format
+
+    Values that do not match DATE_FORMAT fall back to per-value parsing so a
+    stray layout does not silently become NaT; only those rows pay for inference.
+    Returns the parsed column and the mask of values that did not match the format.
+    """
+    parsed = pd.to_datetime(values, format=DATE_FORMAT, errors='coerce')
+    mismatched = parsed.isna() & values.notna()
+    if mismatched.any():
+        parsed[mismatched] = pd.to_datetime(values[mismatched], format='mixed', errors='coerce')
+    return parsed, mismatched
+
+def parse_integers(values, dtype):
+    """Convert a column to a nullable integer dtype
+
+    Returns the converted column and the mask of values that were not integers.
+    Columns holding fractional values stay float64.
+    """
+    numeric = pd.to_numeric(values, errors='coerce')
+    invalid = numeric.isna() & values.notna()
+    fractional = numeric.notna() & (numeric % 1 != 0)
+    if fractional.any():
+        return numeric, invalid | fractional
+
+    info = np.iinfo(dtype.lower())
+    if numeric.notna().any() and (numeric.min() < info.min or numeric.max() > info.max):
+        dtype = 'Int64'
+    return numeric.astype(dtype), invalid
+
+def read_service_csv(csv_path=CSV_PATH):
+    """Read the raw CSV with text dimensions loaded directly as categoricals"""
+    return pd.read_csv(csv_path, dtype={col: 'category' for col in CATEGORICAL_COLUMNS})
+
+def apply_schema(df):
+    """Apply the ingestion schema to a raw CSV frame in place
+
+    Values that fail the schema are coerced to NaT/NA. Returns the frame and a
+    report with one row per (row position, column, rule) failure.
+    """
+    failures = []
+    for col in DATE_COLUMNS:
+        df[col], mismatched = parse_dates(df[col])
+        failures.append((col, 'date_format', mismatched))
+    for col, dtype in INTEGER_COLUMNS.items():
+        df[col], invalid = parse_integers(df[col], dtype)
+        failures.append((col, 'integer', invalid))
+
+    report = pd.concat([
+        pd.DataFrame({'row': np.flatnonzero(mask.to_numpy()), 'column': col, 'rule': rule})
+        for col, rule, mask in failures
+    ], ignore_index=True)
+    return df, report.sort_values('row', kind='stable', ignore_index=True)
+
+def clean_service_data(df, strict=False):
+    """Apply the ingestion schema to the raw CSV frame
+
+    Values that fail the schema are coerced to NaT/NA. With strict=True the
+    failing rows are reported by raising SchemaError instead.
+    """
+    df, failures = apply_schema(df)
+    if strict and len(failures):
+        raise SchemaError(failures)
+    return df
+
+def date_window_mask(df, start=None, end=None):
+    """Mask of rows whose Collected Date lies in the inclusive [start, end] window"""
+    collected = df['Collected Date']
+    mask = collected.notna()
+    if start is not None:
+        mask &= collected >= pd.to_datetime(start)
+    if end is not None:
+        mask &= collected <= pd.to_datetime(end)
+    return mask
+
+def date_window_filters(start=None, end=None):
+    """Parquet filters equivalent to date_window_mask (comparisons drop null dates)"""
+    filters = []
+    if start is not None:
+        filters.append(('Collected Date', '>=', pd.to_datetime(start)))
+    if end is not None:
+        filters.append(('Collected Date', '<=', pd.to_datetime(end)))
+    return filters
+
+def read_service_chunks(csv_path=CSV_PATH, chunk_rows=CSV_CHUNK_ROWS, failures=None):
+    """Yield the CSV as typed frames of up to chunk_rows rows
+
+    Text dimensions are left as strings. If a list is given as failures, the
+    schema failure report of each chunk is appended to it, with row positions
+    counted from the start of the file.
+    """
+    text_dtypes = {col: 'str' for col in CATEGORICAL_COLUMNS}
+    offset = 0
+    for chunk in pd.read_csv(csv_path, dtype=text_dtypes, chunksize=chunk_rows):
+        chunk, chunk_failures = apply_schema(chunk)
+        if failures is not None:
+            chunk_failures['row'] += offset
+            failures.append(chunk_failures)
+        offset += len(chunk)
+        yield chunk
+
+def categorize_dimensions(df):
+    """Convert the text dimensions left as strings to categoricals, in place"""
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+def scan_service_csv(csv_path=CSV_PATH, start=None, end=None, strict=False, chunk_rows=CSV_CHUNK_ROWS,
+                     warm_cache=False):
+    """Read only the rows of a date window from the CSV, one chunk at a time
+
+    Each chunk is typed and filtered before the next is read, so peak memory
+    follows the size of the window rather than the whole extract. With
+    warm_cache=True every typed chunk is also written to the cleaned frame
+    cache before it is filtered (see frame_cache.cache_chunks), so later
+    windows are read from the cache.
+    """
+    kept, failures = [], []
+    chunks = read_service_chunks(csv_path, chunk_rows, failures)
+    if warm_cache:
+        chunks = cache_chunks(chunks, csv_path, 'clean', CLEANING_VERSION)
+    for chunk in chunks:
+        kept.append(chunk[date_window_mask(chunk, start, end)])
+
+    failures = pd.concat(failures, ignore_index=True) if failures else []
+    if strict and len(failures):
+        raise SchemaError(failures)
+
+    if not kept:
+        # No chunk at all (a header-only file): type the empty frame the same way
+        empty = pd.read_csv(csv_path, dtype={col: 'str' for col in CATEGORICAL_COLUMNS}, nrows=0)
+        kept.append(apply_schema(empty)[0])
+    return categorize_dimensions(pd.concat(kept, ignore_index=True))
+
+def value_counts(series):
+    """Series.value_counts with object-dtype semantics for categorical columns
+
+    Unobserved categories are dropped and tied counts keep first-appearance
+    order, so report output does not depend on a dimension being categorical.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.value_counts()
+
+    codes = series.cat.codes.to_numpy()
+    uniques, first_seen, counts = np.unique(codes[codes >= 0], return_index=True, return_counts=True)
+    by_appearance = np.argsort(first_seen, kind='stable')
+    uniques, counts = uniques[by_appearance], counts[by_appearance]
+    by_count = np.argsort(-counts, kind='stable')
+    index = pd.Index(series.cat.categories[uniques[by_count]], name=series.name)
+    return pd.Series(counts[by_count], index=index, name='count')
+
+def load_service_data(csv_path=CSV_PATH, use_cache=True, strict=False, start=None, end=None):
+    """Load the cleaned, typed service frame, reusing the columnar cache when valid
+
+    The memory-mapped snapshot is tried first: its columns are shared with
+    every other process that maps it, and a window is cut from it with a mask.
+    Without one, when a [start, end] Collected Date window is given only rows
+    inside it are materialized from the cache via Parquet filters (row groups
+    outside the window are skipped). Windowed loads that miss the cache, and
+    all windowed loads in strict mode, scan the CSV in chunks and keep only
+    the window's rows in memory; the scan warms a cold cache chunk by chunk.
+    Strict mode always re-reads the CSV, since schema failures are only
+    visible in the raw text.
+    """
+    windowed = start is not None or end is not None
+    if use_cache and not strict:
+        df = load_snapshot(csv_path, 'clean', CLEANING_VERSION)
+        if df is not None:
+            print(f"Using memory-mapped snapshot of {csv_path}")
+            return df[date_window_mask(df, start, end)].reset_index(drop=True) if windowed else df
+
+        filters = date_window_filters(start, end) if windowed else None
+        df = load_cached_frame(csv_path, 'clean', CLEANING_VERSION, filters=filters)
+        if df is not None:
+            print(f"Using cached cleaned data for {csv_path}")
+            # Frames cached chunk by chunk hold the dimensions as strings
+            df = categorize_dimensions(df)
+            if not windowed:
+                store_snapshot(df, csv_path, 'clean', CLEANING_VERSION)
+            return df
+
+    if windowed:
+        warm_cache = use_cache and not cached_frame_current(csv_path, 'clean', CLEANING_VERSION)
+        return scan_service_csv(csv_path, start, end, strict=strict, warm_cache=warm_cache)
+
+    df = clean_service_data(read_service_csv(csv_path), strict=strict)
+
+    if use_cache:
+        store_cached_frame(df, csv_path, 'clean', CLEANING_VERSION)
+        store_snapshot(df, csv_path, 'clean', CLEANING_VERSION)
+    return df
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Per-stage instrumentation of the analysis scripts
+While a trace is active every stage (main steps and each section run by
+run_sections) records wall time, CPU time, peak RSS and the rows it read. The
+trace is written as JSON lines and as a Chrome trace (chrome://tracing,
+Perfetto), and named stages can be run under cProfile.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Events recorded since start_trace (None while not tracing), the open stages
+# and the trace settings; inherited by forked section workers
+_events = None
+_stack = []
+_settings = {}
+
+def peak_rss_mb():
+    """High-water mark of the process resident set size so far, in MiB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return round(peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1)
+
+def parse_trace_options(argv):
+    """Read the --trace FILE, --chrome-trace FILE and --profile NAME[,NAME] options"""
+    def value(flag):
+        return argv[argv.index(flag) + 1] if flag in argv else None
+    profile = value("--profile")
+    return {
+        'jsonl_path': value("--trace"),
+        'chrome_path': value("--chrome-trace"),
+        'profile': profile.split(",") if profile else []
+    }
+
+def start_trace(jsonl_path=None, chrome_path=None, profile=()):
+    """Start recording stages if a trace file or a stage to profile is given
+
+    Stages named in profile are run under cProfile; their statistics are
+    written to profile_<stage>.prof and the slowest functions printed.
+    """
+    global _events, _stack, _settings
+    if not (jsonl_path or chrome_path or profile):
+        return
+    _events, _stack = [], []
+    _settings = {'jsonl_path': jsonl_path, 'chrome_path': chrome_path, 'profile': set(profile),
+                 'origin': time.perf_counter()}
+
+def row_count(args):
+    """Rows of a stage's first argument if it is a data frame, else None"""
+    return len(args[0]) if args and isinstance(args[0], pd.DataFrame) else None
+
+@contextmanager
+def traced_stage(name, rows=None):
+    """Record the enclosed block as a stage
+
+    Yields the event being recorded (a throwaway dict while not tracing), so
+    the block can set event['rows'] once it knows how many rows it read.
+    """
+    if _events is None:
+        yield {}
+        return
+
+    event = {'stage': name, 'parent': _stack[-1] if _stack else None, 'pid': os.getpid(), 'rows': rows}
+    profiler = cProfile.Profile() if name in _settings['profile'] else None
+    _stack.append(name)
+    start, cpu = time.perf_counter(), time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield event
+    finally:
+        if profiler:
+            profiler.disable()
+        event['start_s'] = round(start - _settings['origin'], 6)
+        event['wall_s'] = round(time.perf_counter() - start, 6)
+        event['cpu_s'] = round(time.process_time() - cpu, 6)
+        event['peak_rss_mb'] = peak_rss_mb()
+        _stack.pop()
+        if profiler:
+            event['profile'] = write_profile(profiler, name)
+        _events.append(event)
+        print(f"[TRACE] {name}: {event['wall_s']:.3f}s wall, {event['cpu_s']:.3f}s CPU, "
+              f"peak RSS {event['peak_rss_mb']} MiB")
+
+def write_profile(profiler, name):
+    """Save a stage's cProfile statistics and print its slowest functions"""
+    path = f"profile_{name.replace(' ', '_').replace('/', '_')}.prof"
+    profiler.dump_stats(path)
+    print(f"[TRACE] cProfile of {name} written to {path}")
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+    return path
+
+def call_traced(name, func, args):
+    """Call func(*args) as a stage reading the rows of its first argument"""
+    with traced_stage(name, rows=row_count(args)):
+        return func(*args)
+
+def take_events():
+    """Remove and return the events recorded so far (to ship them from a worker)"""
+    if _events is None:
+        return []
+    events = list(_events)
+    del _events[:]
+    return events
+
+def add_events(events):
+    """Add events recorded in a worker process to the trace"""
+    if _events is not None:
+        _events.extend(events)
+
+def chrome_trace(events):
+    """Events in the Chrome trace event format (complete events, in microseconds)"""
+    return {
+        'traceEvents': [{
+            'name': event['stage'],
+            'cat': 'stage',
+            'ph': 'X',
+            'ts': round(event['start_s'] * 1e6),
+            'dur': round(event['wall_s'] * 1e6),
+            'pid': event['pid'],
+            'tid': event['pid'],
+            'args': {key: event[key] for key in ('cpu_s', 'peak_rss_mb', 'rows', 'parent') if event.get(key) is not None}
+        } for event in events],
+        'displayTimeUnit': 'ms'
+    }
+
+def finish_trace():
+    """Write the recorded stages to the trace files and stop tracing"""
+    global _events
+    if _events is None:
+        return
+    events = sorted(_events, key=lambda event: event['start_s'])
+    if _settings['jsonl_path']:
+        with open(_settings['jsonl_path'], 'w', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event) + '\n')
+        print(f"Stage trace written to {_settings['jsonl_path']}")
+    if _settings['chrome_path']:
+        with open(_settings['chrome_path'], 'w', encoding='utf-8') as f:
+            json.dump(chrome_trace(events), f)
+        print(f"Chrome trace written to {_settings['chrome_path']}")
+    _events = None
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Mergeable sketches for the approximate statistics mode
+HyperLogLog registers for distinct counts, logarithmic value buckets for
+quantiles with a relative error bound, and frequent-item counters for the most
+common values. Each is built per batch of rows and merged without the raw column.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+def hll_precision(relative_error):
+    """Register count exponent giving the requested standard error (1.04 / sqrt(m))"""
+    return min(18, max(4, math.ceil(2 * math.log2(1.04 / relative_error))))
+
+def hash_values(series):
+    """Stable 64-bit hashes of the non-null values of a column
+
+    Categorical and text columns holding the same values hash alike, so
+    sketches of batches read with different dtypes can be merged.
+    """
+    return pd.util.hash_pandas_object(series.dropna(), index=False).to_numpy()
+
+def distinct_hashes(series):
+    """Sorted distinct 64-bit hashes of the non-null values of a column, compared as text
+
+    An exact distinct set at 8 bytes per value (hash collisions are negligible
+    for millions of values) that merges with np.union1d. Numbers and the text
+    they were read from hash alike.
+    """
+    return np.unique(hash_values(series.dropna().astype(str)))
+
+def _register_positions(hashes, precision):
+    """HyperLogLog register index and rank of each hash"""
+    width = 64 - precision
+    index = (hashes >> np.uint64(width)).astype(np.int64)
+    rest = (hashes & np.uint64((1 << width) - 1)).astype(np.float64)
+    bit_length = np.frexp(rest)[1]
+    rank = np.clip(width - bit_length + 1, 1, width + 1).astype(np.uint8)
+    return index, rank
+
+def hll_registers(series, precision):
+    """HyperLogLog registers of the distinct non-null values of a column"""
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    index, rank = _register_positions(hash_values(series), precision)
+    np.maximum.at(registers, index, rank)
+    return registers
+
+def hll_group_registers(keys, series, precision):
+    """HyperLogLog registers of a column per group key
+
+    Returns the group keys (rows with a missing key or value are skipped) and
+    one row of registers per key.
+    """
+    present = (keys.notna() & series.notna()).to_numpy()
+    codes, uniques = pd.factorize(keys[present])
+    registers = np.zeros((len(uniques), 1 << precision), dtype=np.uint8)
+    index, rank = _register_positions(hash_values(series[present]), precision)
+    np.maximum.at(registers, (codes, index), rank)
+    return pd.Index(np.asarray(uniques, dtype=object)), registers
+
+def merge_group_registers(*sketches):
+    """Merge per-group HyperLogLog registers (register-wise maximum)"""
+    keys = sketches[0][0].append([s[0] for s in sketches[1:]]).unique()
+    registers = np.zeros((len(keys), sketches[0][1].shape[1]), dtype=np.uint8)
+    for group_keys, group_registers in sketches:
+        positions = keys.get_indexer(group_keys)
+        registers[positions] = np.maximum(registers[positions], group_registers)
+    return keys, registers
+
+def hll_estimate(registers):
+    """Distinct count estimate from registers (1-D, or one row per group)"""
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.power(2.0, -registers.astype(np.float64)).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    # Linear counting is more accurate while many registers are still empty
+    small = (estimate <= 2.5 * m) & (zeros > 0)
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    estimate = np.where(small, linear, estimate)
+    return np.rint(estimate).astype(np.int64)
+
+def bucket_values(values, relative_error):
+    """Replace values by the representative of their logarithmic bucket
+
+    Every value is mapped to within relative_error of itself, and the number of
+    distinct buckets grows only with the logarithm of the value range, so a
+    histogram of bucketed values is a mergeable quantile sketch (as in DDSketch).
+    """
+    gamma = (1 + relative_error) / (1 - relative_error)
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bucket = np.ceil(np.log(magnitude) / np.log(gamma))
+        representative = np.sign(values) * 2 * np.power(gamma, bucket) / (gamma + 1)
+    return np.where(magnitude > 0, representative, values)
+
+def prune_frequent(table, capacity):
+    """Keep a value/count table to capacity entries (Misra-Gries)
+
+    All counts are lowered by the (capacity + 1)-th largest and values left at
+    zero are dropped, so counts stay underestimates by at most n / (capacity + 1)
+    and every value more frequent than that is kept.
+    """
+    if len(table) <= capacity:
+        return table
+    cutoff = table['count'].nlargest(capacity + 1).iloc[-1]
+    table = table.assign(count=table['count'] - cutoff)
+    return table[table['count'] > 0].reset_index(drop=True)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Synthetic Blue Data Analysis extracts for benchmarking
+Writes CSVs with the columns and layout of the service extract at any number of
+rows: entities collected at regular intervals, areas and zones from
+public/areas.csv and public/zones.csv, and category, trap, provider and
+turnaround mixes modelled on the Q1 2023 report. Rows are generated and written
+one batch of entities at a time, so memory stays flat however large the extract.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from service_data import CSV_CHUNK_ROWS
+
+AREAS_PATH = 'public/areas.csv'
+ZONES_PATH = 'public/zones.csv'
+
+# Column order of the extract
+COLUMNS = [
+    'Service Report', 'New E ID', 'Service Provider', 'Collected Date', 'Discharged Date', 'Initiated Date',
+    'Area', 'Assigned Vehicle', 'Category', 'Discharge TXN', 'Entity Mapping.Outlet', 'Sum of Gallons Collected',
+    'Initiator', 'Sum of No of Traps', 'Status', 'Sub Area', 'Sub Category', 'Trade License Number',
+    'Trap Label', 'Trap Type', 'Zone'
+]
+
+# Default collection window; it covers Q1 2023, the default Pie period
+SYNTHETIC_START = '2022-10-01'
+SYNTHETIC_DAYS = 273
+
+# Category -> share of entities
+CATEGORY_SHARES = {
+    'Restaurant': 0.485, 'Accommodation': 0.128, 'Cafeteria': 0.096, 'Catering': 0.065,
+    'Supermarket': 0.065, 'Coffee Shop': 0.049, 'Hotel': 0.046, 'Bakery /confectionery': 0.044,
+    'Mall': 0.018, 'Hospital': 0.002, 'School': 0.002
+}
+
+# Trap type -> (gallons per collection, share of entities)
+TRAP_TYPES = {
+    'AG2': (25, 0.251), 'AG1': (15, 0.199), 'B': (100, 0.194), 'A': (40, 0.124), 'C': (135, 0.108),
+    'D': (15, 0.103), 'AG3': (40, 0.006), 'Coffee Catcher': (11, 0.004), 'Custom GT 30 GL': (30, 0.002),
+    'TNK-250-300(1)': (250, 0.002), 'TNK-600-700(1)': (600, 0.002), 'Kessel ( 1578 )': (1578, 0.002),
+    'ACO NS 15 SEPARATOR (ROUND)': (954, 0.001), 'CUSTOM GT 5GL': (5, 0.002)
+}
+
+# Days between collections -> share of entities
+INTERVAL_SHARES = {7: 0.15, 10: 0.35, 14: 0.2, 21: 0.1, 30: 0.1, 45: 0.05, 60: 0.05}
+
+PROVIDER_COUNT = 66
+VEHICLE_COUNT = 167
+SUB_AREAS_PER_AREA = 4
+SUB_CATEGORIES_PER_CATEGORY = 3
+
+# Per-collection rates: collected at another provider, overdue visit, missing Collected Date
+PROVIDER_SWITCH_RATE = 0.1
+OVERDUE_RATE = 0.03
+MISSING_DATE_RATE = 0.001
+
+def zipf_shares(count, exponent=1.0):
+    """Shares of count items whose popularity falls off with rank"""
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+def synthetic_catalogue(rng, areas_path=AREAS_PATH, zones_path=ZONES_PATH):
+    """Dimension values of a synthetic extract and how often each occurs
+
+    Areas get popularity by rank and a zone each (every zone covers at least
+    one area); every vehicle belongs to one provider.
+    """
+    areas = pd.read_csv(areas_path)['area_id'].to_numpy(dtype=object)
+    zones = pd.read_csv(zones_path)['zone_id'].to_numpy(dtype=object)
+    area_zone = rng.permutation(np.resize(np.arange(len(zones)), len(areas)))
+
+    vehicle_provider = np.concatenate([
+        np.arange(PROVIDER_COUNT),
+        rng.choice(PROVIDER_COUNT, VEHICLE_COUNT - PROVIDER_COUNT, p=zipf_shares(PROVIDER_COUNT))
+    ])
+    vehicle_provider.sort(kind='stable')
+    vehicle_letters = rng.choice(list('ABCDEFGHIJKLMNOPQRS'), VEHICLE_COUNT)
+    vehicle_numbers = rng.choice(np.arange(10000, 100000), VEHICLE_COUNT, replace=False)
+
+    return {
+        'areas': areas,
+        'area_shares': zipf_shares(len(areas)),
+        'area_zones': zones[area_zone],
+        'categories': np.array(list(CATEGORY_SHARES), dtype=object),
+        'category_shares': np.array(list(CATEGORY_SHARES.values())) / sum(CATEGORY_SHARES.values()),
+        'trap_types': np.array(list(TRAP_TYPES), dtype=object),
+        'trap_gallons': np.array([gallons for gallons, _ in TRAP_TYPES.values()]),
+        'trap_shares': np.array([share for _, share in TRAP_TYPES.values()]) / sum(s for _, s in TRAP_TYPES.values()),
+        'intervals': np.array(list(INTERVAL_SHARES)),
+        'interval_shares': np.array(list(INTERVAL_SHARES.values())) / sum(INTERVAL_SHARES.values()),
+        'providers': np.array([f"Service Provider {i + 1}" for i in range(PROVIDER_COUNT)], dtype=object),
+        'provider_shares': zipf_shares(PROVIDER_COUNT),
+        'vehicles': np.array([f"{l} {n}" for l, n in zip(vehicle_letters, vehicle_numbers)], dtype=object),
+        'provider_vehicles': np.searchsorted(vehicle_provider, np.arange(PROVIDER_COUNT + 1))
+    }
+
+def collections_per_entity(catalogue, days=SYNTHETIC_DAYS):
+    """Expected number of collections of one entity over the window"""
+    return float((catalogue['interval_shares'] * days / catalogue['intervals']).sum())
+
+def date_labels(start, first_day, last_day):
+    """M/D/YYYY text of every day from start + first_day to start + last_day"""
+    days = pd.date_range(pd.Timestamp(start) + pd.Timedelta(days=first_day), periods=last_day - first_day + 1)
+    return np.array([f"{day.month}/{day.day}/{day.year}" for day in days], dtype=object)
+
+def generate_entity_batch(rng, catalogue, first_entity, entities, first_report, start=SYNTHETIC_START,
+                          days=SYNTHETIC_DAYS):
+    """Collections of entities first_entity .. first_entity + entities - 1, as extract rows
+
+    Each entity has a fixed area, category, trap, provider and interval;
+    collections fall every interval days with a little jitter, and a few are
+    overdue. Service Report numbers continue from first_report.
+    """
+    entity_area = rng.choice(len(catalogue['areas']), entities, p=catalogue['area_shares'])
+    entity_category = rng.choice(len(catalogue['categories']), entities, p=catalogue['category_shares'])
+    entity_trap = rng.choice(len(catalogue['trap_types']), entities, p=catalogue['trap_shares'])
+    entity_provider = rng.choice(PROVIDER_COUNT, entities, p=catalogue['provider_shares'])
+    interval = rng.choice(catalogue['intervals'], entities, p=catalogue['interval_shares'])
+    first_visit = rng.integers(0, interval)
+    license_number = rng.integers(100000, 10000000, entities).astype(object)
+    license_number[rng.random(entities) < 0.02] = None
+
+    # One row per collection, in entity order
+    visits = (days - 1 - first_visit) // interval + 1
+    entity = np.repeat(np.arange(entities), visits)
+    visit = np.arange(len(entity)) - np.repeat(np.cumsum(visits) - visits, visits)
+    rows = len(entity)
+    day = first_visit[entity] + visit * interval[entity] + rng.integers(-2, 3, rows)
+    overdue = rng.random(rows) < OVERDUE_RATE
+    day[overdue] += rng.integers(15, 90, overdue.sum())
+    day = np.clip(day, 0, days - 1)
+
+    provider = entity_provider[entity]
+    switched = rng.random(rows) < PROVIDER_SWITCH_RATE
+    provider[switched] = rng.choice(PROVIDER_COUNT, switched.sum(), p=catalogue['provider_shares'])
+    fleet_start = catalogue['provider_vehicles'][provider]
+    fleet_size = catalogue['provider_vehicles'][provider + 1] - fleet_start
+    vehicle = fleet_start + (rng.random(rows) * fleet_size).astype(np.int64)
+
+    turnaround = rng.integers(1, 91, rows)
+    discharge_delay = rng.integers(0, 3, rows)
+    labels = date_labels(start, -90, days + 2)
+    collected = labels[day + 90]
+    collected[rng.random(rows) < MISSING_DATE_RATE] = 'N/A'
+
+    reports = np.arange(first_report, first_report + rows).astype(str).astype(object)
+    entity_ids = (first_entity + entity).astype(str).astype(object)
+    sub_area = ((first_entity + entity) % SUB_AREAS_PER_AREA + 1).astype(str).astype(object)
+    sub_category = ((first_entity + entity) % SUB_CATEGORIES_PER_CATEGORY + 1).astype(str).astype(object)
+    area = entity_area[entity]
+    category = catalogue['categories'][entity_category[entity]]
+    trap_type = entity_trap[entity]
+    traps = np.where(rng.random(rows) < 0.02, 2, 1)
+
+    return pd.DataFrame({
+        'Service Report': 'RN ' + reports,
+        'New E ID': 'E-' + entity_ids,
+        'Service Provider': catalogue['providers'][provider],
+        'Collected Date': collected,
+        'Discharged Date': labels[day + discharge_delay + 90],
+        'Initiated Date': labels[day - turnaround + 90],
+        'Area': catalogue['areas'][area],
+        'Assigned Vehicle': catalogue['vehicles'][vehicle],
+        'Category': category,
+        'Discharge TXN': 'DT' + reports,
+        'Entity Mapping.Outlet': 'Outlet ' + entity_ids,
+        'Sum of Gallons Collected': catalogue['trap_gallons'][trap_type] * traps,
+        'Initiator': np.where(rng.random(rows) < 0.5, "Org's System", "Munci's System"),
+        'Sum of No of Traps': traps,
+        'Status': np.where(rng.random(rows) < 0.995, 'Discharged', 'Collected'),
+        'Sub Area': catalogue['areas'][area] + ' ' + sub_area,
+        'Sub Category': category + ' ' + sub_category,
+        'Trade License Number': license_number[entity],
+        'Trap Label': 'T' + entity_ids,
+        'Trap Type': catalogue['trap_types'][trap_type],
+        'Zone': catalogue['area_zones'][area]
+    }, columns=COLUMNS)
+
+def write_synthetic_extract(path, rows, seed=0, start=SYNTHETIC_START, days=SYNTHETIC_DAYS,
+                            batch_rows=CSV_CHUNK_ROWS):
+    """Write a synthetic extract of exactly rows collections to path
+
+    The same rows, seed and window always give the same file. Returns the
+    number of entities in it.
+    """
+    rng = np.random.default_rng(seed)
+    catalogue = synthetic_catalogue(rng)
+    batch_entities = max(1, int(batch_rows / collections_per_entity(catalogue, days)))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    written = entities = first_entity = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(','.join(COLUMNS) + '\n')
+        while written < rows:
+            batch = generate_entity_batch(rng, catalogue, first_entity, batch_entities, 100001 + written, start, days)
+            batch = batch.iloc[:rows - written]
+            batch.to_csv(f, header=False, index=False, lineterminator='\n')
+            written += len(batch)
+            entities += batch['New E ID'].nunique()
+            first_entity += batch_entities
+    return entities
+
+if __name__ == "__main__":
+    import sys
+    rows = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else 10000
+    seed = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else 0
+    output = sys.argv[sys.argv.index("--output") + 1] if "--output" in sys.argv else 'synthetic/Blue Data Analysis.csv'
+    print(f"Writing {rows:,} synthetic service records to {output}...")
+    entities = write_synthetic_extract(output, rows, seed=seed)
+    print(f"Done: {entities:,} entities")
@@ -0,0 +1,150 @@
+"""
+Bulk loading of the cleaned frame by bulk_load.py
+Rows that would break a services constraint must be dropped and counted by
+reason, loading into SQLite twice must leave the tables as loading once (the
+upsert updates rows in place), COPY text fields must escape the characters that
+delimit them, and every Service Report must land in exactly one partition and
+COPY file, all of them loaded by the generated load.sql.
+"""
+
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from bulk_load import (  # noqa: E402
+    SERVICE_COLUMNS, copy_text, copy_values, dimension_frames, load_sqlite, partition_frame, services_frame,
+    write_copy_files
+)
+from service_data import load_service_data  # noqa: E402
+
+CSV_PATH = os.path.join(REPO_DIR, 'tests', 'fixtures', 'public', 'Blue Data Analysis.csv')
+
+@pytest.fixture(scope='module')
+def df():
+    return load_service_data(CSV_PATH, use_cache=False)
+
+@pytest.fixture(scope='module')
+def frames(df):
+    services, _ = services_frame(df)
+    providers, vehicles = dimension_frames(df)
+    return services, providers, vehicles
+
+def table_counts(path):
+    connection = sqlite3.connect(path)
+    try:
+        return {table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ('services', 'service_providers', 'vehicles')}
+    finally:
+        connection.close()
+
+def test_services_frame_drop_reasons(df):
+    rows = df.head(10).copy()
+    rows['New E ID'] = rows['New E ID'].astype(object)
+    rows.loc[0, 'New E ID'] = None
+    rows.loc[1, 'Sum of Gallons Collected'] = 0
+    rows.loc[2, 'Sum of Gallons Collected'] = -5
+    rows.loc[3, 'Service Report'] = rows.loc[4, 'Service Report']
+    rows.loc[5, 'Assigned Vehicle'] = None
+    rows.loc[6, 'Sum of No of Traps'] = None
+    rows['Entity Mapping.Outlet'] = rows['Entity Mapping.Outlet'].astype(object)
+    rows.loc[7, 'Entity Mapping.Outlet'] = 'x' * 300
+
+    services, dropped = services_frame(rows)
+    assert dropped == {'entity_id missing': 1, 'gallons_collected <= 0': 2, 'service_report repeated': 1}
+    assert len(services) == 6
+    assert list(services.columns) == list(SERVICE_COLUMNS)
+    # Of a repeated report the last row is kept
+    kept = services.set_index('service_report')
+    assert kept.loc[rows.loc[4, 'Service Report'], 'entity_id'] == rows.loc[4, 'New E ID']
+    # A missing vehicle loads as vehicle 0 and a missing trap count as 1
+    assert kept.loc[rows.loc[5, 'Service Report'], 'assigned_vehicle'] == 0
+    assert kept.loc[rows.loc[6, 'Service Report'], 'trap_count'] == 1
+    assert kept.loc[rows.loc[7, 'Service Report'], 'outlet_name'] == 'x' * 200
+
+def test_load_sqlite_upsert_is_idempotent(tmp_path, frames):
+    services, providers, vehicles = frames
+    path = str(tmp_path / 'services.db')
+    load_sqlite(path, services, providers, vehicles)
+    counts = table_counts(path)
+    assert counts == {'services': len(services), 'service_providers': len(providers), 'vehicles': len(vehicles)}
+
+    # A second load, with one report changed, updates rows in place
+    changed = services.copy()
+    changed.loc[0, 'gallons_collected'] = 4321
+    load_sqlite(path, changed, providers, vehicles)
+    assert table_counts(path) == counts
+    connection = sqlite3.connect(path)
+    try:
+        gallons = connection.execute("SELECT gallons_collected FROM services WHERE service_report = ?",
+                                     (services.loc[0, 'service_report'],)).fetchone()[0]
+        plates = dict(connection.execute("SELECT vehicle_number, license_plate FROM vehicles"))
+    finally:
+        connection.close()
+    assert gallons == 4321
+    assert plates == dict(zip(vehicles['vehicle_number'], vehicles['license_plate']))
+
+@pytest.mark.parametrize('dtype', [object, 'string', 'category'])
+def test_copy_values_escapes_delimiters(dtype):
+    values = pd.Series(['tab\there', 'new\nline', 'back\\slash', None, 'plain', 'carriage\rreturn'], dtype=dtype)
+    assert list(copy_values(values)) == ['tab\\there', 'new\\nline', 'back\\\\slash', '\\N', 'plain',
+                                         'carriage\\rreturn']
+
+def test_copy_values_formats_dates_and_integers():
+    dates = pd.Series(pd.to_datetime(['2023-01-05 13:00', None, '2023-01-05 00:00']))
+    assert list(copy_values(dates)) == ['2023-01-05', '\\N', '2023-01-05']
+    assert list(copy_values(pd.Series([3, None, 3], dtype='Int32'))) == ['3', '\\N', '3']
+
+def test_copy_text_keeps_one_line_per_row():
+    frame = pd.DataFrame({'name': ['a\tb', 'c\nd', None], 'count': pd.array([1, None, 3], dtype='Int64')})
+    lines = copy_text(frame).split('\n')
+    assert lines == ['a\\tb\t1', 'c\\nd\t\\N', '\\N\t3', '']
+    assert copy_text(frame.iloc[:0]) == ''
+
+@pytest.mark.parametrize('partitions', [1, 3, 8])
+def test_partition_frame_places_each_report_once(frames, partitions):
+    services = frames[0]
+    parts = partition_frame(services, partitions)
+    assert len(parts) == partitions
+    reports = np.concatenate([part['service_report'].to_numpy(dtype=object) for part in parts])
+    assert len(reports) == len(services)
+    assert sorted(reports) == sorted(services['service_report'])
+    # A report's partition depends on the report alone, not on the other rows
+    subset = partition_frame(services.iloc[::3], partitions)
+    for part, part_of_subset in zip(parts, subset):
+        assert set(part_of_subset['service_report']) <= set(part['service_report'])
+
+def test_write_copy_files_and_load_script(tmp_path, frames):
+    services, providers, vehicles = frames
+    parts = partition_frame(services, 3)
+    write_copy_files(str(tmp_path), parts, providers, vehicles)
+
+    files = [f"services_{k}.copy" for k in range(3)]
+    for name, part in zip(files, parts):
+        with open(tmp_path / name, encoding='utf-8', newline='') as f:
+            lines = f.read().split('\n')[:-1]
+        assert len(lines) == len(part)
+        assert all(len(line.split('\t')) == len(SERVICE_COLUMNS) for line in lines)
+        assert [line.split('\t')[0] for line in lines] == list(part['service_report'])
+    with open(tmp_path / 'vehicles.copy', encoding='utf-8') as f:
+        assert len(f.readlines()) == len(vehicles)
+
+    with open(tmp_path / 'load.sql', encoding='utf-8') as f:
+        script = f.read().splitlines()
+    assert script[0] == 'BEGIN;' and script[-1] == 'COMMIT;'
+    copies = [line for line in script if line.startswith('\\copy ')]
+    assert copies[:2] == ["\\copy staging_providers (name) FROM 'service_providers.copy'",
+                          "\\copy staging_vehicles (vehicle_number, license_plate, provider) FROM 'vehicles.copy'"]
+    assert copies[2:] == [f"\\copy staging_services ({', '.join(SERVICE_COLUMNS)}) FROM '{name}'" for name in files]
+    upserts = [line for line in script if line.startswith('INSERT INTO')]
+    assert [line.split()[2] for line in upserts] == ['service_providers', 'vehicles', 'services']
+    assert upserts[-1].endswith('ON CONFLICT (service_report) DO UPDATE SET '
+                                + ', '.join(f"{column} = EXCLUDED.{column}" for column in SERVICE_COLUMNS
+                                            if column != 'service_report')
+                                + ', updated_at = NOW();')
@@ -0,0 +1,196 @@
+"""
+Data-quality rules of data_quality.py
+Each of the QUALITY_RULES must flag the rows breaking it and nothing else on
+rows of the fixture extract broken one way at a time. Quarantined rows list the
+rules they fail in the Violations column, and --exclude-invalid must drop the
+failing rows from both scripts' outputs while the default keeps them.
+"""
+
+import csv
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from data_quality import (  # noqa: E402
+    QUALITY_RULES, REQUIRED_COLUMNS, VIOLATIONS_COLUMN, apply_quality_rules, merge_quality_summaries,
+    quality_summary, validate_service_data, write_quarantine
+)
+from service_data import load_service_data  # noqa: E402
+
+CSV_NAME = 'Blue Data Analysis.csv'
+CSV_PATH = os.path.join(REPO_DIR, 'tests', 'fixtures', 'public', CSV_NAME)
+
+def missing(column):
+    def apply(rows):
+        rows.loc[1, column] = None
+    return apply
+
+def set_gallons(value):
+    def apply(rows):
+        rows.loc[1, 'Sum of Gallons Collected'] = value
+    return apply
+
+def discharged_before_collected(rows):
+    rows.loc[1, 'Discharged Date'] = rows.loc[1, 'Collected Date'] - pd.Timedelta(days=1)
+
+def collected_before_initiated(rows):
+    rows.loc[1, 'Initiated Date'] = rows.loc[1, 'Collected Date'] + pd.Timedelta(days=1)
+
+# Rule -> change to row 1 that breaks it (and no other rule)
+BREAKING_CHANGES = {
+    **{f"{column} missing": missing(column) for column in REQUIRED_COLUMNS},
+    'Sum of Gallons Collected <= 0': set_gallons(0),
+    'Discharged Date before Collected Date': discharged_before_collected,
+    'Collected Date before Initiated Date': collected_before_initiated
+}
+
+@pytest.fixture(scope='module')
+def df():
+    return load_service_data(CSV_PATH, use_cache=False)
+
+@pytest.fixture
+def rows(df):
+    return df.head(4).copy()
+
+def test_fixture_rows_pass_every_rule(df):
+    validation = validate_service_data(df)
+    assert set(validation['violations']) == set(QUALITY_RULES)
+    assert not validation['invalid'].any()
+
+def test_every_rule_has_a_breaking_change():
+    assert len(QUALITY_RULES) == 17
+    assert set(BREAKING_CHANGES) == set(QUALITY_RULES)
+
+@pytest.mark.parametrize('rule', list(QUALITY_RULES))
+def test_rule_flags_only_the_broken_row(rows, rule):
+    BREAKING_CHANGES[rule](rows)
+    validation = validate_service_data(rows)
+    assert validation['invalid'].tolist() == [False, True, False, False]
+    failed = {name for name, mask in validation['violations'].items() if mask.any()}
+    assert failed == {rule}
+    assert validation['violations'][rule].tolist() == [False, True, False, False]
+
+def test_negative_gallons_fail_and_missing_gallons_fail_only_once(rows):
+    rows.loc[1, 'Sum of Gallons Collected'] = -3
+    rows.loc[2, 'Sum of Gallons Collected'] = None
+    violations = validate_service_data(rows)['violations']
+    assert violations['Sum of Gallons Collected <= 0'].tolist() == [False, True, False, False]
+    assert violations['Sum of Gallons Collected missing'].tolist() == [False, False, True, False]
+
+def test_missing_dates_pass_the_order_rules(rows):
+    rows.loc[1, 'Initiated Date'] = pd.NaT
+    rows.loc[2, 'Discharged Date'] = pd.NaT
+    violations = validate_service_data(rows)['violations']
+    assert not violations['Discharged Date before Collected Date'].any()
+    assert not violations['Collected Date before Initiated Date'].any()
+
+def test_rules_without_their_columns_are_skipped(rows):
+    validation = validate_service_data(rows.drop(columns=['Zone', 'Discharged Date']))
+    assert 'Zone missing' not in validation['violations']
+    assert 'Discharged Date before Collected Date' not in validation['violations']
+    assert 'Collected Date before Initiated Date' in validation['violations']
+
+def test_quality_summary_counts(rows):
+    set_gallons(0)(rows)
+    discharged_before_collected(rows)
+    rows.loc[3, 'Zone'] = None
+    summary = quality_summary(validate_service_data(rows))
+    assert (summary['rows'], summary['invalid_rows']) == (4, 2)
+    assert {rule: count for rule, count in summary['rules'].items() if count} == {
+        'Sum of Gallons Collected <= 0': 1, 'Discharged Date before Collected Date': 1, 'Zone missing': 1
+    }
+    merged = merge_quality_summaries(summary, summary)
+    assert (merged['rows'], merged['invalid_rows'], merged['rules']['Zone missing']) == (8, 4, 2)
+    assert merge_quality_summaries(None, summary) is summary
+
+def test_quarantine_lists_violations(tmp_path, rows):
+    set_gallons(0)(rows)
+    discharged_before_collected(rows)
+    rows.loc[3, 'Zone'] = None
+    path = tmp_path / 'quarantine.csv'
+    assert write_quarantine(rows, validate_service_data(rows), path) == 2
+
+    quarantined = pd.read_csv(path)
+    assert list(quarantined.columns) == [*rows.columns, VIOLATIONS_COLUMN]
+    assert list(quarantined['Service Report']) == list(rows['Service Report'].iloc[[1, 3]])
+    # Rules in QUALITY_RULES order, separated by '; '
+    assert list(quarantined[VIOLATIONS_COLUMN]) == [
+        'Sum of Gallons Collected <= 0; Discharged Date before Collected Date', 'Zone missing'
+    ]
+
+    # Appended rows follow without a second header
+    assert write_quarantine(rows, validate_service_data(rows), path, append=True) == 2
+    assert len(pd.read_csv(path)) == 4
+
+def test_quarantine_of_valid_rows_is_header_only(tmp_path, rows):
+    path = tmp_path / 'quarantine.csv'
+    assert write_quarantine(rows, validate_service_data(rows), path) == 0
+    with open(path, encoding='utf-8') as f:
+        assert f.read().strip().split(',')[-1] == VIOLATIONS_COLUMN
+
+def test_apply_quality_rules_excludes_only_when_asked(tmp_path, rows):
+    collected_before_initiated(rows)
+    kept, summary = apply_quality_rules(rows)
+    assert kept is rows and summary['invalid_rows'] == 1
+
+    path = tmp_path / 'quarantine.csv'
+    excluded, summary = apply_quality_rules(rows, exclude_invalid=True, quarantine_path=str(path))
+    assert list(excluded['Service Report']) == list(rows['Service Report'].iloc[[0, 2, 3]])
+    assert list(excluded.index) == [0, 1, 2]
+    assert (summary['rows'], summary['invalid_rows']) == (4, 1)
+    assert list(pd.read_csv(path)[VIOLATIONS_COLUMN]) == ['Collected Date before Initiated Date']
+
+    unchanged, _ = apply_quality_rules(rows.drop(index=1).reset_index(drop=True), exclude_invalid=True)
+    assert len(unchanged) == 3
+
+def prepare_broken_extract(directory):
+    """Copy the fixture extract with 0 gallons in its first three Q1 2023 rows; returns their reports"""
+    os.makedirs(directory / 'public')
+    with open(CSV_PATH, newline='', encoding='utf-8') as f:
+        records = list(csv.reader(f))
+    header = records[0]
+    date, gallons = header.index('Collected Date'), header.index('Sum of Gallons Collected')
+    broken = [record for record in records[1:] if record[date].startswith(('1/', '2/', '3/'))
+              and record[date].endswith('/2023')][:3]
+    for record in broken:
+        record[gallons] = '0'
+    with open(directory / 'public' / CSV_NAME, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f, lineterminator='\n').writerows(records)
+    return [record[0] for record in broken]
+
+def run_script(directory, script, *args):
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, script), '--no-cache', *args], cwd=directory,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+def total_records(directory):
+    with open(directory / 'data_insights.json', encoding='utf-8') as f:
+        analysis = json.load(f)['summary']['overview']['total_records']
+    with open(directory / 'pie_insights_q1_2023.json', encoding='utf-8') as f:
+        pie = json.load(f)['pie_assistant_context']['total_records']
+    return analysis, pie
+
+def test_exclude_invalid_drops_failing_rows_from_outputs(tmp_path):
+    broken = prepare_broken_extract(tmp_path)
+    printed = run_script(tmp_path, 'data_analysis.py', '--quarantine', 'quarantine.csv')
+    printed += run_script(tmp_path, 'generate_pie_insights.py')
+    assert '[WARNING] 3 of 1,000 rows fail data-quality rules (kept):' in printed
+    assert total_records(tmp_path) == (1000, 333)
+
+    printed = run_script(tmp_path, 'data_analysis.py', '--exclude-invalid', '--quarantine', 'quarantine.csv')
+    printed += run_script(tmp_path, 'generate_pie_insights.py', '--exclude-invalid')
+    assert '[WARNING] 3 of 1,000 rows fail data-quality rules (excluded):' in printed
+    assert '[WARNING] 3 of 333 rows fail data-quality rules (excluded):' in printed
+    assert total_records(tmp_path) == (997, 330)
+
+    quarantined = pd.read_csv(tmp_path / 'quarantine.csv')
+    assert list(quarantined['Service Report']) == broken
+    assert set(quarantined[VIOLATIONS_COLUMN]) == {'Sum of Gallons Collected <= 0'}
@@ -0,0 +1,159 @@
+"""
+Equivalence of calculate_entity_patterns with the original per-license loop
+legacy_entity_patterns is the loop calculate_collection_patterns ran before the
+vectorized engine, copied verbatim. Both run on the fixture extract's Q1 2023
+rows and on rows built around the edge cases, and their entity lists must
+encode to byte-identical JSON: missing licenses and gallons, same-day and
+out-of-range intervals, licenses with tied collection counts and averages that
+fall on a non-exact half (0.15 is stored as 0.1499..., which round() of the
+np.float64 the loop computed takes to 0.2, where round() of a Python float
+would give 0.1).
+"""
+
+import os
+import sys
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from generate_pie_insights import calculate_entity_patterns, get_risk_level  # noqa: E402
+from json_output import encode_json  # noqa: E402
+from service_data import date_window_mask, load_service_data  # noqa: E402
+
+CSV_PATH = os.path.join(REPO_DIR, 'tests', 'fixtures', 'public', 'Blue Data Analysis.csv')
+REFERENCE_DATE = pd.Timestamp('2023-04-10')
+
+def legacy_risk_level(days_overdue):
+    """get_risk_level before it took arrays"""
+    if days_overdue <= 0:
+        return 'normal'
+    elif days_overdue <= 5:
+        return 'upcoming'
+    elif days_overdue <= 10:
+        return 'warning'
+    else:
+        return 'critical'
+
+def legacy_entity_patterns(df, reference_date):
+    """The entity-level loop of the original calculate_collection_patterns"""
+    entity_patterns = []
+    for trade_license in df['Trade License Number'].dropna().unique():
+        entity_data = df[df['Trade License Number'] == trade_license].sort_values('Collected Date')
+
+        if len(entity_data) >= 2:
+            # Calculate average interval between collections
+            intervals = []
+            for i in range(1, len(entity_data)):
+                interval = (entity_data.iloc[i]['Collected Date'] - entity_data.iloc[i-1]['Collected Date']).days
+                if 1 <= interval <= 120:  # Reasonable interval range
+                    intervals.append(interval)
+
+            if intervals:
+                avg_interval = np.mean(intervals)
+                last_collection = entity_data.iloc[-1]['Collected Date']
+                days_since_last = (reference_date - last_collection).days
+                expected_next = last_collection + timedelta(days=avg_interval)
+                days_overdue = (reference_date - expected_next).days
+
+                entity_patterns.append({
+                    'trade_license': int(trade_license),
+                    'entity_id': entity_data.iloc[-1]['New E ID'],
+                    'outlet_name': entity_data.iloc[-1]['Entity Mapping.Outlet'],
+                    'category': entity_data.iloc[-1]['Category'],
+                    'area': entity_data.iloc[-1]['Area'],
+                    'zone': entity_data.iloc[-1]['Zone'],
+                    'collections_count': len(entity_data),
+                    'avg_interval_days': round(avg_interval, 1),
+                    'last_collection_date': last_collection.strftime('%Y-%m-%d'),
+                    'days_since_last': days_since_last,
+                    'days_overdue': max(0, days_overdue),
+                    'risk_level': legacy_risk_level(days_overdue),
+                    'avg_gallons': round(entity_data['Sum of Gallons Collected'].mean(), 1)
+                })
+    return entity_patterns
+
+def edge_case_rows():
+    """Licensed collections around the edge cases of the interval and rounding rules"""
+    rows = []
+    def collect(license, entity, day, gallons):
+        rows.append({'Trade License Number': license, 'New E ID': entity, 'Entity Mapping.Outlet': f"Outlet {entity}",
+                     'Category': 'Restaurant', 'Area': f"Area {entity}", 'Zone': 'Zone 1',
+                     'Collected Date': pd.Timestamp('2023-01-01') + pd.Timedelta(days=day),
+                     'Sum of Gallons Collected': gallons})
+    # Average interval 23/20 = 1.15 days
+    for day in np.cumsum([0] + [1] * 17 + [2] * 3):
+        collect(900001, 'X-1', day, 10)
+    # Average gallons 3/20 = 0.15
+    for i in range(20):
+        collect(900002, 'X-2', 4 * i, 1 if i < 3 else 0)
+    # Same-day collections (0-day intervals) around one in range, the entity changing on the last
+    collect(900003, 'X-3', 10, 25)
+    collect(900003, 'X-3', 10, 35)
+    collect(900003, 'X-3', 20, 45)
+    collect(900003, 'X-3b', 20, None)
+    # Only out-of-range intervals: no pattern
+    collect(900004, 'X-4', 0, 50)
+    collect(900004, 'X-4', 150, 50)
+    # One in-range interval next to an out-of-range one, rows out of date order
+    collect(900005, 'X-5', 200, 20)
+    collect(900005, 'X-5', 30, 30)
+    collect(900005, 'X-5', 60, 40)
+    # A single collection: no pattern
+    collect(900006, 'X-6', 5, 10)
+    # Rows without a license
+    collect(None, 'X-7', 3, 10)
+    collect(None, 'X-7', 9, 10)
+    # Tied collection counts with 900005
+    for day in (40, 47, 61):
+        collect(900008, 'X-8', day, 12)
+    # No gallons recorded: the average is missing
+    collect(900009, 'X-9', 12, None)
+    collect(900009, 'X-9', 22, None)
+    return rows
+
+def typed_frame(rows, like):
+    """Frame of rows with the dtypes of the matching columns of like (categoricals with their own categories)"""
+    df = pd.DataFrame(rows)
+    return df.astype({column: 'category' if isinstance(like[column].dtype, pd.CategoricalDtype) else like[column].dtype
+                      for column in df.columns})
+
+def fixture_q1_rows():
+    df = load_service_data(CSV_PATH, use_cache=False)
+    return df[date_window_mask(df, '2023-01-01', '2023-03-31')].reset_index(drop=True)
+
+def json_text(obj):
+    """obj encoded as the insights files encode it"""
+    pieces = []
+    encode_json(obj, pieces.append)
+    return ''.join(pieces)
+
+def assert_same_patterns(df):
+    # The loop ran on gallons as the original loader read them (pd.to_numeric, float64)
+    expected = legacy_entity_patterns(df.astype({'Sum of Gallons Collected': 'float64'}), REFERENCE_DATE)
+    actual = calculate_entity_patterns(df, REFERENCE_DATE)
+    assert list(actual['trade_license']) == [row['trade_license'] for row in expected]
+    assert json_text(actual.to_dict('records')) == json_text(expected)
+
+def test_entity_patterns_match_legacy_loop_on_q1_2023():
+    assert_same_patterns(fixture_q1_rows())
+
+def test_entity_patterns_match_legacy_loop_on_edge_cases():
+    fixture = fixture_q1_rows()
+    df = pd.concat([fixture, typed_frame(edge_case_rows(), fixture)], ignore_index=True)
+    assert_same_patterns(df)
+
+    patterns = calculate_entity_patterns(df, REFERENCE_DATE).set_index('trade_license')
+    assert patterns.loc[900001, 'avg_interval_days'] == 1.2
+    assert patterns.loc[900002, 'avg_gallons'] == 0.2
+    assert patterns.loc[900003, 'entity_id'] == 'X-3b'
+    assert not patterns.index.isin([900004, 900006]).any()
+    assert patterns.loc[900005, 'collections_count'] == patterns.loc[900008, 'collections_count'] == 3
+    assert pd.isna(patterns.loc[900009, 'avg_gallons'])
+
+def test_risk_levels_match_legacy_thresholds():
+    days = np.arange(-3, 15)
+    assert list(get_risk_level(days)) == [legacy_risk_level(day) for day in days]
@@ -0,0 +1,106 @@
+"""
+Token-budgeted compilation of the Pie insights document (insights_budget.py)
+The compiled document must stay within its budget with its size counted
+exactly, fill collections back in rounds with higher priorities first, keep
+the best-ranked items of ranked collections in their original order, and
+raise BudgetError when the minimums alone do not fit. Without a budget the
+Pie document keeps the caps the sections had before budgeting.
+"""
+
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from generate_pie_insights import (  # noqa: E402
+    UNBUDGETED_MAX_ITEMS, budget_max_items, insight_budgets, unbudgeted_budgets
+)
+from insights_budget import BudgetError, compile_insights  # noqa: E402
+from json_output import CHARS_PER_TOKEN, measure_json  # noqa: E402
+
+def two_section_document():
+    return {
+        'alerts': {'items': [f"alert-{i:03d}" for i in range(20)], 'total': 20},
+        'areas': {'list': [f"area--{i:03d}" for i in range(20)]}
+    }
+
+BUDGETS = {
+    'alerts': (1, [(('items',), 1, None)]),
+    'areas': (2, [(('list',), 1, None)])
+}
+
+def cut(doc, alerts, areas):
+    """doc with its collections cut to the given numbers of items"""
+    return {'alerts': {**doc['alerts'], 'items': doc['alerts']['items'][:alerts]},
+            'areas': {'list': doc['areas']['list'][:areas]}}
+
+def tokens_for(size):
+    """Smallest token budget holding size characters"""
+    return -(-size // CHARS_PER_TOKEN)
+
+def test_compiled_size_is_exact_and_within_budget():
+    doc = two_section_document()
+    for token_budget in (40, 60, 100, 150):
+        compiled, size = compile_insights(doc, BUDGETS, token_budget)
+        assert size == measure_json(compiled)
+        assert size <= token_budget * CHARS_PER_TOKEN
+
+def test_collections_fill_in_rounds_by_priority():
+    doc = two_section_document()
+    minimum = measure_json(cut(doc, 1, 1))
+    item = measure_json(cut(doc, 2, 1)) - minimum
+    assert measure_json(cut(doc, 1, 2)) - minimum == item
+
+    # Room for 7 more items: each round adds up to 2 (a tenth of 20) per collection,
+    # alerts first, so alerts gain 2 + 2 and areas 2 + 1 before areas run out of room
+    compiled, size = compile_insights(doc, BUDGETS, tokens_for(minimum + 7 * item))
+    assert compiled == cut(doc, 5, 4)
+    assert size == minimum + 7 * item
+
+    # Room for 3: alerts take their round's 2 first
+    compiled, _ = compile_insights(doc, BUDGETS, tokens_for(minimum + 3 * item))
+    assert compiled == cut(doc, 3, 2)
+
+def test_ranked_collection_keeps_best_items_in_original_order():
+    doc = {'delays': {'by_area': {'a': 1, 'b': 5, 'c': 3, 'd': 4, 'e': 2}}}
+    budgets = {'delays': (1, [(('by_area',), 1, None, lambda item: item[1])])}
+    minimum = measure_json({'delays': {'by_area': {'b': 5}}})
+    item = measure_json({'delays': {'by_area': {'b': 5, 'd': 4}}}) - minimum
+
+    compiled, _ = compile_insights(doc, budgets, tokens_for(minimum + 2 * item))
+    assert list(compiled['delays']['by_area'].items()) == [('b', 5), ('c', 3), ('d', 4)]
+    assert doc['delays']['by_area'] == {'a': 1, 'b': 5, 'c': 3, 'd': 4, 'e': 2}
+
+def test_max_items_caps_every_budget():
+    budgets = {'alerts': (1, [(('items',), 1, 6)]), 'areas': (2, [(('list',), 0, 0)])}
+    compiled, _ = compile_insights(two_section_document(), budgets, 10 ** 6)
+    assert compiled == cut(two_section_document(), 6, 0)
+
+def test_unreachable_budget_raises_budget_error():
+    doc = two_section_document()
+    with pytest.raises(BudgetError) as raised:
+        compile_insights(doc, BUDGETS, 10)
+    assert raised.value.token_budget == 10
+    assert raised.value.minimum_tokens == tokens_for(measure_json(cut(doc, 1, 1)))
+
+def test_no_budget_keeps_up_to_max_items():
+    budgets = {'alerts': (1, [(('items',), 3, 12)]), 'areas': (2, [(('list',), 3, None)])}
+    compiled, size = compile_insights(two_section_document(), budgets, None)
+    assert compiled == cut(two_section_document(), 12, 20)
+    assert size == measure_json(compiled)
+
+def test_unbudgeted_document_keeps_the_legacy_caps():
+    budgets = unbudgeted_budgets(insight_budgets(30))
+    declared = {(section, path[-1]): (min_items, max_items, *rank)
+                for section, (_, truncatable) in budgets.items() for path, min_items, max_items, *rank in truncatable}
+    assert declared[('delays_alerts_analysis', 'critical_alerts')] == (0, 20)
+    assert declared[('geographical_analysis', 'detailed_area_analysis')] == (0, 8)
+    # Ranked collections without a cap are kept whole, in their own order
+    assert declared[('delays_alerts_analysis', 'by_area')] == (0, None)
+    assert declared[('predictive_patterns', 'next_30_days_forecast')] == (0, None)
+    # Budgets can keep at least as many items as the legacy caps
+    for (section, key), max_items in UNBUDGETED_MAX_ITEMS.items():
+        assert budget_max_items(section, key) >= max_items
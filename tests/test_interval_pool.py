@@ -0,0 +1,114 @@
+"""
+Equivalence of the interval table with the original per-category and per-area loops
+legacy_dimension_intervals is calculate_category_intervals (and its area copy)
+from before the interval table, copied verbatim but for the column it slices
+by. Within a category or area each entity's collections are diffed on their
+own, so an entity moving between values contributes to each the intervals
+between its collections with that value. The table must give the same
+averages on the fixture extract's Q1 2023 rows and on such edge cases, also
+when built from two batches of rows merged together.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from generate_pie_insights import (  # noqa: E402
+    calculate_collection_patterns, collection_state, merge_collection_states, summarize_intervals
+)
+from service_data import date_window_mask, load_service_data  # noqa: E402
+
+CSV_PATH = os.path.join(REPO_DIR, 'tests', 'fixtures', 'public', 'Blue Data Analysis.csv')
+REFERENCE_DATE = pd.Timestamp('2023-04-10')
+
+def legacy_dimension_intervals(dimension_data):
+    """calculate_category_intervals / calculate_area_intervals of the original script"""
+    intervals = []
+    for entity_id in dimension_data['New E ID'].unique():
+        entity_data = dimension_data[dimension_data['New E ID'] == entity_id].sort_values('Collected Date')
+        if len(entity_data) >= 2:
+            for i in range(1, len(entity_data)):
+                interval = (entity_data.iloc[i]['Collected Date'] - entity_data.iloc[i-1]['Collected Date']).days
+                if 1 <= interval <= 120:
+                    intervals.append(interval)
+    return intervals
+
+def legacy_averages(df, column):
+    """avg_interval_days per value of column as the original patterns computed it"""
+    averages = {}
+    for value in df[column].unique():
+        intervals = legacy_dimension_intervals(df[df[column] == value])
+        averages[value] = round(np.mean(intervals), 1) if intervals else 14
+    return averages
+
+def table_averages(intervals, df, column, dimension):
+    summary = summarize_intervals(intervals, dimension)
+    return {value: round(summary[value], 1) if value in summary.index else 14 for value in df[column].unique()}
+
+def fixture_q1_rows():
+    df = load_service_data(CSV_PATH, use_cache=False)
+    return df[date_window_mask(df, '2023-01-01', '2023-03-31')].reset_index(drop=True)
+
+def moving_entity_rows(like):
+    """Collections of entities that change category, area or zone between collections"""
+    rows = []
+    def collect(entity, day, category, area, zone='Zone 1'):
+        rows.append({'Trade License Number': 900100, 'New E ID': entity, 'Entity Mapping.Outlet': f"Outlet {entity}",
+                     'Category': category, 'Area': area, 'Zone': zone, 'Sum of Gallons Collected': 10,
+                     'Collected Date': pd.Timestamp('2023-01-01') + pd.Timedelta(days=day)})
+    # Alternating categories: 10 days between the Bakery collections, 25 and 10 between the Butchery ones
+    collect('Y-1', 0, 'Bakery', 'Area Y')
+    collect('Y-1', 5, 'Butchery', 'Area Y')
+    collect('Y-1', 10, 'Bakery', 'Area Y')
+    collect('Y-1', 30, 'Butchery', 'Area Z')
+    collect('Y-1', 40, 'Butchery', 'Area Z')
+    # One collection per area: no interval in either, the category keeps both
+    collect('Y-2', 3, 'Bakery', 'Area V', 'Zone 2')
+    collect('Y-2', 13, 'Bakery', 'Area W', 'Zone 2')
+    df = pd.DataFrame(rows)
+    return df.astype({column: 'category' if isinstance(like[column].dtype, pd.CategoricalDtype) else like[column].dtype
+                      for column in df.columns})
+
+def assert_same_averages(df, intervals):
+    for column, dimension in [('Category', 'category'), ('Area', 'area'), ('Zone', 'zone')]:
+        assert table_averages(intervals, df, column, dimension) == legacy_averages(df, column)
+
+def test_interval_table_matches_legacy_loops_on_q1_2023():
+    df = fixture_q1_rows()
+    patterns = calculate_collection_patterns(df, REFERENCE_DATE)
+    assert {category: pattern['avg_interval_days'] for category, pattern in patterns['categories'].items()} == \
+        legacy_averages(df, 'Category')
+    assert {area: pattern['avg_interval_days'] for area, pattern in patterns['geographic'].items()} == \
+        legacy_averages(df, 'Area')
+    assert_same_averages(df, patterns['intervals'])
+
+def test_intervals_stay_within_each_value_of_a_moving_entity():
+    fixture = fixture_q1_rows()
+    rows = moving_entity_rows(fixture)
+    intervals = collection_state(rows)['intervals']
+    assert summarize_intervals(intervals, 'category').to_dict() == {'Bakery': 10.0, 'Butchery': 17.5}
+    assert summarize_intervals(intervals, 'area').to_dict() == {'Area Y': 5.0, 'Area Z': 10.0}
+    assert_same_averages(pd.concat([fixture, rows], ignore_index=True),
+                         collection_state(pd.concat([fixture, rows], ignore_index=True))['intervals'])
+
+def test_merged_states_match_the_state_of_all_rows():
+    fixture = fixture_q1_rows()
+    df = pd.concat([fixture, moving_entity_rows(fixture)], ignore_index=True)
+    cutoff = pd.Timestamp('2023-01-12')
+    early = df[df['Collected Date'] < cutoff].reset_index(drop=True)
+    late = df[df['Collected Date'] >= cutoff].reset_index(drop=True)
+
+    merged = merge_collection_states(collection_state(early), collection_state(late))
+    full = collection_state(df)
+    assert merged['rows'] == full['rows']
+    assert_same_averages(df, merged['intervals'])
+    pd.testing.assert_frame_equal(merged['intervals'].sort_index(), full['intervals'].sort_index(),
+                                  check_dtype=False)
+
+    # Rows reaching back before the last collection of a group cannot be merged
+    assert merge_collection_states(collection_state(late), collection_state(early)) is None
@@ -0,0 +1,187 @@
+"""
+Regression tests for the outputs of data_analysis.py and generate_pie_insights.py
+The scripts run on fixtures/public/Blue Data Analysis.csv, a 1,000-row synthetic
+extract (synthetic_data.write_synthetic_extract(path, 1000, seed=7)), and their
+outputs are compared with fixtures/baseline/. The outputs there are byte for
+byte those of the original row-by-row implementations (the Pie document is
+compiled without a token budget by default). Every execution mode
+(workers, chunked, no cache, incremental) must reproduce the same files.
+"""
+
+import csv
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(REPO_DIR, 'tests', 'fixtures')
+CSV_NAME = 'Blue Data Analysis.csv'
+
+ANALYSIS_OUTPUTS = ['data_insights.json', 'Dubai_Waste_Collection_Analysis.md']
+Q1_ANALYSIS_OUTPUTS = ['data_insights_q1_2023.json', 'Dubai_Waste_Collection_Q1_2023_Analysis.md']
+PIE_OUTPUTS = ['pie_insights_q1_2023.json']
+
+# Markdown lines with the time of the run
+TIMESTAMP_MARKER = 'Report generated on'
+
+def read_output(path):
+    """Contents of an output file, without the lines that carry the time of the run"""
+    with open(path, encoding='utf-8') as f:
+        return ''.join(line for line in f if TIMESTAMP_MARKER not in line)
+
+def prepare_extract(directory, rows=None):
+    """Copy the fixture extract (its header and first rows lines, or all of it) to directory/public"""
+    os.makedirs(os.path.join(directory, 'public'), exist_ok=True)
+    with open(os.path.join(FIXTURES_DIR, 'public', CSV_NAME), encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(os.path.join(directory, 'public', CSV_NAME), 'w', encoding='utf-8') as f:
+        f.writelines(lines if rows is None else lines[:rows + 1])
+
+def append_extract(directory, first_row):
+    """Append the fixture rows from first_row on to the extract in directory"""
+    with open(os.path.join(FIXTURES_DIR, 'public', CSV_NAME), encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(os.path.join(directory, 'public', CSV_NAME), 'a', encoding='utf-8') as f:
+        f.writelines(lines[first_row + 1:])
+
+def edit_extract(directory, rows, changes):
+    """Rewrite the given data rows (0-based) of the extract in directory with the column values in changes"""
+    path = os.path.join(directory, 'public', CSV_NAME)
+    with open(path, newline='', encoding='utf-8') as f:
+        records = list(csv.reader(f))
+    header = records[0]
+    for row in rows:
+        for column, value in changes.items():
+            records[row + 1][header.index(column)] = value
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f, lineterminator='\n').writerows(records)
+
+def run_script(directory, script, *args):
+    """Run one of the scripts with directory as working directory, returning what it printed"""
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, script), *args], cwd=directory,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+def run_all(directory, analysis_args=(), pie_args=()):
+    """Run both scripts (data_analysis.py for the full extract and Q1 2023)"""
+    run_script(directory, 'generate_pie_insights.py', *pie_args)
+    run_script(directory, 'data_analysis.py', *analysis_args)
+    run_script(directory, 'data_analysis.py', '--q1-2023', *analysis_args)
+
+def assert_matches_baseline(directory, names):
+    for name in names:
+        assert read_output(os.path.join(directory, name)) == \
+            read_output(os.path.join(FIXTURES_DIR, 'baseline', name)), f"{name} differs from the baseline"
+
+@pytest.fixture(scope='module')
+def default_run(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('default'))
+    prepare_extract(directory)
+    run_all(directory)
+    return directory
+
+@pytest.mark.parametrize('name', PIE_OUTPUTS + ANALYSIS_OUTPUTS + Q1_ANALYSIS_OUTPUTS)
+def test_default_outputs_match_baseline(default_run, name):
+    assert_matches_baseline(default_run, [name])
+
+def test_cached_run_matches_baseline(default_run):
+    # The second run reads the frame cache and snapshot the first one wrote,
+    # which are only written when pyarrow is installed
+    cache_dir = os.path.join(default_run, '.pie_cache')
+    if importlib.util.find_spec('pyarrow') is not None:
+        assert os.path.isdir(cache_dir)
+    rerun = os.path.join(default_run, 'rerun')
+    os.makedirs(rerun)
+    shutil.copytree(os.path.join(default_run, 'public'), os.path.join(rerun, 'public'))
+    if os.path.isdir(cache_dir):
+        shutil.copytree(cache_dir, os.path.join(rerun, '.pie_cache'))
+    run_all(rerun)
+    assert_matches_baseline(rerun, PIE_OUTPUTS + ANALYSIS_OUTPUTS + Q1_ANALYSIS_OUTPUTS)
+
+def test_no_cache_matches_baseline(tmp_path):
+    prepare_extract(tmp_path)
+    run_all(tmp_path, analysis_args=['--no-cache'], pie_args=['--no-cache'])
+    assert_matches_baseline(tmp_path, PIE_OUTPUTS + ANALYSIS_OUTPUTS + Q1_ANALYSIS_OUTPUTS)
+    assert not os.path.exists(os.path.join(tmp_path, '.pie_cache'))
+
+def test_workers_match_baseline(tmp_path):
+    prepare_extract(tmp_path)
+    run_all(tmp_path, analysis_args=['--workers', '3'], pie_args=['--workers', '3'])
+    assert_matches_baseline(tmp_path, PIE_OUTPUTS + ANALYSIS_OUTPUTS + Q1_ANALYSIS_OUTPUTS)
+
+def test_chunked_matches_baseline(tmp_path):
+    prepare_extract(tmp_path)
+    run_script(tmp_path, 'data_analysis.py', '--chunked', '--chunk-rows', '300')
+    run_script(tmp_path, 'data_analysis.py', '--q1-2023', '--chunked', '--chunk-rows', '300')
+    assert_matches_baseline(tmp_path, ANALYSIS_OUTPUTS + Q1_ANALYSIS_OUTPUTS)
+
+def test_incremental_matches_baseline(tmp_path):
+    # State built from the first rows, then brought up to date with the rest
+    prepare_extract(tmp_path, rows=700)
+    run_all(tmp_path, analysis_args=['--incremental'], pie_args=['--incremental'])
+    append_extract(tmp_path, 700)
+    run_all(tmp_path, analysis_args=['--incremental'], pie_args=['--incremental'])
+    assert_matches_baseline(tmp_path, PIE_OUTPUTS + ANALYSIS_OUTPUTS + Q1_ANALYSIS_OUTPUTS)
+
+def test_incremental_pie_merges_appended_rows(tmp_path):
+    # Rows appended to the period are merged into its saved aggregates; its rows are not read again
+    prepare_extract(tmp_path, rows=700)
+    run_script(tmp_path, 'generate_pie_insights.py', '--incremental')
+    append_extract(tmp_path, 700)
+    printed = run_script(tmp_path, 'generate_pie_insights.py', '--incremental')
+    assert 'records (from the saved aggregates)' in printed
+    assert_matches_baseline(tmp_path, PIE_OUTPUTS)
+
+def test_batch_matches_single_periods(tmp_path):
+    # Periods cut from the shared cube, date index and collection sort match periods generated alone
+    prepare_extract(tmp_path)
+    run_script(tmp_path, 'generate_pie_insights.py', '--batch', 'quarter')
+    assert_matches_baseline(tmp_path, PIE_OUTPUTS)
+    run_script(tmp_path, 'generate_pie_insights.py', '--batch', 'month')
+    single = tmp_path / 'single'
+    prepare_extract(single)
+    for month in ['2022-11', '2023-02']:
+        run_script(single, 'generate_pie_insights.py', '--period', month)
+        name = f"pie_insights_{month.replace('-', '_')}.json"
+        assert read_output(tmp_path / name) == read_output(single / name), f"{name} differs from the single-period run"
+
+def test_incremental_rebuilds_rewritten_rows(tmp_path):
+    # Rows already applied are rewritten under the same Service Report id before more are appended
+    incremental, full = tmp_path / 'incremental', tmp_path / 'full'
+    prepare_extract(incremental, rows=700)
+    run_all(incremental, analysis_args=['--incremental'], pie_args=['--incremental'])
+    edit_extract(incremental, range(300, 320), {'Sum of Gallons Collected': '9999', 'Status': 'Cancelled'})
+    append_extract(incremental, 700)
+    run_all(incremental, analysis_args=['--incremental'], pie_args=['--incremental'])
+
+    prepare_extract(full)
+    edit_extract(full, range(300, 320), {'Sum of Gallons Collected': '9999', 'Status': 'Cancelled'})
+    run_all(full, analysis_args=['--no-cache'], pie_args=['--no-cache'])
+    for name in PIE_OUTPUTS + ANALYSIS_OUTPUTS + Q1_ANALYSIS_OUTPUTS:
+        assert read_output(incremental / name) == read_output(full / name), f"{name} differs from the full run"
+
+def test_incremental_quarantine_covers_every_row(tmp_path):
+    # Rows failing a rule both before and after the append are quarantined and summarized as in a full run
+    incremental, full = tmp_path / 'incremental', tmp_path / 'full'
+    prepare_extract(full)
+    edit_extract(full, [*range(100, 105), *range(800, 803)], {'Sum of Gallons Collected': '0'})
+    with open(full / 'public' / CSV_NAME, encoding='utf-8') as f:
+        lines = f.readlines()
+    os.makedirs(incremental / 'public')
+    with open(incremental / 'public' / CSV_NAME, 'w', encoding='utf-8') as f:
+        f.writelines(lines[:701])
+    run_script(incremental, 'data_analysis.py', '--incremental', '--quarantine', 'quarantine.csv')
+    with open(incremental / 'public' / CSV_NAME, 'a', encoding='utf-8') as f:
+        f.writelines(lines[701:])
+    printed = run_script(incremental, 'data_analysis.py', '--incremental', '--quarantine', 'quarantine.csv')
+    expected = run_script(full, 'data_analysis.py', '--no-cache', '--quarantine', 'quarantine.csv')
+
+    summary = '[WARNING] 8 of 1,000 rows fail data-quality rules (kept):'
+    assert summary in printed and summary in expected
+    assert read_output(incremental / 'quarantine.csv') == read_output(full / 'quarantine.csv')
+    assert read_output(incremental / 'data_insights.json') == read_output(full / 'data_insights.json')
@@ -0,0 +1,160 @@
+"""
+Queries of query_service.py, answered in process through its WSGI application
+The service is loaded with the fixture extract's Q1 2023 rows. Filters, sorts,
+bounds and limits must select what the same filters on the entity and
+collection frames select, and an unknown parameter, a bad date, number or limit
+must be answered with a 400 and its error instead of failing the request.
+"""
+
+import json
+import os
+import sys
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from generate_pie_insights import DEFAULT_PERIOD, RISK_LEVELS, analysis_period  # noqa: E402
+from query_service import DEFAULT_LIMIT, MAX_LIMIT, load_query_state, query_app  # noqa: E402
+
+FIXTURES_DIR = os.path.join(REPO_DIR, 'tests', 'fixtures')
+
+@pytest.fixture(scope='module')
+def state():
+    # The extract is read from public/ under the working directory
+    cwd = os.getcwd()
+    os.chdir(FIXTURES_DIR)
+    try:
+        return load_query_state(analysis_period(DEFAULT_PERIOD), use_cache=False)
+    finally:
+        os.chdir(cwd)
+
+@pytest.fixture(scope='module')
+def get(state):
+    app = query_app(state)
+
+    def get(path, params=()):
+        """Status code and JSON document of a GET request"""
+        environ = {'PATH_INFO': path, 'QUERY_STRING': urlencode(params, doseq=True)}
+        setup_testing_defaults(environ)
+        response = {}
+
+        def start_response(status, headers):
+            response['status'], response['headers'] = status, dict(headers)
+        body = b''.join(app(environ, start_response))
+        assert response['headers']['Content-Type'] == 'application/json'
+        assert int(response['headers']['Content-Length']) == len(body)
+        return int(response['status'].split()[0]), json.loads(body)
+    return get
+
+def test_describe_service(state, get):
+    status, document = get('/')
+    assert status == 200
+    assert document['period'] == 'Q1 2023'
+    assert (document['collections'], document['entities']) == (len(state['df']), len(state['entities']))
+    assert set(document['queries']) == {'/entities', '/entities/summary', '/collections/summary'}
+
+def test_entities_default_top_overdue(state, get):
+    status, document = get('/entities')
+    entities = state['entities']
+    assert status == 200
+    assert document['matched'] == len(entities)
+    assert len(document['entities']) == min(DEFAULT_LIMIT, len(entities))
+    expected = entities.sort_values('days_overdue', ascending=False, kind='stable').head(DEFAULT_LIMIT)
+    assert [entity['entity_id'] for entity in document['entities']] == list(expected['entity_id'])
+
+def test_entities_filtered_bounded_and_sorted(state, get):
+    entities = state['entities']
+    zone = entities['zone'].iloc[0]
+    status, document = get('/entities', {'zone': zone.upper(), 'min_collections_count': 3, 'sort': 'avg_gallons',
+                                         'order': 'asc', 'limit': 5})
+    expected = entities[(entities['zone'] == zone) & (entities['collections_count'] >= 3)]
+    assert status == 200
+    assert document['matched'] == len(expected)
+    assert [entity['entity_id'] for entity in document['entities']] == \
+        list(expected.sort_values('avg_gallons', kind='stable')['entity_id'].head(5))
+    assert all(entity['risk_level'] in RISK_LEVELS for entity in document['entities'])
+
+def test_entities_repeated_filter_matches_any_value(state, get):
+    entities = state['entities']
+    status, document = get('/entities', {'risk_level': ['critical', 'warning'], 'limit': MAX_LIMIT})
+    assert status == 200
+    assert document['matched'] == entities['risk_level'].isin(['critical', 'warning']).sum()
+    assert {entity['risk_level'] for entity in document['entities']} <= {'critical', 'warning'}
+
+def test_entities_provider_filter_uses_collections(state, get):
+    df = state['df']
+    provider = df['Service Provider'].value_counts().index[0]
+    status, document = get('/entities', {'provider': provider, 'limit': MAX_LIMIT})
+    served = set(df.loc[df['Service Provider'] == provider, 'New E ID'])
+    assert status == 200
+    assert {entity['entity_id'] for entity in document['entities']} == served & set(state['entities']['entity_id'])
+
+def test_entity_summary_by_area(state, get):
+    entities = state['entities']
+    status, document = get('/entities/summary', {'group_by': 'area', 'limit': MAX_LIMIT})
+    assert status == 200
+    assert document['matched'] == len(entities)
+    assert sum(document['totals'][level] for level in RISK_LEVELS) == len(entities)
+    groups = {group['area']: group for group in document['groups']}
+    assert set(groups) == set(entities['area'])
+    for area, group in groups.items():
+        rows = entities[entities['area'] == area]
+        assert group['total'] == len(rows)
+        assert group['overdue_rate'] == round((rows['risk_level'] != 'normal').mean() * 100, 1)
+    rates = [group['overdue_rate'] for group in document['groups']]
+    assert rates == sorted(rates, reverse=True)
+
+def test_collection_summary_by_zone_in_date_range(state, get):
+    df = state['df']
+    status, document = get('/collections/summary', {'group_by': 'zone', 'start': '2023-02-01', 'end': '2023-02-28',
+                                                    'limit': MAX_LIMIT})
+    selected = df[(df['Collected Date'] >= '2023-02-01') & (df['Collected Date'] < '2023-03-01')]
+    assert status == 200
+    assert document['matched'] == len(selected)
+    assert document['totals']['collections'] == len(selected)
+    assert document['totals']['gallons'] == selected['Sum of Gallons Collected'].sum()
+    assert document['totals']['entities'] == selected['New E ID'].nunique()
+    groups = {group['zone']: group for group in document['groups']}
+    expected = selected.groupby('Zone', observed=True)['Sum of Gallons Collected'].agg(['size', 'sum'])
+    assert {zone: (group['collections'], group['gallons']) for zone, group in groups.items()} == \
+        {zone: (row['size'], row['sum']) for zone, row in expected.iterrows()}
+    counts = [group['collections'] for group in document['groups']]
+    assert counts == sorted(counts, reverse=True)
+
+def test_collection_summary_without_matches(get):
+    status, document = get('/collections/summary', {'area': 'No Such Area'})
+    assert status == 200
+    assert (document['matched'], document['totals'], document['groups']) == (0, None, [])
+
+@pytest.mark.parametrize('path, params, error', [
+    ('/collections/summary', {'start': '2023-13-45'}, 'month must be in 1..12'),
+    ('/collections/summary', {'end': 'yesterday'}, None),
+    ('/entities', {'min_days_overdue': 'abc'}, 'could not convert'),
+    ('/entities', {'max_avg_gallons': '1.5.0'}, 'could not convert'),
+    ('/entities', {'limit': 'ten'}, 'invalid literal'),
+    ('/entities', {'limit': 0}, f"limit must be between 1 and {MAX_LIMIT}"),
+    ('/entities/summary', {'limit': MAX_LIMIT + 1}, f"limit must be between 1 and {MAX_LIMIT}"),
+    ('/entities', {'limit': [1, 2]}, 'limit may only be given once'),
+    ('/entities', {'sort': 'gallons'}, 'sort must be one of'),
+    ('/entities/summary', {'group_by': 'entity'}, 'group_by must be one of'),
+    ('/collections/summary', {'colour': 'red'}, "Unknown parameter 'colour'"),
+])
+def test_bad_parameters_answered_with_400(get, path, params, error):
+    status, document = get(path, params)
+    assert status == 400
+    assert error is None or error in document['error']
+
+def test_unknown_path_answered_with_404(get):
+    status, document = get('/vehicles')
+    assert status == 404
+    assert '/entities' in document['paths']
+
+def test_limits_accepted_at_bounds(state, get):
+    for limit in (1, MAX_LIMIT):
+        status, document = get('/entities', {'limit': limit})
+        assert status == 200
+        assert len(document['entities']) == min(limit, len(state['entities']))
@@ -0,0 +1,139 @@
+"""
+Ingestion schema and windowed loads of service_data.py
+Strict mode must reject rows whose dates or integer counts do not match the
+schema, whichever way the extract is read, while the default mode keeps them:
+dates in another layout are parsed per value (format='mixed') and values that
+cannot be parsed at all become NaT/NA. Windowed loads scan the extract in
+chunks, never reading it whole, and warm the cleaned frame cache chunk by chunk.
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import service_data  # noqa: E402
+from frame_cache import cache_paths, cached_frame_current, load_cached_frame  # noqa: E402
+from service_data import (  # noqa: E402
+    CLEANING_VERSION, SchemaError, categorize_dimensions, clean_service_data, load_service_data, parse_dates,
+    read_service_csv, scan_service_csv
+)
+
+HEADER = ['Collected Date', 'Discharged Date', 'Initiated Date', 'Category', 'Area',
+          'Sum of Gallons Collected', 'Sum of No of Traps', 'Trade License Number']
+
+def write_extract(path, rows):
+    pd.DataFrame(rows, columns=HEADER).to_csv(path, index=False)
+    return str(path)
+
+def valid_row(day, **values):
+    row = {'Collected Date': f"01/{day:02d}/2023", 'Discharged Date': f"01/{day:02d}/2023",
+           'Initiated Date': '01/01/2023', 'Category': 'Restaurant', 'Area': 'Area 1',
+           'Sum of Gallons Collected': '100', 'Sum of No of Traps': '2', 'Trade License Number': '1000'}
+    row.update(values)
+    return [row[column] for column in HEADER]
+
+@pytest.fixture
+def malformed_extract(tmp_path):
+    return write_extract(tmp_path / 'extract.csv', [
+        valid_row(2),
+        valid_row(3, **{'Collected Date': '2023-01-03'}),          # another layout, parsed per value
+        valid_row(4, **{'Discharged Date': 'not a date'}),         # no layout at all
+        valid_row(5, **{'Sum of Gallons Collected': 'twelve'}),    # not a number
+        valid_row(6, **{'Sum of No of Traps': '2.5'}),             # not an integer
+        valid_row(7)
+    ])
+
+def failed_cells(error):
+    return sorted(error.failures[['row', 'column', 'rule']].itertuples(index=False, name=None))
+
+EXPECTED_FAILURES = [
+    (1, 'Collected Date', 'date_format'),
+    (2, 'Discharged Date', 'date_format'),
+    (3, 'Sum of Gallons Collected', 'integer'),
+    (4, 'Sum of No of Traps', 'integer')
+]
+
+def test_strict_cleaning_raises_schema_error(malformed_extract):
+    with pytest.raises(SchemaError) as raised:
+        clean_service_data(read_service_csv(malformed_extract), strict=True)
+    assert failed_cells(raised.value) == EXPECTED_FAILURES
+    assert str(raised.value).startswith('4 rows fail the ingestion schema')
+
+@pytest.mark.parametrize('window', [{}, {'start': '2023-01-01', 'end': '2023-01-31'}])
+def test_strict_loads_raise_schema_error(malformed_extract, window):
+    with pytest.raises(SchemaError) as raised:
+        load_service_data(malformed_extract, use_cache=False, strict=True, **window)
+    assert failed_cells(raised.value) == EXPECTED_FAILURES
+
+def test_strict_mode_accepts_a_clean_extract(tmp_path):
+    path = write_extract(tmp_path / 'extract.csv', [valid_row(day) for day in range(1, 6)])
+    df = load_service_data(path, use_cache=False, strict=True)
+    assert len(df) == 5
+    assert str(df['Sum of Gallons Collected'].dtype) == 'Int32'
+
+def test_lenient_mode_keeps_failing_rows(malformed_extract):
+    df = load_service_data(malformed_extract, use_cache=False)
+    assert len(df) == 6
+    assert df.loc[1, 'Collected Date'] == pd.Timestamp('2023-01-03')
+    assert pd.isna(df.loc[2, 'Discharged Date'])
+    assert pd.isna(df.loc[3, 'Sum of Gallons Collected'])
+    # A fractional count keeps the column as float64 rather than truncating it
+    assert df.loc[4, 'Sum of No of Traps'] == 2.5
+
+def test_mixed_format_fallback_only_for_mismatched_values():
+    values = pd.Series(['01/02/2023', '2023-01-03', 'Jan 4 2023', 'garbage', None])
+    parsed, mismatched = parse_dates(values)
+    assert list(parsed[:3]) == [pd.Timestamp(f"2023-01-0{day}") for day in (2, 3, 4)]
+    assert parsed[3:].isna().all()
+    assert list(mismatched) == [False, True, True, True, False]
+
+WINDOW = {'start': '2023-01-10', 'end': '2023-01-19'}
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """tmp_path as working directory, so the frame cache is written under it"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def month_extract(workdir):
+    return write_extract(workdir / 'extract.csv', [valid_row(day, Area=f"Area {day % 3}") for day in range(1, 29)])
+
+def test_windowed_loads_do_not_read_the_whole_extract(month_extract, monkeypatch):
+    def read_whole_extract(*args, **kwargs):
+        raise AssertionError('windowed loads must scan the extract in chunks')
+    monkeypatch.setattr(service_data, 'read_service_csv', read_whole_extract)
+
+    strict = load_service_data(month_extract, strict=True, **WINDOW)
+    assert list(strict['Collected Date'].dt.day) == list(range(10, 20))
+
+    cold = load_service_data(month_extract, **WINDOW)
+    assert cached_frame_current(month_extract, 'clean', CLEANING_VERSION)
+    warm = load_service_data(month_extract, **WINDOW)
+    pd.testing.assert_frame_equal(warm, cold)
+    assert isinstance(warm['Area'].dtype, pd.CategoricalDtype)
+
+def test_chunked_cache_holds_the_cleaned_extract(month_extract):
+    scan_service_csv(month_extract, chunk_rows=5, warm_cache=True, **WINDOW)
+
+    data_path, _ = cache_paths(month_extract, 'clean')
+    assert pq.ParquetFile(data_path).metadata.num_row_groups == 6
+    cached = categorize_dimensions(load_cached_frame(month_extract, 'clean', CLEANING_VERSION))
+    pd.testing.assert_frame_equal(cached, clean_service_data(read_service_csv(month_extract)))
+
+def test_chunk_with_another_schema_stops_caching(workdir, capsys):
+    rows = [valid_row(day) for day in range(1, 11)]
+    rows[7][HEADER.index('Sum of Gallons Collected')] = '12.5'  # the second chunk's gallons stay float64
+    path = write_extract(workdir / 'extract.csv', rows)
+
+    df = scan_service_csv(path, chunk_rows=5, warm_cache=True)
+    assert len(df) == 10
+    assert 'Frame cache skipped' in capsys.readouterr().out
+    assert not cached_frame_current(path, 'clean', CLEANING_VERSION)
+    assert os.listdir('.pie_cache') == []
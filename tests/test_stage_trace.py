@@ -0,0 +1,117 @@
+"""
+Trace files of stage_trace.py
+Every stage recorded while a trace is active, in the parent or in a section
+worker, must be written as one JSON object per line of the --trace file and as
+a complete ('X') event of the --chrome-trace file, with its parent stage, the
+rows it read and its durations. Outside a trace nothing is recorded.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import stage_trace  # noqa: E402
+from section_runner import fork_available, run_sections  # noqa: E402
+from stage_trace import call_traced, finish_trace, start_trace, traced_stage  # noqa: E402
+
+FIXTURES_DIR = os.path.join(REPO_DIR, 'tests', 'fixtures')
+CSV_NAME = 'Blue Data Analysis.csv'
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def read_chrome(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def assert_valid_events(events, chrome):
+    """Each JSON lines event has its durations, and a matching Chrome trace event"""
+    assert [event['start_s'] for event in events] == sorted(event['start_s'] for event in events)
+    for event in events:
+        assert {'stage', 'parent', 'pid', 'rows', 'start_s', 'wall_s', 'cpu_s', 'peak_rss_mb'} <= event.keys()
+        assert event['start_s'] >= 0 and event['wall_s'] >= 0 and event['cpu_s'] >= 0
+    assert chrome['displayTimeUnit'] == 'ms'
+    assert len(chrome['traceEvents']) == len(events)
+    for event, trace_event in zip(events, chrome['traceEvents']):
+        assert trace_event['name'] == event['stage']
+        assert trace_event['ph'] == 'X' and trace_event['cat'] == 'stage'
+        assert trace_event['ts'] == round(event['start_s'] * 1e6)
+        assert trace_event['dur'] == round(event['wall_s'] * 1e6)
+        assert trace_event['pid'] == trace_event['tid'] == event['pid']
+        assert trace_event['args'].get('rows') == event['rows']
+        assert trace_event['args'].get('parent') == event['parent']
+
+@pytest.fixture
+def trace_paths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path / 'trace.jsonl', tmp_path / 'trace.json'
+    stage_trace._events = None
+
+def test_stages_written_as_jsonl_and_chrome_events(trace_paths):
+    jsonl_path, chrome_path = trace_paths
+    start_trace(str(jsonl_path), str(chrome_path))
+    with traced_stage('load') as event:
+        with traced_stage('parse', rows=3):
+            pass
+        event['rows'] = 10
+    call_traced('summary', len, [pd.DataFrame({'a': range(5)})])
+    finish_trace()
+
+    events = read_jsonl(jsonl_path)
+    assert_valid_events(events, read_chrome(chrome_path))
+    stages = {event['stage']: event for event in events}
+    assert [event['stage'] for event in events] == ['load', 'parse', 'summary']
+    assert (stages['load']['rows'], stages['load']['parent']) == (10, None)
+    assert (stages['parse']['rows'], stages['parse']['parent']) == (3, 'load')
+    assert (stages['summary']['rows'], stages['summary']['parent']) == (5, None)
+    assert stages['load']['wall_s'] >= stages['parse']['wall_s']
+
+def test_nothing_recorded_outside_a_trace(trace_paths):
+    start_trace()
+    with traced_stage('load') as event:
+        event['rows'] = 10
+    finish_trace()
+    assert event == {'rows': 10}
+    assert not os.listdir(trace_paths[0].parent)
+
+@pytest.mark.skipif(not fork_available(), reason="section workers need fork")
+def test_worker_sections_recorded(trace_paths):
+    jsonl_path, chrome_path = trace_paths
+    df = pd.DataFrame({'a': range(7)})
+    sections = {'first': (len, ['df'], None), 'second': (len, ['df'], None)}
+    start_trace(str(jsonl_path), str(chrome_path))
+    with traced_stage('sections'):
+        results = run_sections(sections, {'df': df}, workers=2)
+    finish_trace()
+
+    assert (results['first'], results['second']) == (7, 7)
+    events = read_jsonl(jsonl_path)
+    assert_valid_events(events, read_chrome(chrome_path))
+    workers = [event for event in events if event['stage'] in sections]
+    assert sorted(event['stage'] for event in workers) == ['first', 'second']
+    assert all(event['rows'] == 7 and event['pid'] != os.getpid() for event in workers)
+
+def test_pie_script_trace(tmp_path):
+    os.makedirs(tmp_path / 'public')
+    shutil.copy(os.path.join(FIXTURES_DIR, 'public', CSV_NAME), tmp_path / 'public' / CSV_NAME)
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, 'generate_pie_insights.py'), '--no-cache',
+                             '--trace', 'trace.jsonl', '--chrome-trace', 'trace.json'],
+                            cwd=tmp_path, capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    events = read_jsonl(tmp_path / 'trace.jsonl')
+    assert_valid_events(events, read_chrome(tmp_path / 'trace.json'))
+    stages = {event['stage']: event for event in events}
+    assert {'generate_pie_insights', 'load', 'cube', 'patterns', 'compile', 'serialize'} <= stages.keys()
+    assert stages['load']['parent'] == 'generate_pie_insights'
+    assert stages['load']['rows'] == stages['cube']['rows'] > 0
+    assert stages['generate_pie_insights']['wall_s'] >= stages['load']['wall_s']
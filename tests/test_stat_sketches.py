@@ -0,0 +1,147 @@
+"""
+Error bounds and merging of the sketches in stat_sketches.py
+At the precision column_profile.py picks for DISTINCT_RELATIVE_ERROR, HyperLogLog
+estimates must stay within three standard errors of the true distinct count.
+Bucketed values must stay within QUANTILE_RELATIVE_ERROR of the raw values, and
+so must quantiles read from their histogram. Pruned frequent-value tables must
+keep the Misra-Gries guarantees. Sketches of two batches merged must equal the
+sketch of both batches together.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from column_profile import (  # noqa: E402
+    DISTINCT_RELATIVE_ERROR, QUANTILE_RELATIVE_ERROR, histogram, histogram_quantile
+)
+from stat_sketches import (  # noqa: E402
+    bucket_values, distinct_hashes, hll_estimate, hll_group_registers, hll_precision, hll_registers,
+    merge_group_registers, prune_frequent
+)
+
+PRECISION = hll_precision(DISTINCT_RELATIVE_ERROR)
+
+def report_ids(start, stop):
+    return pd.Series([f"SR-{number:08d}" for number in range(start, stop)])
+
+def frequent_table(values):
+    """Value/count table of values, as column_profile builds it"""
+    counts = pd.Series(values).value_counts(sort=False)
+    return pd.DataFrame({'value': counts.index.to_numpy(), 'count': counts.to_numpy()})
+
+def test_hll_precision_meets_requested_error():
+    assert 1.04 / np.sqrt(1 << PRECISION) <= DISTINCT_RELATIVE_ERROR
+
+@pytest.mark.parametrize('distinct', [10, 1_000, 20_000, 200_000])
+def test_hll_estimate_within_three_standard_errors(distinct):
+    # Every id is repeated, so only distinct values may count
+    ids = pd.concat([report_ids(0, distinct)] * 3, ignore_index=True)
+    estimate = hll_estimate(hll_registers(ids, PRECISION))[0]
+    assert abs(estimate - distinct) <= 3 * 1.04 / np.sqrt(1 << PRECISION) * distinct
+
+def test_hll_group_estimates_within_three_standard_errors():
+    sizes = {'Area 1': 50, 'Area 2': 5_000, 'Area 3': 30_000}
+    keys = pd.Series([area for area, size in sizes.items() for _ in range(size)])
+    ids = pd.concat([report_ids(0, size) for size in sizes.values()], ignore_index=True)
+    groups, registers = hll_group_registers(keys, ids, PRECISION)
+    for area, estimate in zip(groups, hll_estimate(registers)):
+        assert abs(estimate - sizes[area]) <= 3 * 1.04 / np.sqrt(1 << PRECISION) * sizes[area]
+
+def test_bucket_values_within_relative_error():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.lognormal(4, 2, 50_000), -rng.lognormal(1, 1, 1_000), [0.0, 1.0, 1e9]])
+    bucketed = bucket_values(values, QUANTILE_RELATIVE_ERROR)
+    assert np.all(np.abs(bucketed - values) <= QUANTILE_RELATIVE_ERROR * np.abs(values))
+    assert np.all(np.sign(bucketed) == np.sign(values))
+    # Buckets grow with the logarithm of the value range, not the number of values
+    positive = values[values > 0]
+    gamma = (1 + QUANTILE_RELATIVE_ERROR) / (1 - QUANTILE_RELATIVE_ERROR)
+    assert len(np.unique(bucketed[values > 0])) <= np.log(positive.max() / positive.min()) / np.log(gamma) + 2
+
+def test_bucket_values_keeps_missing_values():
+    bucketed = bucket_values([np.nan, 0, 25], QUANTILE_RELATIVE_ERROR)
+    assert np.isnan(bucketed[0]) and bucketed[1] == 0
+
+@pytest.mark.parametrize('q', [0.0, 0.1, 0.25, 0.5, 0.9, 0.99, 1.0])
+def test_bucketed_histogram_quantile_within_relative_error(q):
+    rng = np.random.default_rng(1)
+    values = np.rint(rng.lognormal(4, 1.5, 20_000))
+    values = values[values > 0]
+    table = frequent_table(bucket_values(values, QUANTILE_RELATIVE_ERROR))
+    exact = pd.Series(values).quantile(q)
+    approximate = histogram_quantile(*histogram(table), q)
+    assert abs(approximate - exact) <= QUANTILE_RELATIVE_ERROR * exact
+
+@pytest.mark.parametrize('capacity', [5, 20, 100])
+def test_prune_frequent_guarantees(capacity):
+    rng = np.random.default_rng(2)
+    values = np.concatenate([rng.zipf(1.5, 20_000) % 5_000, np.full(3_000, 7_777)])
+    rng.shuffle(values)
+    exact = frequent_table(values).set_index('value')['count']
+    pruned = prune_frequent(frequent_table(values), capacity).set_index('value')['count']
+    bound = len(values) / (capacity + 1)
+
+    assert len(pruned) <= capacity
+    # Counts are underestimates by at most n / (capacity + 1)
+    assert (pruned <= exact[pruned.index]).all()
+    assert (exact[pruned.index] - pruned <= bound).all()
+    # Every value more frequent than that is kept
+    assert set(exact[exact > bound].index) <= set(pruned.index)
+    assert 7_777 in pruned.index
+
+def test_prune_frequent_keeps_small_tables():
+    table = frequent_table([1, 1, 2, 3])
+    assert prune_frequent(table, 3) is table
+
+def test_merged_pruned_tables_keep_guarantees():
+    # Batches pruned, merged and pruned again, as merge_column_profiles does
+    rng = np.random.default_rng(3)
+    batches = [rng.zipf(1.3, 10_000) % 2_000 for _ in range(4)]
+    capacity = 50
+    merged = pd.concat([prune_frequent(frequent_table(batch), capacity) for batch in batches], ignore_index=True)
+    merged = prune_frequent(merged.groupby('value', sort=False)['count'].sum().reset_index(), capacity)
+    values = np.concatenate(batches)
+    exact = frequent_table(values).set_index('value')['count']
+    pruned = merged.set_index('value')['count']
+    bound = len(values) / (capacity + 1)
+
+    assert (exact[pruned.index] - pruned).between(0, bound).all()
+    assert set(exact[exact > bound].index) <= set(pruned.index)
+
+def test_merged_hll_registers_equal_sketch_of_union():
+    first, second = report_ids(0, 30_000), report_ids(20_000, 60_000)
+    merged = np.maximum(hll_registers(first, PRECISION), hll_registers(second, PRECISION))
+    union = hll_registers(pd.concat([first, second], ignore_index=True), PRECISION)
+    np.testing.assert_array_equal(merged, union)
+
+def test_merged_group_registers_equal_sketch_of_union():
+    keys = pd.Series(['Area 1', 'Area 2', None, 'Area 3'] * 2_500)
+    ids = report_ids(0, len(keys))
+    ids[::7] = None
+    first = hll_group_registers(keys[:4_000], ids[:4_000], PRECISION)
+    second = hll_group_registers(keys[4_000:], ids[4_000:], PRECISION)
+    merged_keys, merged = merge_group_registers(first, second)
+    union_keys, union = hll_group_registers(keys, ids, PRECISION)
+    assert sorted(merged_keys) == sorted(union_keys)
+    np.testing.assert_array_equal(merged[merged_keys.get_indexer(union_keys)], union)
+
+def test_merged_distinct_hashes_equal_sketch_of_union():
+    first, second = report_ids(0, 1_000), pd.Series([f"SR-{number:08d}" for number in range(500, 1_500)] + [None])
+    merged = np.union1d(distinct_hashes(first), distinct_hashes(second))
+    np.testing.assert_array_equal(merged, distinct_hashes(pd.concat([first, second], ignore_index=True)))
+
+def test_merged_bucket_histograms_equal_sketch_of_union():
+    rng = np.random.default_rng(4)
+    first, second = rng.lognormal(3, 1, 5_000), rng.lognormal(5, 1, 5_000)
+    tables = [frequent_table(bucket_values(batch, QUANTILE_RELATIVE_ERROR)) for batch in (first, second)]
+    merged = histogram(pd.concat(tables, ignore_index=True))
+    union = histogram(frequent_table(bucket_values(np.concatenate([first, second]), QUANTILE_RELATIVE_ERROR)))
+    np.testing.assert_array_equal(merged[0], union[0])
+    np.testing.assert_array_equal(merged[1], union[1])